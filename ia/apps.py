@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class IaConfig(AppConfig):
     name = 'ia'
+
+    def ready(self):
+        from . import signals  # noqa: F401
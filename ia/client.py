@@ -0,0 +1,202 @@
+"""Client HTTP partagé pour les appels à l'API Mistral.
+
+Une seule session `requests` par processus : les connexions TLS sont gardées
+ouvertes (keep-alive) et réutilisées d'un appel à l'autre, y compris entre
+les threads de l'OCR parallèle. Les réponses 429 et 5xx (ainsi que les
+erreurs de connexion) sont retentées avec un backoff exponentiel à jitter,
+en respectant l'en-tête Retry-After, sauf pour les appels qui ont un modèle
+de repli (ia.routing). Chaque tentative passe par le limiteur de débit et le
+disjoncteur partagés (ia.limiter).
+"""
+
+import base64
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import limiter
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+class Base64JSONBody:
+    """Corps JSON embarquant un fichier en base64, encodé au fil de l'envoi.
+
+    `template` est le JSON de la requête où PLACEHOLDER marque l'emplacement
+    du fichier encodé. Le fichier est lu par blocs : la mémoire utilisée reste
+    bornée quelle que soit sa taille. La longueur totale est connue d'avance
+    (Content-Length) et le corps se rembobine pour une nouvelle tentative.
+    """
+
+    PLACEHOLDER = "__BASE64__"
+    # Multiple de 3 : aucun padding base64 au milieu du flux.
+    BLOCK_SIZE = 3 * 64 * 1024
+
+    def __init__(self, template: str, path):
+        prefix, suffix = template.split(self.PLACEHOLDER)
+        self._prefix = prefix.encode()
+        self._suffix = suffix.encode()
+        self._path = path
+        file_size = os.path.getsize(path)
+        self._length = len(self._prefix) + 4 * -(-file_size // 3) + len(self._suffix)
+        self.seek(0)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _parts(self):
+        yield self._prefix
+        with open(self._path, "rb") as f:
+            while block := f.read(self.BLOCK_SIZE):
+                yield base64.b64encode(block)
+        yield self._suffix
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            part = next(self._iterator, None)
+            if part is None:
+                break
+            self._buffer += part
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(data)
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if offset != 0 or whence != os.SEEK_SET:
+            raise OSError("Base64JSONBody ne peut être rembobiné qu'au début.")
+        self._iterator = self._parts()
+        self._buffer = b""
+        self._position = 0
+        return 0
+
+
+def _build_session() -> requests.Session:
+    # Pas de nouvelles tentatives dans urllib3 : post() les fait lui-même,
+    # chacune avec son jeton du limiteur.
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.IA_HTTP_POOL_SIZE,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {settings.MISTRAL_API_KEY}",
+        "Content-Type": "application/json",
+    })
+    return session
+
+
+def get_session() -> requests.Session:
+    """Retourne la session partagée du processus (créée au premier appel)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session() -> None:
+    """Ferme la session partagée (elle sera recréée au prochain appel)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Erreur passagère (saturation, panne, lenteur), pas une requête invalide."""
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRY_STATUSES
+    return False
+
+
+def _retry_after(response: requests.Response | None) -> float | None:
+    """Délai demandé par l'en-tête Retry-After (secondes ou date HTTP)."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _retry_delay(attempt: int, response: requests.Response | None) -> float:
+    """Attente avant la tentative n° `attempt` + 1 : Retry-After, sinon backoff à jitter."""
+    delay = _retry_after(response)
+    if delay is None:
+        backoff = settings.IA_HTTP_BACKOFF
+        delay = backoff * 2 ** (attempt - 1) + random.uniform(0, backoff)
+    return min(delay, settings.IA_HTTP_RETRY_AFTER_MAX)
+
+
+def post(endpoint: str, url: str, retries: bool = True, **kwargs) -> requests.Response:
+    """POST via la session partagée, avec le timeout configuré pour `endpoint`.
+
+    `endpoint` est une clé de IA_HTTP_TIMEOUTS (« ocr », « chat »…). Lève
+    limiter.CircuitOpen / limiter.RateLimited sans appeler l'API quand
+    l'endpoint est coupé ou saturé. Les réponses 429 / 5xx et les erreurs
+    réseau sont retentées jusqu'à IA_HTTP_RETRIES fois (aucune avec
+    `retries=False`) ; chaque tentative prend son jeton du limiteur, et faute
+    de jeton la dernière réponse (ou erreur) est rendue telle quelle. Un appel
+    qui échoue après ses tentatives compte comme un échec.
+    """
+    kwargs.setdefault("timeout", settings.IA_HTTP_TIMEOUTS[endpoint])
+    max_retries = settings.IA_HTTP_RETRIES if retries else 0
+    limiter.acquire(endpoint)
+    attempt = 0
+    while True:
+        response, error = None, None
+        try:
+            response = get_session().post(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            error = exc
+        except requests.RequestException:
+            limiter.record_failure(endpoint)
+            raise
+        if error is None and response.status_code not in RETRY_STATUSES:
+            limiter.record_success(endpoint)
+            return response
+        attempt += 1
+        if attempt > max_retries or not _wait_for_retry(endpoint, attempt, response):
+            limiter.record_failure(endpoint)
+            if error is not None:
+                raise error
+            return response
+        # Le corps en flux (Base64JSONBody) est relu depuis le début.
+        if hasattr(kwargs.get("data"), "seek"):
+            kwargs["data"].seek(0)
+
+
+def _wait_for_retry(endpoint: str, attempt: int, response: requests.Response | None) -> bool:
+    """Attend avant une nouvelle tentative et prend son jeton ; False faute de jeton."""
+    if response is not None:
+        response.close()
+    time.sleep(_retry_delay(attempt, response))
+    try:
+        limiter.acquire(endpoint)
+    except limiter.ServiceUnavailable:
+        return False
+    return True
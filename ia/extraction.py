@@ -0,0 +1,174 @@
+"""Extraction locale du texte, avant tout recours à l'OCR distant.
+
+Les formats bureautiques (texte, tableur, traitement de texte, présentation)
+sont lus directement ; seuls les PDF (pages scannées) et les images passent
+par l'OCR, allégés au préalable (ia.preprocess).
+"""
+
+import csv
+import logging
+import re
+import zipfile
+from pathlib import Path
+
+from defusedxml import ElementTree
+from openpyxl import load_workbook
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# En dessous, une page est considérée sans couche texte exploitable
+# (page scannée) et part à l'OCR distant.
+MIN_PAGE_TEXT = 30
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+ODF_TEXT_NS = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+
+def is_pdf(file_path: Path) -> bool:
+    return file_path.suffix.lower() == ".pdf"
+
+
+def pdf_page_texts(file_path: Path) -> list[str] | None:
+    """Lit la couche texte d'un PDF, page par page.
+
+    Retourne None si le fichier ne peut pas être lu localement (PDF corrompu,
+    chiffré…) : il est alors confié en entier à l'OCR distant. Le fichier est
+    lu au fil des pages (un chemin ferait tout charger en mémoire à pypdf).
+    """
+    try:
+        with open(file_path, "rb") as f:
+            reader = PdfReader(f)
+            return [(page.extract_text() or "").strip() for page in reader.pages]
+    except Exception:
+        logger.info("Couche texte illisible, OCR complet : %s", file_path.name)
+        return None
+
+
+def weak_pages(page_texts: dict[int, str]) -> list[int]:
+    """Numéros des pages dont le texte local est insuffisant."""
+    return [
+        number for number, text in page_texts.items()
+        if len(text) < MIN_PAGE_TEXT
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Formats bureautiques
+# ---------------------------------------------------------------------------
+
+
+def _read_text(file_path: Path) -> str:
+    """Décode un fichier texte : UTF-8 (avec ou sans BOM), sinon Windows-1252."""
+    raw = file_path.read_bytes()
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def _txt(file_path: Path) -> str:
+    return _read_text(file_path).strip()
+
+
+def _csv(file_path: Path) -> str:
+    """Une ligne par enregistrement ; le séparateur (« ; » des exports Excel FR, « , »…) est détecté."""
+    content = _read_text(file_path)
+    try:
+        dialect = csv.Sniffer().sniff(content[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = csv.reader(content.splitlines(), dialect)
+    return "\n".join(
+        " ; ".join(cell.strip() for cell in row if cell.strip())
+        for row in rows
+        if any(cell.strip() for cell in row)
+    )
+
+
+def _xlsx(file_path: Path) -> str:
+    """Lit le classeur en flux (read_only) : une section par feuille, une ligne par rangée."""
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        parts = []
+        for sheet in workbook.worksheets:
+            lines = [
+                " ; ".join(str(value) for value in row if value not in (None, ""))
+                for row in sheet.iter_rows(values_only=True)
+            ]
+            lines = [line for line in lines if line]
+            if lines:
+                parts.append(f"## {sheet.title}\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+    finally:
+        workbook.close()
+
+
+def _xml_paragraphs(xml: bytes, paragraph_tags: tuple[str, ...], text_tag: str | None) -> list[str]:
+    """Texte de chaque paragraphe d'un document XML (parseur sécurisé defusedxml)."""
+    root = ElementTree.fromstring(xml)
+    paragraphs = []
+    for element in root.iter():
+        if element.tag not in paragraph_tags:
+            continue
+        if text_tag is None:
+            text = "".join(element.itertext())
+        else:
+            text = "".join(node.text or "" for node in element.iter(text_tag))
+        if text.strip():
+            paragraphs.append(text.strip())
+    return paragraphs
+
+
+def _docx(file_path: Path) -> str:
+    with zipfile.ZipFile(file_path) as archive:
+        xml = archive.read("word/document.xml")
+    return "\n".join(_xml_paragraphs(xml, (f"{WORD_NS}p",), f"{WORD_NS}t"))
+
+
+def _odt(file_path: Path) -> str:
+    with zipfile.ZipFile(file_path) as archive:
+        xml = archive.read("content.xml")
+    return "\n".join(_xml_paragraphs(xml, (f"{ODF_TEXT_NS}p", f"{ODF_TEXT_NS}h"), None))
+
+
+def _pptx(file_path: Path) -> str:
+    """Une section par diapositive, dans l'ordre de la présentation."""
+    with zipfile.ZipFile(file_path) as archive:
+        slides = sorted(
+            (name for name in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)),
+            key=lambda name: int(re.search(r"\d+", name.rsplit("/", 1)[1]).group()),
+        )
+        parts = []
+        for number, name in enumerate(slides, start=1):
+            paragraphs = _xml_paragraphs(archive.read(name), (f"{DRAWING_NS}p",), f"{DRAWING_NS}t")
+            if paragraphs:
+                parts.append(f"## Diapositive {number}\n" + "\n".join(paragraphs))
+    return "\n\n".join(parts)
+
+
+EXTRACTORS = {
+    ".txt": _txt,
+    ".csv": _csv,
+    ".xlsx": _xlsx,
+    ".docx": _docx,
+    ".odt": _odt,
+    ".pptx": _pptx,
+}
+
+
+def has_local_extractor(file_path: Path) -> bool:
+    return file_path.suffix.lower() in EXTRACTORS
+
+
+def local_text(file_path: Path) -> str:
+    """Extrait le texte d'un fichier bureautique sans appel réseau.
+
+    Un fichier corrompu donne une chaîne vide (traité comme illisible).
+    """
+    try:
+        return EXTRACTORS[file_path.suffix.lower()](file_path).strip()
+    except Exception:
+        logger.warning("Extraction locale impossible : %s", file_path.name)
+        return ""
@@ -0,0 +1,65 @@
+"""Formulaires des vues IA."""
+
+from django import forms
+from wagtail.models import Collection
+
+from . import utils as ai_utils
+
+DATE_INPUT_FORMATS = ["%Y-%m-%d", "%d/%m/%Y"]
+
+
+class GlobalAnalysisForm(forms.Form):
+    """Question de l'analyse globale et périmètre des documents interrogés.
+
+    Le périmètre (collection avec ses sous-collections, intervalle de
+    document_date, fragment de titre) est appliqué à la requête avant toute
+    extraction : le coût de l'analyse suit le nombre de documents retenus.
+    """
+
+    query = forms.CharField(
+        label="Question",
+        error_messages={"required": "Merci de saisir une question."},
+    )
+    pages = forms.CharField(label="Pages", required=False)
+    collection = forms.ModelChoiceField(
+        label="Collection",
+        queryset=Collection.objects.order_by("path"),
+        required=False,
+        error_messages={"invalid_choice": "Collection introuvable."},
+    )
+    date_from = forms.DateField(label="Du", required=False, input_formats=DATE_INPUT_FORMATS)
+    date_to = forms.DateField(label="Au", required=False, input_formats=DATE_INPUT_FORMATS)
+    title = forms.CharField(label="Titre contenant", required=False, max_length=255)
+
+    def clean_pages(self) -> str:
+        """Plage de pages sous forme canonique (« » = tout le document)."""
+        try:
+            return ai_utils.canonical_pages(self.cleaned_data["pages"])
+        except ai_utils.PageRangeTooLong as exc:
+            raise forms.ValidationError(exc.message)
+        except ValueError:
+            raise forms.ValidationError("Plage de pages invalide (ex. 1-3,5).")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get("date_from"), cleaned_data.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("La date de début doit précéder la date de fin.")
+        return cleaned_data
+
+    @property
+    def error_message(self) -> str:
+        """Premier message d'erreur, affiché tel quel dans le partial."""
+        return next(iter(self.errors.values()))[0]
+
+    @property
+    def scope(self) -> dict:
+        """Périmètre à enregistrer sur le Summary (clés vides omises)."""
+        data = self.cleaned_data
+        scope = {
+            "collection": data["collection"].pk if data["collection"] else None,
+            "date_from": data["date_from"].isoformat() if data["date_from"] else None,
+            "date_to": data["date_to"].isoformat() if data["date_to"] else None,
+            "title": data["title"].strip(),
+        }
+        return {key: value for key, value in scope.items() if value}
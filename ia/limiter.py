@@ -0,0 +1,178 @@
+"""Limiteur de débit et disjoncteur partagés pour les appels à Mistral.
+
+L'état de chaque endpoint (« ocr », « chat », ou « chat:<modèle> » pour le
+disjoncteur propre à un modèle, voir ia.routing) est une ligne EndpointState :
+tous les processus (serveur web, workers de tâches, commandes) puisent dans
+le même seau de jetons et voient le même disjoncteur.
+
+- Seau de jetons : `rate` appels par seconde en moyenne, rafales jusqu'à
+  `burst` (IA_RATE_LIMITS). Un appel attend son jeton au plus
+  IA_RATE_LIMIT_MAX_WAIT secondes, sinon RateLimited.
+- Disjoncteur : après IA_CIRCUIT_FAILURES échecs consécutifs, l'endpoint est
+  coupé IA_CIRCUIT_RESET_AFTER secondes (CircuitOpen, sans appel réseau).
+  Le délai écoulé, un seul appel d'essai passe : un succès referme le
+  circuit, un échec le rouvre.
+
+Exception à la règle « pas de BDD dans les pools » : l'état doit être
+partagé, les threads des pools le lisent donc eux-mêmes, puis ferment leur
+connexion (release_connection). Une base verrouillée (SQLite en
+développement) n'est jamais reprochée à l'appel : la prise de jeton est
+retentée dans le délai d'attente, et un compteur d'échecs perdu est ignoré.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+from .metrics import POOL_THREAD_PREFIX
+from .models import EndpointState
+
+
+class ServiceUnavailable(Exception):
+    """Le service d'IA ne peut pas être appelé pour le moment."""
+
+    message = "Le service d'IA est momentanément indisponible, merci de réessayer dans quelques minutes."
+
+    def __init__(self, endpoint: str = ""):
+        super().__init__(self.message)
+        self.endpoint = endpoint
+
+
+class CircuitOpen(ServiceUnavailable):
+    """Trop d'échecs récents : l'endpoint est coupé."""
+
+
+class RateLimited(ServiceUnavailable):
+    """Aucun jeton disponible dans le délai d'attente autorisé."""
+
+    message = "Le service d'IA est très sollicité, merci de réessayer dans quelques minutes."
+
+
+logger = logging.getLogger(__name__)
+
+# Attente avant de retenter la prise d'un jeton quand la base est verrouillée.
+LOCKED_RETRY_DELAY = 0.05
+
+_bypass = threading.Event()
+
+
+@contextmanager
+def bypassed() -> Iterator[None]:
+    """Désactive limiteur et disjoncteur dans tout le processus (mesures locales)."""
+    _bypass.set()
+    try:
+        yield
+    finally:
+        _bypass.clear()
+
+
+def release_connection() -> None:
+    """Ferme la connexion BDD des threads des pools (elle ne serait jamais rendue)."""
+    in_pool = threading.current_thread().name.startswith(POOL_THREAD_PREFIX)
+    if in_pool and not connection.in_atomic_block:
+        connection.close()
+
+
+def _locked_state(endpoint: str, now: float) -> EndpointState:
+    limit = settings.IA_RATE_LIMITS.get(endpoint) or {}
+    state, _ = EndpointState.objects.select_for_update().get_or_create(
+        endpoint=endpoint,
+        defaults={"tokens": limit.get("burst", 0), "refilled_at": now},
+    )
+    return state
+
+
+def _try_acquire(endpoint: str) -> float:
+    """Prend un jeton ; renvoie 0, ou le temps à attendre avant d'en avoir un."""
+    limit = settings.IA_RATE_LIMITS.get(endpoint)
+    with transaction.atomic():
+        now = time.time()
+        state = _locked_state(endpoint, now)
+        if state.open_until > now:
+            raise CircuitOpen(endpoint)
+        updates = {}
+        if state.failures >= settings.IA_CIRCUIT_FAILURES:
+            # Circuit semi-ouvert : cet appel sert d'essai, les autres
+            # restent refusés jusqu'à son résultat.
+            updates["open_until"] = now + settings.IA_CIRCUIT_RESET_AFTER
+        if limit:
+            tokens = min(
+                limit["burst"],
+                state.tokens + (now - state.refilled_at) * limit["rate"],
+            )
+            if tokens < 1:
+                return (1 - tokens) / limit["rate"]
+            updates.update(tokens=tokens - 1, refilled_at=now)
+        if updates:
+            EndpointState.objects.filter(pk=state.pk).update(**updates)
+        return 0
+
+
+def acquire(endpoint: str) -> None:
+    """Attend un jeton pour `endpoint` ; CircuitOpen / RateLimited sinon."""
+    if _bypass.is_set():
+        return
+    deadline = time.monotonic() + settings.IA_RATE_LIMIT_MAX_WAIT
+    try:
+        while True:
+            try:
+                wait = _try_acquire(endpoint)
+            except OperationalError:
+                # Base verrouillée par une autre prise de jeton : on réessaie.
+                wait = LOCKED_RETRY_DELAY
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(endpoint)
+            time.sleep(wait)
+    finally:
+        release_connection()
+
+
+def record_success(endpoint: str) -> None:
+    """Referme le circuit de `endpoint` s'il avait enregistré des échecs."""
+    if _bypass.is_set():
+        return
+    try:
+        EndpointState.objects.filter(endpoint=endpoint, failures__gt=0).update(
+            failures=0,
+            open_until=0,
+        )
+    except OperationalError:
+        logger.warning("Succès non enregistré pour %s : base verrouillée", endpoint)
+    finally:
+        release_connection()
+
+
+def record_failure(endpoint: str) -> None:
+    """Compte un échec ; ouvre le circuit une fois le seuil atteint."""
+    if _bypass.is_set():
+        return
+    try:
+        with transaction.atomic():
+            now = time.time()
+            state = _locked_state(endpoint, now)
+            state.failures += 1
+            if state.failures >= settings.IA_CIRCUIT_FAILURES:
+                state.open_until = now + settings.IA_CIRCUIT_RESET_AFTER
+            state.save(update_fields=["failures", "open_until"])
+    except OperationalError:
+        logger.warning("Échec non enregistré pour %s : base verrouillée", endpoint)
+    finally:
+        release_connection()
+
+
+def is_open(*endpoints: str) -> bool:
+    """Vrai si le circuit d'un des endpoints est ouvert (pour échouer vite)."""
+    try:
+        return EndpointState.objects.filter(
+            endpoint__in=endpoints,
+            open_until__gt=time.time(),
+        ).exists()
+    finally:
+        release_connection()
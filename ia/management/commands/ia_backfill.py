@@ -0,0 +1,107 @@
+from django.core.management.base import BaseCommand
+from wagtail.documents import get_document_model
+from wagtail.models import Collection
+
+from ia import routing
+from ia import utils as ai_utils
+from ia.models import ExtractedText, Summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Extrait le texte (et optionnellement les champs de facture et le résumé) "
+        "des documents existants. "
+        "Les documents déjà traités pour leur fichier courant sont ignorés : "
+        "la commande peut être interrompue puis relancée sans refaire le travail."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--summaries",
+            action="store_true",
+            help="Génère aussi le résumé des documents qui n'en ont pas.",
+        )
+        parser.add_argument(
+            "--fields",
+            action="store_true",
+            help=(
+                "Extrait aussi les champs de facture des documents qui n'en ont pas "
+                "pour leur fichier et la version courante des consignes."
+            ),
+        )
+        parser.add_argument(
+            "--digests",
+            action="store_true",
+            help=(
+                "Met aussi à jour les synthèses par collection et par mois "
+                "(seules les périodes modifiées sont recalculées)."
+            ),
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Nombre maximum de documents à traiter lors de cette exécution.",
+        )
+
+    def handle(self, *args, summaries=False, fields=False, digests=False, limit=None, **options):
+        documents = get_document_model().objects.order_by("pk")
+        total = documents.count()
+        processed = skipped = failed = 0
+
+        for position, document in enumerate(documents.iterator(), start=1):
+            if limit is not None and processed >= limit:
+                break
+            label = f"[{position}/{total}] {document.title}"
+
+            try:
+                file_hash = document.get_file_hash()
+            except FileNotFoundError:
+                failed += 1
+                self.stderr.write(f"{label} — fichier introuvable")
+                continue
+
+            has_text = ExtractedText.objects.filter(
+                document=document,
+                file_hash=file_hash,
+            ).exists()
+            needs_summary = summaries and ai_utils.current_summary(document, file_hash) is None
+            needs_fields = fields and ai_utils.current_invoice_fields(document, file_hash) is None
+            if has_text and not needs_summary and not needs_fields:
+                skipped += 1
+                continue
+
+            try:
+                ai_utils.extract_text(document)
+                if needs_fields:
+                    ai_utils.extract_invoice_fields(document)
+                if needs_summary:
+                    with routing.recording() as models:
+                        content = ai_utils.summarize_document(document)
+                    Summary.objects.create(
+                        document=document,
+                        content=content,
+                        file_hash=file_hash,
+                        prompt_version=ai_utils.SUMMARY_PROMPT_VERSION,
+                        model=models[-1] if models else "",
+                    )
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"{label} — échec : {exc}")
+                continue
+
+            processed += 1
+            self.stdout.write(f"{label} — ok")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{processed} traité(s), {skipped} déjà à jour, {failed} en échec."
+        ))
+        if digests:
+            self._refresh_digests()
+
+    def _refresh_digests(self):
+        """Synthèses des collections qui ont des documents (après l'extraction ci-dessus)."""
+        collection_ids = get_document_model().objects.values_list("collection_id", flat=True)
+        for collection in Collection.objects.filter(pk__in=collection_ids).order_by("path"):
+            label = "ok" if ai_utils.refresh_digests(collection) is not None else "échec partiel"
+            self.stdout.write(f"Synthèses « {collection.name} » — {label}")
@@ -0,0 +1,152 @@
+import statistics
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from ia import client, extraction, limiter, preprocess
+from ia import utils as ai_utils
+from ia.models import ApiCall, ExtractedPage, ExtractedText, PartialAnalysis, TextChunk
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit de bout en bout du résumé et de l'analyse globale. "
+        "À lancer contre le serveur simulé (ia_standin) : tout ce que la mesure "
+        "écrit en base est annulé à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=20, help="Nombre de documents résumés.")
+        parser.add_argument("--rounds", type=int, default=3, help="Nombre d'analyses globales.")
+        parser.add_argument("--query", default="Quels sont les montants des factures ?")
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Ignore les textes déjà extraits (mesure OCR compris).",
+        )
+        parser.add_argument(
+            "--compare-preprocess",
+            action="store_true",
+            help=(
+                "Compare octets envoyés et latence de l'OCR sans puis avec "
+                "l'allègement des images (PDF et images uniquement)."
+            ),
+        )
+        parser.add_argument(
+            "--allow-remote",
+            action="store_true",
+            help="Autorise la mesure contre une API distante (consomme du crédit).",
+        )
+
+    def handle(self, *args, documents, rounds, query, cold, allow_remote, compare_preprocess, **options):
+        hosts = {urlsplit(url).hostname for url in (settings.MISTRAL_OCR_URL, settings.MISTRAL_CHAT_URL)}
+        if not hosts <= {"127.0.0.1", "localhost"} and not allow_remote:
+            raise CommandError(
+                "MISTRAL_OCR_URL / MISTRAL_CHAT_URL ne pointent pas vers le serveur "
+                "simulé (ia_standin). Ajouter --allow-remote pour mesurer l'API réelle."
+            )
+
+        client.reset_session()
+        # La mesure porte sur le pipeline, pas sur les quotas : le limiteur
+        # partagé (et ses écritures depuis les threads) est mis de côté.
+        try:
+            with limiter.bypassed(), transaction.atomic():
+                if compare_preprocess:
+                    self._compare_preprocess(documents)
+                else:
+                    self._run(documents, rounds, query, cold)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _report(self, label: str, durations: list[float], unit: str) -> None:
+        if not durations:
+            self.stdout.write(f"{label} : aucune mesure.")
+            return
+        total = sum(durations)
+        ordered = sorted(durations)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        self.stdout.write(
+            f"{label} : {len(durations)} {unit} en {total:.2f} s "
+            f"({len(durations) / total * 60:.1f}/min) — "
+            f"médiane {statistics.median(durations) * 1000:.0f} ms, "
+            f"p95 {p95 * 1000:.0f} ms"
+        )
+
+    def _run(self, documents: int, rounds: int, query: str, cold: bool) -> None:
+        docs = list(ai_utils.documents_to_analyze()[:documents])
+        if cold:
+            for model in (ExtractedText, ExtractedPage, TextChunk):
+                model.objects.all().delete()
+            PartialAnalysis.objects.all().delete()
+
+        durations, failures = [], 0
+        for doc in docs:
+            started = time.perf_counter()
+            try:
+                ai_utils.summarize_document(doc)
+            except Exception as exc:
+                failures += 1
+                self.stderr.write(f"Résumé en échec — {doc.title} : {exc}")
+                continue
+            durations.append(time.perf_counter() - started)
+        self._report("Résumés", durations, "document(s)")
+
+        all_documents = ai_utils.documents_to_analyze()
+        global_durations = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            try:
+                ai_utils.analyze_all_documents(all_documents, query, scope={})
+            except Exception as exc:
+                failures += 1
+                self.stderr.write(f"Analyse globale en échec : {exc}")
+                continue
+            global_durations.append(time.perf_counter() - started)
+        self._report("Analyses globales", global_durations, "analyse(s)")
+        self.stdout.write(f"{failures} échec(s).")
+
+    def _compare_preprocess(self, documents: int) -> None:
+        """OCR des mêmes fichiers sans puis avec prétraitement (ia.preprocess)."""
+        docs = [
+            doc for doc in ai_utils.documents_to_analyze().iterator()
+            if extraction.is_pdf(Path(doc.file.name)) or preprocess.is_image(Path(doc.file.name))
+        ][:documents]
+        sent = {}
+        for label, context in (
+            ("OCR sans prétraitement", preprocess.skipped()),
+            ("OCR avec prétraitement", nullcontext()),
+        ):
+            last_call = ApiCall.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+            durations = []
+            with context:
+                for doc in docs:
+                    started = time.perf_counter()
+                    try:
+                        ai_utils._extract_file(doc)
+                    except Exception as exc:
+                        self.stderr.write(f"OCR en échec — {doc.title} : {exc}")
+                        continue
+                    durations.append(time.perf_counter() - started)
+            calls = ApiCall.objects.filter(pk__gt=last_call, endpoint="ocr").aggregate(
+                count=Count("id"),
+                request_bytes=Sum("request_bytes"),
+            )
+            sent[label] = calls["request_bytes"] or 0
+            self._report(label, durations, "document(s)")
+            self.stdout.write(
+                f"  {calls['count']} appel(s) OCR, {sent[label] / 1024 / 1024:.2f} Mo envoyés"
+            )
+        before, after = sent.values()
+        if before:
+            self.stdout.write(f"Octets envoyés : {(1 - after / before) * 100:.0f} % de moins.")
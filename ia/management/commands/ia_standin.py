@@ -0,0 +1,69 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ia.standin import StandinConfig, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance un serveur local imitant les endpoints OCR et chat de Mistral "
+        "(latence, erreurs et rafales de 429 configurables, enregistrement / rejeu)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.0, help="Latence fixe (s).")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Latence aléatoire ajoutée (s).")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 500 (0 à 1).")
+        parser.add_argument("--burst-every", type=int, default=0, help="Une rafale de 429 toutes les N requêtes.")
+        parser.add_argument("--burst-length", type=int, default=0, help="Nombre de 429 par rafale.")
+        parser.add_argument("--retry-after", type=int, default=1, help="Retry-After des 429 (s).")
+        parser.add_argument(
+            "--uplink-kbps",
+            type=float,
+            default=0.0,
+            help="Débit montant simulé (kbit/s) : l'envoi des fichiers pèse sur la latence.",
+        )
+        parser.add_argument("--ocr-chars", type=int, default=1500, help="Caractères simulés par page OCR.")
+        parser.add_argument("--chat-chars", type=int, default=400, help="Caractères simulés par réponse du chat.")
+        parser.add_argument(
+            "--record",
+            type=Path,
+            help="Relaie vers --upstream et enregistre les réponses dans ce dossier.",
+        )
+        parser.add_argument("--upstream", default="https://api.mistral.ai", help="API réelle (mode enregistrement).")
+        parser.add_argument("--replay", type=Path, help="Resservir les réponses enregistrées dans ce dossier.")
+        parser.add_argument("--seed", type=int, help="Graine du hasard, pour des mesures reproductibles.")
+
+    def handle(self, *args, **options):
+        config = StandinConfig(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            burst_every=options["burst_every"],
+            burst_length=options["burst_length"],
+            retry_after=options["retry_after"],
+            uplink_kbps=options["uplink_kbps"],
+            ocr_chars=options["ocr_chars"],
+            chat_chars=options["chat_chars"],
+            upstream=options["upstream"] if options["record"] else "",
+            record_dir=options["record"],
+            replay_dir=options["replay"],
+            seed=options["seed"],
+        )
+        server = make_server(options["host"], options["port"], config)
+        base = f"http://{options['host']}:{server.server_address[1]}/v1"
+        self.stdout.write(
+            "Serveur Mistral simulé prêt. Pour l'utiliser :\n"
+            f"  MISTRAL_OCR_URL={base}/ocr\n"
+            f"  MISTRAL_CHAT_URL={base}/chat/completions"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"{server.requests_count} requête(s) servie(s).")
@@ -0,0 +1,170 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.documents import get_document_model
+from wagtail.models import Collection
+
+from ia import metrics, routing
+from ia import utils as ai_utils
+from ia.models import Summary
+from ia.tasks import FAILURE_MSG
+
+
+def _date(value: str) -> date:
+    """Type argparse des options de date (CommandError si la date est invalide)."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Date invalide (AAAA-MM-JJ attendu) : {value}")
+
+
+def _summarize(text: str) -> tuple[str, str]:
+    """Résumé de `text` et modèle qui l'a produit (exécuté dans le pool)."""
+    with routing.recording() as models:
+        content = ai_utils.summarize_text(text)
+    return content, models[-1] if models else ""
+
+
+class Command(BaseCommand):
+    help = (
+        "Résume en masse les documents qui n'ont pas de résumé à jour. "
+        "Chaque résumé est enregistré dès qu'il est prêt : après une "
+        "interruption, relancer la commande reprend là où elle s'était arrêtée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collection",
+            type=int,
+            help="Identifiant de la collection (sous-collections incluses).",
+        )
+        parser.add_argument(
+            "--since",
+            type=_date,
+            help="Date du document minimale (AAAA-MM-JJ).",
+        )
+        parser.add_argument(
+            "--until",
+            type=_date,
+            help="Date du document maximale (AAAA-MM-JJ).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IA_MAP_MAX_WORKERS,
+            help="Nombre d'appels au modèle en parallèle.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Nombre de documents extraits puis résumés par lot.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Nombre maximum de documents à résumer lors de cette exécution.",
+        )
+
+    def _documents(self, collection=None, since=None, until=None):
+        documents = get_document_model().objects.order_by("pk")
+        if collection is not None:
+            try:
+                root = Collection.objects.get(pk=collection)
+            except Collection.DoesNotExist:
+                raise CommandError(f"Collection introuvable : {collection}")
+            documents = documents.filter(
+                collection__in=Collection.objects.descendant_of(root, inclusive=True),
+            )
+        if since:
+            documents = documents.filter(document_date__gte=since)
+        if until:
+            documents = documents.filter(document_date__lte=until)
+        return documents
+
+    def _to_summarize(self, documents) -> tuple[list, list]:
+        """Documents sans résumé à jour pour leur fichier courant, et fichiers introuvables."""
+        done = set(
+            Summary.objects.filter(
+                document__in=documents,
+                prompt_version=ai_utils.SUMMARY_PROMPT_VERSION,
+                pages="",
+            )
+            .exclude(status=Summary.Status.FAILED)
+            .values_list("document_id", "file_hash")
+        )
+        pending, missing = [], []
+        for document in documents.iterator():
+            try:
+                file_hash = document.get_file_hash()
+            except FileNotFoundError:
+                missing.append(document)
+                continue
+            if (document.pk, file_hash) not in done:
+                pending.append(document)
+        return pending, missing
+
+    def handle(self, *args, workers, batch_size, limit=None, **options):
+        documents = self._documents(
+            options["collection"],
+            options["since"],
+            options["until"],
+        )
+        pending, missing = self._to_summarize(documents)
+        if limit is not None:
+            pending = pending[:limit]
+        total = len(pending)
+        self.stdout.write(f"{total} document(s) à résumer.")
+
+        failures = [f"{document.title} — fichier introuvable" for document in missing]
+        processed = succeeded = 0
+        started = time.monotonic()
+
+        # Extraction (BDD + OCR) dans ce thread, lot par lot ; seuls les
+        # appels au modèle sont répartis sur le pool.
+        with ThreadPoolExecutor(
+            max_workers=max(workers, 1),
+            thread_name_prefix=metrics.POOL_THREAD_PREFIX,
+        ) as executor:
+            for start in range(0, total, batch_size):
+                batch = pending[start:start + batch_size]
+                texts = ai_utils.extract_texts(batch)
+                futures = [
+                    None if text is None else executor.submit(_summarize, text)
+                    for text in texts
+                ]
+                for document, future in zip(batch, futures):
+                    processed += 1
+                    try:
+                        if future is None:
+                            raise ValueError("extraction du texte impossible")
+                        (content, model), status = future.result(), Summary.Status.DONE
+                        succeeded += 1
+                    except Exception as exc:
+                        content, model, status = FAILURE_MSG, "", Summary.Status.FAILED
+                        failures.append(f"{document.title} — {str(exc) or type(exc).__name__}")
+                    Summary.objects.create(
+                        document=document,
+                        content=content,
+                        file_hash=document.file_hash,
+                        prompt_version=ai_utils.SUMMARY_PROMPT_VERSION,
+                        status=status,
+                        model=model,
+                    )
+                    label = "ok" if status == Summary.Status.DONE else "échec"
+                    self.stdout.write(f"[{processed}/{total}] {document.title} — {label}")
+                metrics.flush()
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed * 60 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{succeeded} résumé(s) en {elapsed:.1f} s "
+            f"({rate:.1f} documents/min), {len(failures)} échec(s)."
+        ))
+        for failure in failures:
+            self.stderr.write(f"  • {failure}")
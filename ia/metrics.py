@@ -0,0 +1,175 @@
+"""Mesures des appels à l'API Mistral et des caches IA.
+
+Chaque appel OCR / chat est enregistré (durée, octets, jetons, résultat) dans
+ApiCall. Les threads des pools (OCR parallèle, map-reduce) n'écrivent pas en
+BDD : leurs mesures sont gardées en mémoire puis enregistrées par le thread
+appelant (flush), comme le reste des écritures.
+"""
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.db.models import Avg, Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ApiCall, CacheStat
+
+# Préfixe des threads des pools IA : leurs mesures attendent un flush().
+POOL_THREAD_PREFIX = "ia-pool"
+
+_pending: list[ApiCall] = []
+_lock = threading.Lock()
+
+
+@dataclass
+class CallMeasure:
+    """Informations remplies par l'appelant pendant un appel mesuré."""
+
+    request_bytes: int
+    response_bytes: int = 0
+    status_code: int | None = None
+    usage: dict = field(default_factory=dict)
+
+
+def _in_pool_thread() -> bool:
+    return threading.current_thread().name.startswith(POOL_THREAD_PREFIX)
+
+
+def flush() -> None:
+    """Enregistre les mesures en attente (à appeler depuis le thread appelant)."""
+    with _lock:
+        calls = _pending[:]
+        _pending.clear()
+    if calls:
+        ApiCall.objects.bulk_create(calls)
+
+
+@contextmanager
+def measure(endpoint: str, request_bytes: int, model: str = "") -> Iterator[CallMeasure]:
+    """Mesure un appel à `model` ; le bloc renseigne code HTTP, taille de réponse et usage."""
+    started_at = timezone.now()
+    start = time.perf_counter()
+    call = CallMeasure(request_bytes=request_bytes)
+    failed = False
+    try:
+        yield call
+    except Exception:
+        failed = True
+        raise
+    finally:
+        if call.status_code is not None and call.status_code >= 400:
+            outcome = ApiCall.Outcome.HTTP_ERROR
+        elif failed or call.status_code is None:
+            outcome = ApiCall.Outcome.ERROR
+        else:
+            outcome = ApiCall.Outcome.OK
+        record = ApiCall(
+            endpoint=endpoint,
+            model=model,
+            started_at=started_at,
+            duration_ms=round((time.perf_counter() - start) * 1000),
+            request_bytes=call.request_bytes,
+            response_bytes=call.response_bytes,
+            prompt_tokens=call.usage.get("prompt_tokens") or 0,
+            completion_tokens=call.usage.get("completion_tokens") or 0,
+            status_code=call.status_code,
+            outcome=outcome,
+        )
+        with _lock:
+            _pending.append(record)
+        if not _in_pool_thread():
+            flush()
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    """Incrémente les compteurs du jour d'un cache (« texte », « résumé »…)."""
+    if not hits and not misses:
+        return
+    day = timezone.localdate()
+    CacheStat.objects.get_or_create(day=day, cache=cache)
+    CacheStat.objects.filter(day=day, cache=cache).update(
+        hits=F("hits") + hits,
+        misses=F("misses") + misses,
+    )
+
+
+def call_rollup(calls=None):
+    """Agrégats des appels par jour, endpoint et modèle, du plus récent au plus ancien."""
+    calls = ApiCall.objects.all() if calls is None else calls
+    return (
+        calls.annotate(day=TruncDate("started_at"))
+        .values("day", "endpoint", "model")
+        .annotate(
+            calls=Count("id"),
+            errors=Count("id", filter=~Q(outcome=ApiCall.Outcome.OK)),
+            avg_ms=Avg("duration_ms"),
+            max_ms=Max("duration_ms"),
+            request_bytes=Sum("request_bytes"),
+            response_bytes=Sum("response_bytes"),
+            prompt_tokens=Sum("prompt_tokens"),
+            completion_tokens=Sum("completion_tokens"),
+        )
+        .order_by("-day", "endpoint", "model")
+    )
+
+
+def render_text() -> str:
+    """Compteurs cumulés au format texte de Prometheus."""
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    by_outcome = ApiCall.objects.values("endpoint", "outcome").annotate(total=Count("id"))
+    metric("ia_calls_total", "counter", "Appels à l'API Mistral.", [
+        ({"endpoint": row["endpoint"], "outcome": row["outcome"]}, row["total"])
+        for row in by_outcome.order_by("endpoint", "outcome")
+    ])
+
+    totals = ApiCall.objects.values("endpoint").annotate(
+        duration=Sum("duration_ms"),
+        sent=Sum("request_bytes"),
+        received=Sum("response_bytes"),
+        prompt=Sum("prompt_tokens"),
+        completion=Sum("completion_tokens"),
+    ).order_by("endpoint")
+    totals = list(totals)
+    metric("ia_call_duration_seconds_sum", "counter", "Durée cumulée des appels.", [
+        ({"endpoint": row["endpoint"]}, row["duration"] / 1000) for row in totals
+    ])
+    metric("ia_request_bytes_total", "counter", "Octets envoyés à l'API.", [
+        ({"endpoint": row["endpoint"]}, row["sent"]) for row in totals
+    ])
+    metric("ia_response_bytes_total", "counter", "Octets reçus de l'API.", [
+        ({"endpoint": row["endpoint"]}, row["received"]) for row in totals
+    ])
+    metric("ia_tokens_total", "counter", "Jetons consommés.", [
+        sample
+        for row in totals
+        for sample in (
+            ({"endpoint": row["endpoint"], "kind": "prompt"}, row["prompt"]),
+            ({"endpoint": row["endpoint"], "kind": "completion"}, row["completion"]),
+        )
+    ])
+
+    caches = CacheStat.objects.values("cache").annotate(
+        hits=Sum("hits"),
+        misses=Sum("misses"),
+    ).order_by("cache")
+    metric("ia_cache_requests_total", "counter", "Consultations des caches IA.", [
+        sample
+        for row in caches
+        for sample in (
+            ({"cache": row["cache"], "result": "hit"}, row["hits"]),
+            ({"cache": row["cache"], "result": "miss"}, row["misses"]),
+        )
+    ])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('ia', '0002_alter_summary_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=40, verbose_name='Empreinte du fichier')),
+                ('text', models.TextField(blank=True, verbose_name='Texte extrait')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Extrait le')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extracted_texts', to='core.customdocument', verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Texte extrait',
+                'verbose_name_plural': 'Textes extraits',
+                'constraints': [models.UniqueConstraint(fields=('document', 'file_hash'), name='ia_extractedtext_unique_document_hash')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0003_extractedtext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='status',
+            field=models.CharField(choices=[('pending', 'En cours'), ('done', 'Terminé'), ('failed', 'Échec')], default='done', max_length=10, verbose_name='Statut'),
+        ),
+        migrations.AlterField(
+            model_name='summary',
+            name='content',
+            field=models.TextField(blank=True, verbose_name="Réponse de l'IA"),
+        ),
+    ]
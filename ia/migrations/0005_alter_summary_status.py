@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0004_summary_status_alter_summary_content'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='summary',
+            name='status',
+            field=models.CharField(choices=[('pending', 'En cours'), ('streaming', 'Diffusion en cours'), ('done', 'Terminé'), ('failed', 'Échec')], default='done', max_length=10, verbose_name='Statut'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('ia', '0005_alter_summary_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=40, verbose_name='Empreinte du fichier')),
+                ('position', models.PositiveIntegerField(verbose_name='Position')),
+                ('text', models.TextField(verbose_name='Texte')),
+                ('length', models.PositiveIntegerField(verbose_name='Nombre de termes')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_chunks', to='core.customdocument', verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Passage indexé',
+                'verbose_name_plural': 'Passages indexés',
+                'ordering': ['document', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChunkTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=64)),
+                ('frequency', models.PositiveIntegerField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='ia.textchunk')),
+            ],
+            options={
+                'verbose_name': 'Terme indexé',
+                'verbose_name_plural': 'Termes indexés',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0006_textchunk_chunkterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartialAnalysis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Clé')),
+                ('content', models.TextField(verbose_name='Réponse partielle')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+            ],
+            options={
+                'verbose_name': 'Analyse partielle',
+                'verbose_name_plural': 'Analyses partielles',
+            },
+        ),
+    ]
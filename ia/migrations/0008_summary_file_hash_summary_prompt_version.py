@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0007_partialanalysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='file_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40, verbose_name='Empreinte du fichier'),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='prompt_version',
+            field=models.CharField(blank=True, editable=False, max_length=12, verbose_name='Version des consignes'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0008_summary_file_hash_summary_prompt_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='corpus_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Empreinte des documents'),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='query_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Clé de la question'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('ia', '0009_summary_corpus_fingerprint_summary_query_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='pages',
+            field=models.CharField(blank=True, help_text='Pages analysées (ex. « 1-3,5 ») ; vide = tout le document.', max_length=50, verbose_name='Pages'),
+        ),
+        migrations.AddField(
+            model_name='textchunk',
+            name='page',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Page'),
+        ),
+        migrations.CreateModel(
+            name='ExtractedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=40, verbose_name='Empreinte du fichier')),
+                ('number', models.PositiveIntegerField(verbose_name='Page')),
+                ('text', models.TextField(blank=True, verbose_name='Texte extrait')),
+                ('text_hash', models.CharField(max_length=40, verbose_name='Empreinte du texte')),
+                ('status', models.CharField(choices=[('done', 'Lue'), ('failed', 'Échec')], default='done', max_length=10, verbose_name='Statut')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Extrait le')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extracted_pages', to='core.customdocument', verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Page extraite',
+                'verbose_name_plural': 'Pages extraites',
+                'ordering': ['document', 'number'],
+                'constraints': [models.UniqueConstraint(fields=('document', 'file_hash', 'number'), name='ia_extractedpage_unique_document_hash_number')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0010_summary_pages_textchunk_page_extractedpage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(db_index=True, max_length=20, verbose_name='Endpoint')),
+                ('started_at', models.DateTimeField(db_index=True, verbose_name='Début')),
+                ('duration_ms', models.PositiveIntegerField(verbose_name='Durée (ms)')),
+                ('request_bytes', models.PositiveBigIntegerField(verbose_name='Octets envoyés')),
+                ('response_bytes', models.PositiveBigIntegerField(default=0, verbose_name='Octets reçus')),
+                ('prompt_tokens', models.PositiveIntegerField(default=0, verbose_name='Jetons en entrée')),
+                ('completion_tokens', models.PositiveIntegerField(default=0, verbose_name='Jetons en sortie')),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Code HTTP')),
+                ('outcome', models.CharField(choices=[('ok', 'Succès'), ('http_error', 'Erreur HTTP'), ('error', 'Erreur réseau')], max_length=10, verbose_name='Résultat')),
+            ],
+            options={
+                'verbose_name': 'Appel IA',
+                'verbose_name_plural': 'Appels IA',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CacheStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Jour')),
+                ('cache', models.CharField(max_length=20, verbose_name='Cache')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Succès')),
+                ('misses', models.PositiveIntegerField(default=0, verbose_name='Défauts')),
+            ],
+            options={
+                'verbose_name': 'Statistique de cache IA',
+                'verbose_name_plural': 'Statistiques de cache IA',
+                'ordering': ['-day', 'cache'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'cache'), name='ia_cachestat_unique_day_cache')],
+            },
+        ),
+    ]
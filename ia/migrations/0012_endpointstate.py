@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0011_apicall_cachestat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=20, unique=True, verbose_name='Endpoint')),
+                ('tokens', models.FloatField(default=0, verbose_name='Jetons disponibles')),
+                ('refilled_at', models.FloatField(default=0, verbose_name='Dernier remplissage')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='Échecs consécutifs')),
+                ('open_until', models.FloatField(default=0, verbose_name="Circuit ouvert jusqu'à")),
+            ],
+            options={
+                'verbose_name': "État d'endpoint IA",
+                'verbose_name_plural': "États d'endpoint IA",
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0012_endpointstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='scope',
+            field=models.JSONField(blank=True, default=dict, help_text="Filtres de l'analyse globale (collection, dates, titre) ; vide = tous les documents.", verbose_name='Périmètre'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('ia', '0013_summary_scope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceFields',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=40, verbose_name='Empreinte du fichier')),
+                ('prompt_version', models.CharField(max_length=12, verbose_name='Version des consignes')),
+                ('issuer', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='Émetteur')),
+                ('total', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Montant total')),
+                ('currency', models.CharField(blank=True, max_length=3, verbose_name='Devise')),
+                ('invoice_date', models.DateField(blank=True, db_index=True, null=True, verbose_name='Date de facture')),
+                ('category', models.CharField(choices=[('energie', 'Énergie'), ('eau', 'Eau'), ('telecom', 'Télécom'), ('assurance', 'Assurance'), ('fournitures', 'Fournitures'), ('services', 'Services'), ('travaux', 'Travaux'), ('loyer', 'Loyer'), ('autre', 'Autre')], db_index=True, default='autre', max_length=20, verbose_name='Catégorie')),
+                ('status', models.CharField(choices=[('done', 'Extraits'), ('failed', 'Échec')], default='done', max_length=10, verbose_name='Statut')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Extraits le')),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_fields', to='core.customdocument', verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Champs de facture',
+                'verbose_name_plural': 'Champs de factures',
+                'ordering': ['-invoice_date'],
+            },
+        ),
+    ]
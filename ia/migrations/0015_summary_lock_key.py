@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0014_invoicefields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='lock_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Verrou'),
+        ),
+    ]
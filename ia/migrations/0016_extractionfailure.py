@@ -0,0 +1,34 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('ia', '0015_summary_lock_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(blank=True, max_length=40, verbose_name='Empreinte du fichier')),
+                ('reason', models.CharField(choices=[('missing', 'Fichier introuvable'), ('too_large', 'Fichier trop volumineux'), ('ocr_error', "Échec de l'OCR"), ('unreadable', 'Contenu illisible')], max_length=20, verbose_name='Motif')),
+                ('detail', models.CharField(blank=True, max_length=255, verbose_name='Détail')),
+                ('attempts', models.PositiveIntegerField(default=1, verbose_name='Tentatives')),
+                ('retry_after', models.DateTimeField(db_index=True, verbose_name='Nouvel essai après')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Dernier échec')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extraction_failures', to='core.customdocument', verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Fichier illisible',
+                'verbose_name_plural': 'Fichiers illisibles',
+                'ordering': ['-updated_at'],
+                'constraints': [models.UniqueConstraint(fields=('document', 'file_hash'), name='ia_extractionfailure_unique_document_hash')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0016_extractionfailure'),
+        ('wagtailcore', '0096_referenceindex_referenceindex_source_object_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Digest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(blank=True, max_length=10, verbose_name='Période')),
+                ('content', models.TextField(verbose_name='Synthèse')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Empreinte')),
+                ('document_count', models.PositiveIntegerField(verbose_name='Documents')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mise à jour')),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ia_digests', to='wagtailcore.collection', verbose_name='Collection')),
+            ],
+            options={
+                'verbose_name': 'Synthèse IA',
+                'verbose_name_plural': 'Synthèses IA',
+                'ordering': ['collection', 'period'],
+                'constraints': [models.UniqueConstraint(fields=('collection', 'period'), name='ia_digest_unique_collection_period')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0017_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apicall',
+            name='model',
+            field=models.CharField(blank=True, db_index=True, max_length=100, verbose_name='Modèle'),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='model',
+            field=models.CharField(blank=True, editable=False, help_text='Modèle de chat qui a produit la réponse (principal ou de repli).', max_length=100, verbose_name='Modèle'),
+        ),
+        migrations.AlterField(
+            model_name='endpointstate',
+            name='endpoint',
+            field=models.CharField(max_length=100, unique=True, verbose_name='Endpoint'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0018_chat_model_routing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='complete',
+            field=models.BooleanField(default=True, editable=False, help_text="Faux si des documents n'ont pas pu être lus : la réponse n'est pas réutilisée.", verbose_name='Tous les documents lus'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0019_summary_complete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicefields',
+            name='is_invoice',
+            field=models.BooleanField(default=False, verbose_name='Facture'),
+        ),
+    ]
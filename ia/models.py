@@ -1,5 +1,8 @@
+from datetime import date
+
 from django.conf import settings
 from django.db import models
+from wagtail.models import Collection
 
 
 class Summary(models.Model):
@@ -8,9 +11,22 @@ class Summary(models.Model):
     - document renseigné  → résumé d'un document individuel
     - document null       → analyse globale (query obligatoire)
 
-    Chaque appel crée un nouvel enregistrement (historique complet).
+    Chaque appel crée un nouvel enregistrement (historique complet),
+    d'abord « en cours » puis complété par la tâche de fond ; des demandes
+    simultanées pour le même résumé se partagent le même enregistrement. Un résumé de
+    document est réutilisé tant que l'empreinte du fichier et la version des
+    consignes (prompt_version) n'ont pas changé ; une analyse globale, tant
+    que la question normalisée (query_key) et l'ensemble des documents
+    (corpus_fingerprint) sont identiques, et si tous ses documents ont pu
+    être lus (complete).
     """
 
+    class Status(models.TextChoices):
+        PENDING = "pending", "En cours"
+        STREAMING = "streaming", "Diffusion en cours"
+        DONE = "done", "Terminé"
+        FAILED = "failed", "Échec"
+
     document = models.ForeignKey(
         settings.WAGTAILDOCS_DOCUMENT_MODEL,
         null=True,
@@ -24,7 +40,73 @@ class Summary(models.Model):
         blank=True,
         help_text="Question posée à l'IA (analyse globale).",
     )
-    content = models.TextField("Réponse de l'IA")
+    content = models.TextField("Réponse de l'IA", blank=True)
+    file_hash = models.CharField(
+        "Empreinte du fichier",
+        max_length=40,
+        blank=True,
+        editable=False,
+    )
+    prompt_version = models.CharField(
+        "Version des consignes",
+        max_length=12,
+        blank=True,
+        editable=False,
+    )
+    query_key = models.CharField(
+        "Clé de la question",
+        max_length=64,
+        blank=True,
+        editable=False,
+    )
+    corpus_fingerprint = models.CharField(
+        "Empreinte des documents",
+        max_length=64,
+        blank=True,
+        editable=False,
+    )
+    pages = models.CharField(
+        "Pages",
+        max_length=50,
+        blank=True,
+        help_text="Pages analysées (ex. « 1-3,5 ») ; vide = tout le document.",
+    )
+    scope = models.JSONField(
+        "Périmètre",
+        default=dict,
+        blank=True,
+        help_text="Filtres de l'analyse globale (collection, dates, titre) ; vide = tous les documents.",
+    )
+    status = models.CharField(
+        "Statut",
+        max_length=10,
+        choices=Status.choices,
+        default=Status.DONE,
+    )
+    complete = models.BooleanField(
+        "Tous les documents lus",
+        default=True,
+        editable=False,
+        help_text="Faux si des documents n'ont pas pu être lus : la réponse n'est pas réutilisée.",
+    )
+    model = models.CharField(
+        "Modèle",
+        max_length=100,
+        blank=True,
+        editable=False,
+        help_text="Modèle de chat qui a produit la réponse (principal ou de repli).",
+    )
+    # Renseignée tant qu'un résumé est en cours : l'unicité garantit un
+    # seul calcul à la fois par document, fichier, pages et consignes, y
+    # compris entre processus (NULL une fois le résumé terminé).
+    lock_key = models.CharField(
+        "Verrou",
+        max_length=64,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+    )
     created_at = models.DateTimeField("Créé le", auto_now_add=True)
 
     class Meta:
@@ -37,3 +119,388 @@ class Summary(models.Model):
             return f"Résumé — {self.document.title}"
         return f"Analyse globale — {self.created_at:%d/%m/%Y %H:%M}"
 
+    @property
+    def is_pending(self) -> bool:
+        return self.status in (self.Status.PENDING, self.Status.STREAMING)
+
+    @property
+    def scope_label(self) -> str:
+        """Périmètre de l'analyse globale en toutes lettres (vide = tous les documents)."""
+        parts = []
+        if collection_id := self.scope.get("collection"):
+            collection = Collection.objects.filter(pk=collection_id).first()
+            parts.append(f"collection « {collection.name if collection else collection_id} »")
+        if date_from := self.scope.get("date_from"):
+            parts.append(f"depuis le {date.fromisoformat(date_from):%d/%m/%Y}")
+        if date_to := self.scope.get("date_to"):
+            parts.append(f"jusqu'au {date.fromisoformat(date_to):%d/%m/%Y}")
+        if title := self.scope.get("title"):
+            parts.append(f"titre contenant « {title} »")
+        return ", ".join(parts)
+
+
+
+class ExtractedText(models.Model):
+    """Texte extrait d'un document, toutes pages réunies (cache).
+
+    Indexé par l'empreinte SHA-1 du fichier : tant que le fichier n'est pas
+    remplacé, l'OCR distant n'est appelé qu'une seule fois par document.
+    """
+
+    document = models.ForeignKey(
+        settings.WAGTAILDOCS_DOCUMENT_MODEL,
+        on_delete=models.CASCADE,
+        related_name="extracted_texts",
+        verbose_name="Document",
+    )
+    file_hash = models.CharField("Empreinte du fichier", max_length=40)
+    text = models.TextField("Texte extrait", blank=True)
+    created_at = models.DateTimeField("Extrait le", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Texte extrait"
+        verbose_name_plural = "Textes extraits"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["document", "file_hash"],
+                name="ia_extractedtext_unique_document_hash",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Texte — {self.document.title}"
+
+
+class ExtractedPage(models.Model):
+    """Texte d'une page d'un document (couche texte PDF ou OCR).
+
+    Une page en échec est redemandée à la prochaine extraction ; les pages
+    déjà lues ne le sont jamais deux fois pour un même fichier.
+    """
+
+    class Status(models.TextChoices):
+        DONE = "done", "Lue"
+        FAILED = "failed", "Échec"
+
+    document = models.ForeignKey(
+        settings.WAGTAILDOCS_DOCUMENT_MODEL,
+        on_delete=models.CASCADE,
+        related_name="extracted_pages",
+        verbose_name="Document",
+    )
+    file_hash = models.CharField("Empreinte du fichier", max_length=40)
+    number = models.PositiveIntegerField("Page")
+    text = models.TextField("Texte extrait", blank=True)
+    text_hash = models.CharField("Empreinte du texte", max_length=40)
+    status = models.CharField(
+        "Statut",
+        max_length=10,
+        choices=Status.choices,
+        default=Status.DONE,
+    )
+    created_at = models.DateTimeField("Extrait le", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Page extraite"
+        verbose_name_plural = "Pages extraites"
+        ordering = ["document", "number"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["document", "file_hash", "number"],
+                name="ia_extractedpage_unique_document_hash_number",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.document.title} — page {self.number}"
+
+
+class TextChunk(models.Model):
+    """Passage du texte extrait d'un document, indexé pour la recherche BM25."""
+
+    document = models.ForeignKey(
+        settings.WAGTAILDOCS_DOCUMENT_MODEL,
+        on_delete=models.CASCADE,
+        related_name="text_chunks",
+        verbose_name="Document",
+    )
+    file_hash = models.CharField("Empreinte du fichier", max_length=40)
+    position = models.PositiveIntegerField("Position")
+    page = models.PositiveIntegerField("Page", null=True, blank=True)
+    text = models.TextField("Texte")
+    length = models.PositiveIntegerField("Nombre de termes")
+
+    class Meta:
+        verbose_name = "Passage indexé"
+        verbose_name_plural = "Passages indexés"
+        ordering = ["document", "position"]
+
+    def __str__(self) -> str:
+        return f"{self.document.title} — passage {self.position + 1}"
+
+
+class ChunkTerm(models.Model):
+    """Entrée de l'index inversé : fréquence d'un terme dans un passage."""
+
+    chunk = models.ForeignKey(
+        TextChunk,
+        on_delete=models.CASCADE,
+        related_name="terms",
+    )
+    term = models.CharField(max_length=64, db_index=True)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Terme indexé"
+        verbose_name_plural = "Termes indexés"
+
+
+class PartialAnalysis(models.Model):
+    """Réponse partielle d'une analyse globale découpée en lots (cache).
+
+    La clé est l'empreinte du lot (modèle, consigne, question et contenu) :
+    relancer la même analyse ne rappelle le modèle que pour la fusion finale.
+    """
+
+    key = models.CharField("Clé", max_length=64, unique=True)
+    content = models.TextField("Réponse partielle")
+    created_at = models.DateTimeField("Créé le", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Analyse partielle"
+        verbose_name_plural = "Analyses partielles"
+
+    def __str__(self) -> str:
+        return f"Analyse partielle {self.key[:12]}"
+
+
+class ApiCall(models.Model):
+    """Mesure d'un appel à l'API Mistral (OCR ou chat)."""
+
+    class Outcome(models.TextChoices):
+        OK = "ok", "Succès"
+        HTTP_ERROR = "http_error", "Erreur HTTP"
+        ERROR = "error", "Erreur réseau"
+
+    endpoint = models.CharField("Endpoint", max_length=20, db_index=True)
+    model = models.CharField("Modèle", max_length=100, blank=True, db_index=True)
+    started_at = models.DateTimeField("Début", db_index=True)
+    duration_ms = models.PositiveIntegerField("Durée (ms)")
+    request_bytes = models.PositiveBigIntegerField("Octets envoyés")
+    response_bytes = models.PositiveBigIntegerField("Octets reçus", default=0)
+    prompt_tokens = models.PositiveIntegerField("Jetons en entrée", default=0)
+    completion_tokens = models.PositiveIntegerField("Jetons en sortie", default=0)
+    status_code = models.PositiveSmallIntegerField("Code HTTP", null=True, blank=True)
+    outcome = models.CharField("Résultat", max_length=10, choices=Outcome.choices)
+
+    class Meta:
+        verbose_name = "Appel IA"
+        verbose_name_plural = "Appels IA"
+        ordering = ["-started_at"]
+
+    def __str__(self) -> str:
+        return f"{self.endpoint} — {self.started_at:%d/%m/%Y %H:%M:%S}"
+
+
+class CacheStat(models.Model):
+    """Compteurs journaliers de succès / défauts d'un cache IA."""
+
+    day = models.DateField("Jour")
+    cache = models.CharField("Cache", max_length=20)
+    hits = models.PositiveIntegerField("Succès", default=0)
+    misses = models.PositiveIntegerField("Défauts", default=0)
+
+    class Meta:
+        verbose_name = "Statistique de cache IA"
+        verbose_name_plural = "Statistiques de cache IA"
+        ordering = ["-day", "cache"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "cache"],
+                name="ia_cachestat_unique_day_cache",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.cache} — {self.day:%d/%m/%Y}"
+
+
+class EndpointState(models.Model):
+    """État partagé entre processus d'un endpoint Mistral (limiteur et disjoncteur).
+
+    Les horodatages sont des secondes Unix (time.time()).
+    """
+
+    endpoint = models.CharField("Endpoint", max_length=100, unique=True)
+    tokens = models.FloatField("Jetons disponibles", default=0)
+    refilled_at = models.FloatField("Dernier remplissage", default=0)
+    failures = models.PositiveIntegerField("Échecs consécutifs", default=0)
+    open_until = models.FloatField("Circuit ouvert jusqu'à", default=0)
+
+    class Meta:
+        verbose_name = "État d'endpoint IA"
+        verbose_name_plural = "États d'endpoint IA"
+
+    def __str__(self) -> str:
+        return self.endpoint
+
+
+class InvoiceFields(models.Model):
+    """Champs structurés d'une facture, extraits une fois par fichier.
+
+    Permet de répondre aux questions d'agrégat (« combien dépensé chez X en
+    2025 ? ») en SQL plutôt qu'en faisant relire chaque facture au modèle. Les
+    champs sont ré-extraits quand le fichier ou la version des consignes
+    (prompt_version) change.
+    """
+
+    class Category(models.TextChoices):
+        ENERGY = "energie", "Énergie"
+        WATER = "eau", "Eau"
+        TELECOM = "telecom", "Télécom"
+        INSURANCE = "assurance", "Assurance"
+        SUPPLIES = "fournitures", "Fournitures"
+        SERVICES = "services", "Services"
+        WORKS = "travaux", "Travaux"
+        RENT = "loyer", "Loyer"
+        OTHER = "autre", "Autre"
+
+    class Status(models.TextChoices):
+        DONE = "done", "Extraits"
+        FAILED = "failed", "Échec"
+
+    document = models.OneToOneField(
+        settings.WAGTAILDOCS_DOCUMENT_MODEL,
+        on_delete=models.CASCADE,
+        related_name="invoice_fields",
+        verbose_name="Document",
+    )
+    file_hash = models.CharField("Empreinte du fichier", max_length=40)
+    prompt_version = models.CharField("Version des consignes", max_length=12)
+    # Relevés, courriers, devis… : champs gardés, mais jamais comptés comme factures.
+    is_invoice = models.BooleanField("Facture", default=False)
+    issuer = models.CharField("Émetteur", max_length=255, blank=True, db_index=True)
+    total = models.DecimalField(
+        "Montant total",
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    currency = models.CharField("Devise", max_length=3, blank=True)
+    invoice_date = models.DateField("Date de facture", null=True, blank=True, db_index=True)
+    category = models.CharField(
+        "Catégorie",
+        max_length=20,
+        choices=Category.choices,
+        default=Category.OTHER,
+        db_index=True,
+    )
+    status = models.CharField(
+        "Statut",
+        max_length=10,
+        choices=Status.choices,
+        default=Status.DONE,
+    )
+    updated_at = models.DateTimeField("Extraits le", auto_now=True)
+
+    class Meta:
+        verbose_name = "Champs de facture"
+        verbose_name_plural = "Champs de factures"
+        ordering = ["-invoice_date"]
+
+    def __str__(self) -> str:
+        return f"Facture — {self.document.title}"
+
+
+class ExtractionFailure(models.Model):
+    """Échec d'extraction mémorisé (cache négatif) pour une version d'un fichier.
+
+    Tant que retry_after n'est pas passé, l'analyse globale saute le fichier
+    sans nouvel appel OCR et l'affiche comme « [contenu illisible] ». Le
+    délai double à chaque nouvel échec. file_hash est vide pour un fichier
+    introuvable dont l'empreinte n'a jamais pu être calculée.
+    """
+
+    class Reason(models.TextChoices):
+        MISSING = "missing", "Fichier introuvable"
+        TOO_LARGE = "too_large", "Fichier trop volumineux"
+        OCR_ERROR = "ocr_error", "Échec de l'OCR"
+        UNREADABLE = "unreadable", "Contenu illisible"
+
+    document = models.ForeignKey(
+        settings.WAGTAILDOCS_DOCUMENT_MODEL,
+        on_delete=models.CASCADE,
+        related_name="extraction_failures",
+        verbose_name="Document",
+    )
+    file_hash = models.CharField("Empreinte du fichier", max_length=40, blank=True)
+    reason = models.CharField("Motif", max_length=20, choices=Reason.choices)
+    detail = models.CharField("Détail", max_length=255, blank=True)
+    attempts = models.PositiveIntegerField("Tentatives", default=1)
+    retry_after = models.DateTimeField("Nouvel essai après", db_index=True)
+    updated_at = models.DateTimeField("Dernier échec", auto_now=True)
+
+    class Meta:
+        verbose_name = "Fichier illisible"
+        verbose_name_plural = "Fichiers illisibles"
+        ordering = ["-updated_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["document", "file_hash"],
+                name="ia_extractionfailure_unique_document_hash",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_reason_display()} — {self.document.title}"
+
+
+class Digest(models.Model):
+    """Synthèse précalculée des documents d'une collection.
+
+    Deux niveaux : une synthèse par mois de document_date (period « AAAA-MM »,
+    ou UNDATED pour les documents sans date), puis une synthèse de la
+    collection entière (period vide) tirée des synthèses mensuelles. Seuls
+    les documents rattachés directement à la collection sont pris en compte.
+    Une synthèse est à jour tant que son empreinte (documents couverts,
+    version des consignes) n'a pas changé : seules les périodes modifiées
+    sont recalculées.
+    """
+
+    WHOLE = ""
+    UNDATED = "sans-date"
+
+    collection = models.ForeignKey(
+        Collection,
+        on_delete=models.CASCADE,
+        related_name="ia_digests",
+        verbose_name="Collection",
+    )
+    period = models.CharField("Période", max_length=10, blank=True)
+    content = models.TextField("Synthèse")
+    fingerprint = models.CharField("Empreinte", max_length=64)
+    document_count = models.PositiveIntegerField("Documents")
+    updated_at = models.DateTimeField("Mise à jour", auto_now=True)
+
+    class Meta:
+        verbose_name = "Synthèse IA"
+        verbose_name_plural = "Synthèses IA"
+        ordering = ["collection", "period"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["collection", "period"],
+                name="ia_digest_unique_collection_period",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Synthèse — {self.collection.name}, {self.period_label}"
+
+    @property
+    def period_label(self) -> str:
+        if self.period == self.WHOLE:
+            return "toute la collection"
+        if self.period == self.UNDATED:
+            return "documents sans date"
+        return f"{date.fromisoformat(self.period + '-01'):%m/%Y}"
@@ -0,0 +1,169 @@
+"""Allègement des images avant leur envoi à l'OCR distant.
+
+Photos de téléphone et scans à 600 dpi partiraient sinon à pleine taille :
+sur notre lien montant, l'envoi coûte plus cher que l'OCR lui-même. Chaque
+image (fichier image, ou image d'une page PDF à océriser) est :
+
+- redressée selon son EXIF, puis passée en niveaux de gris ;
+- réduite pour que son plus grand côté ne dépasse pas IA_OCR_MAX_DIMENSION ;
+- recompressée en JPEG, à la qualité IA_OCR_JPEG_QUALITY au plus.
+
+La version allégée n'est envoyée que si elle est plus petite que
+l'original ; un fichier que Pillow ou pypdf ne sait pas lire part tel quel
+(l'OCR reste seul juge).
+"""
+
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+from django.conf import settings
+from PIL import Image, ImageOps, ImageSequence
+from pillow_heif import register_heif_opener
+from pypdf import PdfWriter
+
+# Photos d'iPhone (HEIC / HEIF).
+register_heif_opener()
+
+logger = logging.getLogger(__name__)
+
+PDF_MIME = "application/pdf"
+IMAGE_SUFFIXES = frozenset({
+    ".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".heic", ".heif",
+})
+
+# Images d'un PDF laissées telles quelles : trop petites pour peser sur
+# l'envoi (logos, signatures), ou déjà compactes (noir et blanc 1 bit).
+MIN_PDF_IMAGE_PIXELS = 512 * 512
+
+_skip = threading.Event()
+
+
+def is_image(file_path: Path) -> bool:
+    return file_path.suffix.lower() in IMAGE_SUFFIXES
+
+
+@contextmanager
+def skipped() -> Iterator[None]:
+    """Désactive le prétraitement dans tout le processus (mesures comparatives)."""
+    _skip.set()
+    try:
+        yield
+    finally:
+        _skip.clear()
+
+
+def _normalize(image: Image.Image) -> Image.Image:
+    """Image redressée, en niveaux de gris, réduite à IA_OCR_MAX_DIMENSION."""
+    size = settings.IA_OCR_MAX_DIMENSION
+    # JPEG : décodage directement à une résolution proche de la cible.
+    image.draft("L", (size, size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        # Zones transparentes sur fond blanc (sinon noires une fois aplaties).
+        background = Image.new("RGBA", image.size, "white")
+        image = Image.alpha_composite(background, image.convert("RGBA"))
+    image = image.convert("L")
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return image
+
+
+def _optimize_image(file_path: Path, out: BinaryIO) -> str:
+    """Écrit dans `out` l'image allégée en JPEG (un TIFF multipage devient un PDF) ; son type MIME."""
+    quality = settings.IA_OCR_JPEG_QUALITY
+    with Image.open(file_path) as image:
+        if getattr(image, "n_frames", 1) == 1:
+            _normalize(image).save(out, "JPEG", quality=quality, optimize=True)
+            return "image/jpeg"
+        frames = [_normalize(frame.copy()) for frame in ImageSequence.Iterator(image)]
+    frames[0].save(out, "PDF", save_all=True, append_images=frames[1:], quality=quality)
+    return PDF_MIME
+
+
+def _replaceable(xobject) -> bool:
+    if "/SMask" in xobject or "/Mask" in xobject or xobject.get("/ImageMask"):
+        return False  # transparence : l'aplatir pourrait masquer du texte
+    if xobject.get("/BitsPerComponent") == 1:
+        return False
+    return xobject.get("/Width", 0) * xobject.get("/Height", 0) >= MIN_PDF_IMAGE_PIXELS
+
+
+def _optimize_pdf(file_path: Path, out: BinaryIO, pages: list[int] | None = None) -> bool:
+    """Écrit dans `out` le PDF dont les images des pages `pages` (toutes par défaut) sont allégées.
+
+    Les pages gardent leur numérotation : seules les images changent. False,
+    sans rien écrire, si aucune image ne valait d'être réencodée.
+    """
+    writer = PdfWriter(clone_from=file_path)
+    numbers = pages or range(1, len(writer.pages) + 1)
+    seen, replaced = set(), 0
+    for number in numbers:
+        if number > len(writer.pages):
+            continue
+        for image_file in writer.pages[number - 1].images:
+            reference = image_file.indirect_reference
+            if reference is None or reference.idnum in seen:
+                continue  # image en ligne, ou partagée et déjà traitée
+            seen.add(reference.idnum)
+            if not _replaceable(reference.get_object()):
+                continue
+            try:
+                image_file.replace(
+                    _normalize(image_file.image),
+                    quality=settings.IA_OCR_JPEG_QUALITY,
+                )
+            except Exception:
+                logger.debug("Image %s illisible, conservée : %s", reference.idnum, file_path.name)
+                continue
+            replaced += 1
+    if not replaced:
+        return False
+    writer.write(out)
+    return True
+
+
+@contextmanager
+def prepared(file_path: Path, pages: list[int] | None = None) -> Iterator[tuple[Path, str]]:
+    """Fichier à envoyer à l'OCR pour `file_path`, et son type MIME.
+
+    Avec IA_OCR_PREPROCESS, la version allégée est écrite au fil de l'eau
+    dans un fichier temporaire, supprimé à la sortie du bloc ; sinon, si elle
+    n'est pas plus petite, ou si l'original dépasse IA_OCR_MAX_FILE_SIZE
+    (il n'est alors même pas ouvert), c'est `file_path` lui-même.
+    """
+    if is_image(file_path):
+        original_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+    else:
+        original_type = PDF_MIME
+    size = file_path.stat().st_size
+    if (
+        not settings.IA_OCR_PREPROCESS
+        or _skip.is_set()
+        or size > settings.IA_OCR_MAX_FILE_SIZE
+    ):
+        yield file_path, original_type
+        return
+
+    fd, name = tempfile.mkstemp()
+    try:
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if is_image(file_path):
+                    mime_type = _optimize_image(file_path, f)
+                else:
+                    mime_type = PDF_MIME if _optimize_pdf(file_path, f, pages) else None
+        except Exception:
+            logger.info("Prétraitement impossible, fichier envoyé tel quel : %s", file_path.name)
+            mime_type = None
+        if mime_type is None or os.path.getsize(name) >= size:
+            yield file_path, original_type
+        else:
+            yield Path(name), mime_type
+    finally:
+        os.unlink(name)
@@ -0,0 +1,163 @@
+"""Index de recherche local (BM25) sur le texte extrait des documents.
+
+Le texte de chaque document est découpé en passages, stockés en BDD avec un
+index inversé (TextChunk / ChunkTerm). L'analyse globale n'envoie ensuite au
+modèle que les passages les plus pertinents pour la question, sans service
+externe.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F
+
+from .models import ChunkTerm, ExtractedPage, TextChunk
+
+# Paramètres BM25 usuels.
+K1 = 1.2
+B = 0.75
+
+_WORD_RE = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    """
+    au aux avec ce ces cet cette dans de des du elle en et est il ils je la le
+    les leur lui ma mais me meme mes moi mon ne nos notre nous on ou par pas
+    pour qu que qui quel quelle quelles quels sa se ses son sont sur ta te tes
+    toi ton tu un une vos votre vous ete etre avoir combien comment quoi
+    """.split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Découpe un texte en termes normalisés (minuscules, sans accents ni pluriel)."""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    terms = []
+    for word in _WORD_RE.findall(normalized):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        if len(word) > 3 and word[-1] in "sx" and not word.isdigit():
+            word = word[:-1]
+        terms.append(word[:64])
+    return terms
+
+
+def split_chunks(text: str, size: int) -> list[str]:
+    """Regroupe les paragraphes d'un texte en passages d'environ `size` caractères."""
+    chunks: list[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        # Un paragraphe trop long est coupé à la taille cible.
+        while len(paragraph) > size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:size])
+            paragraph = paragraph[size:]
+        if current and len(current) + len(paragraph) + 2 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@transaction.atomic
+def index_document(document, file_hash: str, pages: list[tuple[int | None, str]]) -> None:
+    """(Ré)indexe le texte d'un document, en remplaçant ses anciens passages.
+
+    `pages` associe chaque numéro de page (None si inconnu) à son texte : un
+    passage ne chevauche jamais deux pages, ce qui permet de citer la page.
+    """
+    TextChunk.objects.filter(document=document).delete()
+    position = 0
+    for page, page_text in pages:
+        for chunk_text in split_chunks(page_text, settings.IA_CHUNK_SIZE):
+            counts = Counter(tokenize(chunk_text))
+            chunk = TextChunk.objects.create(
+                document=document,
+                file_hash=file_hash,
+                position=position,
+                page=page,
+                text=chunk_text,
+                length=sum(counts.values()),
+            )
+            ChunkTerm.objects.bulk_create(
+                ChunkTerm(chunk=chunk, term=term, frequency=frequency)
+                for term, frequency in counts.items()
+            )
+            position += 1
+
+
+def ensure_indexed(documents_with_texts) -> None:
+    """Indexe les documents (document, texte) dont la version courante ne l'est pas encore.
+
+    Le découpage par page est repris des pages extraites quand elles existent.
+    """
+    pairs = list(documents_with_texts)
+    indexed = set(
+        TextChunk.objects.filter(document__in=[doc for doc, _ in pairs])
+        .values_list("document_id", "file_hash")
+        .distinct()
+    )
+    for doc, text in pairs:
+        if (doc.pk, doc.file_hash) in indexed:
+            continue
+        pages = list(
+            ExtractedPage.objects.filter(
+                document=doc,
+                file_hash=doc.file_hash,
+                status=ExtractedPage.Status.DONE,
+            ).values_list("number", "text")
+        )
+        index_document(doc, doc.file_hash, pages or [(None, text)])
+
+
+def search(query: str, documents, top_k: int, pages: list[int] | None = None) -> list[TextChunk]:
+    """Retourne les `top_k` passages des documents donnés les plus pertinents (BM25).
+
+    `pages` restreint la recherche à certains numéros de page.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    # Seuls les passages de la version courante de chaque fichier comptent.
+    scope = TextChunk.objects.filter(
+        document__in=documents,
+        file_hash=F("document__file_hash"),
+    )
+    if pages:
+        scope = scope.filter(page__in=pages)
+    stats = scope.aggregate(total=Count("id"), avg_length=Avg("length"))
+    if not stats["total"]:
+        return []
+    total = stats["total"]
+    avg_length = stats["avg_length"] or 1
+
+    postings = ChunkTerm.objects.filter(chunk__in=scope, term__in=terms)
+    document_frequency = dict(
+        postings.values_list("term").annotate(df=Count("id")).values_list("term", "df")
+    )
+
+    scores: Counter = Counter()
+    for chunk_id, term, frequency, length in postings.values_list(
+        "chunk_id", "term", "frequency", "chunk__length"
+    ):
+        df = document_frequency[term]
+        idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        norm = frequency + K1 * (1 - B + B * length / avg_length)
+        scores[chunk_id] += idf * frequency * (K1 + 1) / norm
+
+    best = [chunk_id for chunk_id, _ in scores.most_common(top_k)]
+    chunks = TextChunk.objects.select_related("document").in_bulk(best)
+    return [chunks[chunk_id] for chunk_id in best]
@@ -0,0 +1,116 @@
+"""Choix du modèle de chat selon le type d'appel, avec modèle de repli.
+
+Chaque type d'appel (résumé, analyse globale, extraction de champs) a sa
+route dans IA_CHAT_MODELS : un modèle principal, un modèle de repli
+éventuel et un délai de lecture propre au principal. Quand le principal est
+saturé (429), en panne (5xx, erreur réseau) ou trop lent (timeout), l'appel
+part aussitôt vers le repli, sans les nouvelles tentatives du client : c'est
+le repli qui en bénéficie. Chaque modèle principal a son propre disjoncteur
+(clé « chat:<modèle> » d'ia.limiter) : tant qu'il est ouvert, les appels
+vont directement au repli.
+
+Usage, où `send` fait l'appel HTTP pour un modèle donné :
+
+    for attempt in routing.attempts(routing.SUMMARY):
+        with attempt:
+            return send(attempt.model, **attempt.options)
+
+Le modèle qui a répondu est noté pour les enregistrements ouverts par
+recording() dans le thread courant (Summary.model).
+"""
+
+import logging
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from . import client, limiter
+
+logger = logging.getLogger(__name__)
+
+SUMMARY = "summary"
+GLOBAL = "global"
+EXTRACTION = "extraction"
+
+_local = threading.local()
+
+
+def route(task: str) -> dict:
+    """Route configurée pour `task` (clé de IA_CHAT_MODELS)."""
+    return settings.IA_CHAT_MODELS[task]
+
+
+def models(task: str) -> list[str]:
+    """Modèles de la route de `task`, principal d'abord (pour les versions de consignes)."""
+    config = route(task)
+    return [config["model"], *filter(None, [config.get("fallback")])]
+
+
+def circuit_key(model: str) -> str:
+    return f"chat:{model}"
+
+
+@contextmanager
+def recording() -> Iterator[list[str]]:
+    """Collecte les modèles qui ont répondu dans ce thread, dans l'ordre des appels."""
+    used: list[str] = []
+    previous = getattr(_local, "used", None)
+    _local.used = used
+    try:
+        yield used
+    finally:
+        _local.used = previous
+
+
+def _record(model: str) -> None:
+    used = getattr(_local, "used", None)
+    if used is not None:
+        used.append(model)
+
+
+@dataclass
+class Attempt:
+    """Essai d'un modèle ; le bloc `with` avale les erreurs qui justifient le repli."""
+
+    model: str
+    options: dict = field(default_factory=dict)
+    fallback: str = ""
+
+    def __enter__(self) -> "Attempt":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is None:
+            if self.fallback:
+                limiter.record_success(circuit_key(self.model))
+            _record(self.model)
+            return False
+        if not self.fallback or not client.is_transient(exc):
+            return False
+        logger.warning("Modèle %s indisponible (%s), repli sur %s", self.model, exc, self.fallback)
+        limiter.record_failure(circuit_key(self.model))
+        return True
+
+
+def attempts(task: str) -> Iterator[Attempt]:
+    """Essais successifs pour `task` : le principal, puis le repli si besoin.
+
+    Le principal est appelé sans nouvelles tentatives et avec le délai de
+    lecture de sa route ; il est sauté tant que son disjoncteur est ouvert.
+    """
+    config = route(task)
+    primary, fallback = config["model"], config.get("fallback") or ""
+    if not fallback or fallback == primary:
+        yield Attempt(primary)
+        return
+    if limiter.is_open(circuit_key(primary)):
+        logger.info("Disjoncteur ouvert pour %s, appel direct à %s", primary, fallback)
+    else:
+        options = {"retries": False}
+        if config.get("timeout"):
+            options["timeout"] = (settings.IA_HTTP_TIMEOUTS["chat"][0], config["timeout"])
+        yield Attempt(primary, options, fallback=fallback)
+    yield Attempt(fallback)
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from wagtail.documents import get_document_model
+
+from .models import ExtractedPage, ExtractedText, ExtractionFailure, TextChunk
+from .tasks import extract_document_task, refresh_digests_task
+
+
+@receiver(post_save, sender=get_document_model())
+def purge_stale_extracted_texts(sender, instance, **kwargs):
+    """Supprime les textes, pages, passages indexés et échecs d'une ancienne version du fichier."""
+    if not instance.file_hash:
+        return
+    for model in (ExtractedText, ExtractedPage, TextChunk, ExtractionFailure):
+        model.objects.filter(document=instance).exclude(
+            file_hash=instance.file_hash,
+        ).delete()
+
+
+@receiver(post_save, sender=get_document_model())
+def queue_text_extraction(sender, instance, update_fields=None, **kwargs):
+    """Met en file l'extraction du texte d'un document ajouté ou dont le fichier a changé.
+
+    Les enregistrements partiels sans le fichier (ex. calcul de l'empreinte)
+    et les documents dont le texte courant est déjà extrait sont ignorés.
+    """
+    if not settings.IA_EXTRACT_ON_UPLOAD:
+        return
+    if update_fields is not None and "file" not in update_fields:
+        return
+    if instance.file_hash and ExtractedText.objects.filter(
+        document=instance,
+        file_hash=instance.file_hash,
+    ).exists():
+        return
+
+    extract_document_task.enqueue(
+        instance.pk,
+        summarize=settings.IA_SUMMARIZE_ON_UPLOAD,
+        fields=settings.IA_EXTRACT_FIELDS_ON_UPLOAD,
+    )
+
+
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+def queue_digest_refresh(sender, instance, update_fields=None, **kwargs):
+    """Met en file la mise à jour des synthèses de la collection d'un document
+    ajouté, modifié ou supprimé.
+
+    La tâche part après IA_DIGEST_REFRESH_DELAY (si le backend sait différer) :
+    un envoi de documents en lot ne recalcule qu'une fois les mois touchés.
+    Les petites collections (moins de IA_DIGEST_MIN_DOCUMENTS documents) sont
+    laissées à l'analyse globale, qui les met à jour au besoin.
+    """
+    if not settings.IA_DIGESTS:
+        return
+    if update_fields is not None and set(update_fields) <= {"file_hash"}:
+        return
+    members = sender.objects.filter(collection_id=instance.collection_id).count()
+    if members < settings.IA_DIGEST_MIN_DOCUMENTS:
+        return
+
+    task = refresh_digests_task
+    if task.get_backend().supports_defer:
+        task = task.using(
+            run_after=timezone.now() + timedelta(seconds=settings.IA_DIGEST_REFRESH_DELAY),
+        )
+    task.enqueue(instance.collection_id)
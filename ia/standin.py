@@ -0,0 +1,190 @@
+"""Serveur local imitant les endpoints OCR et chat de Mistral.
+
+Sert aux mesures de performance et aux tests de charge sans consommer de
+crédit API : latence, taux d'erreur et rafales de 429 sont configurables.
+En mode enregistrement, les requêtes sont relayées vers la vraie API et les
+réponses sauvegardées ; en mode rejeu, ces réponses sont resservies à
+l'identique (clé = empreinte du chemin et du corps de la requête).
+"""
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+LOREM = (
+    "Facture n° 2024-{n} émise par Fournisseur {n} pour l'association, "
+    "montant total 1{n}5,40 € TTC, échéance au 15 du mois suivant. "
+)
+
+
+@dataclass
+class StandinConfig:
+    latency: float = 0.0  # secondes, avant chaque réponse
+    jitter: float = 0.0  # secondes ajoutées au hasard (0..jitter)
+    error_rate: float = 0.0  # proportion de réponses 500
+    burst_every: int = 0  # une rafale de 429 toutes les N requêtes (0 = jamais)
+    burst_length: int = 0  # nombre de 429 consécutifs par rafale
+    retry_after: int = 1  # en-tête Retry-After des 429, en secondes
+    uplink_kbps: float = 0.0  # débit montant simulé, en kbit/s (0 = illimité)
+    ocr_chars: int = 1500  # taille du texte simulé par page OCR
+    chat_chars: int = 400  # taille de la réponse simulée du chat
+    upstream: str = ""  # URL de base de la vraie API (mode enregistrement)
+    record_dir: Path | None = None
+    replay_dir: Path | None = None
+    seed: int | None = None
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StandinConfig):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.requests_count = 0
+        self._lock = threading.Lock()
+
+    def next_request(self) -> tuple[int, float, bool]:
+        """Numéro de la requête, latence à simuler et tirage d'erreur (thread-safe)."""
+        with self._lock:
+            self.requests_count += 1
+            delay = self.config.latency + self.random.uniform(0, self.config.jitter)
+            failed = self.random.random() < self.config.error_rate
+            return self.requests_count, delay, failed
+
+    def in_burst(self, number: int) -> bool:
+        every, length = self.config.burst_every, self.config.burst_length
+        return bool(every and length) and (number - 1) % every < length
+
+
+def _filler(chars: int, seed: int) -> str:
+    text = ""
+    while len(text) < chars:
+        text += LOREM.format(n=seed + len(text) // len(LOREM))
+    return text[:chars].strip()
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server: StandinServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("standin: " + format, *args)
+
+    def _send(self, status: int, body: bytes, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict, headers=None):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        config = self.server.config
+        number, delay, failed = self.server.next_request()
+
+        if self.server.in_burst(number):
+            return self._send_json(
+                429,
+                {"message": "Requests rate limit exceeded"},
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if config.uplink_kbps:
+            # Temps d'envoi du corps sur un lien montant lent.
+            delay += len(body) * 8 / (config.uplink_kbps * 1000)
+        time.sleep(delay)
+        if failed:
+            return self._send_json(500, {"message": "Erreur simulée"})
+
+        key = hashlib.sha256(self.path.encode() + b"\x1f" + body).hexdigest()
+        if config.replay_dir and (config.replay_dir / f"{key}.json").exists():
+            return self._replay(config.replay_dir / f"{key}.json")
+        if config.upstream:
+            return self._forward(body, key)
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._send_json(400, {"message": "JSON invalide"})
+        if self.path.endswith("/ocr"):
+            return self._send_json(200, self._ocr(payload))
+        if self.path.endswith("/chat/completions"):
+            return self._chat(payload)
+        return self._send_json(404, {"message": f"Endpoint inconnu : {self.path}"})
+
+    # -- Réponses simulées -------------------------------------------------
+
+    def _ocr(self, payload: dict) -> dict:
+        indexes = payload.get("pages") or [0]
+        chars = self.server.config.ocr_chars
+        return {
+            "model": payload.get("model"),
+            "pages": [
+                {"index": index, "markdown": f"Page {index + 1}\n\n{_filler(chars, index)}"}
+                for index in indexes
+            ],
+        }
+
+    def _chat(self, payload: dict):
+        answer = _filler(self.server.config.chat_chars, len(payload.get("messages", [])))
+        if not payload.get("stream"):
+            return self._send_json(200, {
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(answer) // 4},
+            })
+        events = [
+            "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": word + " "}}]})
+            for word in answer.split()
+        ] + ["data: [DONE]"]
+        self._send(200, "\n\n".join(events).encode() + b"\n\n", content_type="text/event-stream")
+
+    # -- Enregistrement / rejeu --------------------------------------------
+
+    def _replay(self, path: Path):
+        recorded = json.loads(path.read_text())
+        self._send(
+            recorded["status"],
+            recorded["body"].encode(),
+            content_type=recorded["content_type"],
+        )
+
+    def _forward(self, body: bytes, key: str):
+        config = self.server.config
+        response = requests.post(
+            config.upstream.rstrip("/") + self.path,
+            data=body,
+            headers={
+                "Authorization": self.headers.get("Authorization", ""),
+                "Content-Type": "application/json",
+            },
+            timeout=300,
+        )
+        content_type = response.headers.get("Content-Type", "application/json")
+        if config.record_dir and response.ok:
+            config.record_dir.mkdir(parents=True, exist_ok=True)
+            (config.record_dir / f"{key}.json").write_text(json.dumps({
+                "status": response.status_code,
+                "content_type": content_type,
+                "body": response.text,
+            }))
+        self._send(response.status_code, response.content, content_type=content_type)
+
+
+def make_server(host: str, port: int, config: StandinConfig) -> StandinServer:
+    return StandinServer((host, port), config)
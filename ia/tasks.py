@@ -0,0 +1,96 @@
+"""Tâches de fond IA (django-tasks, backend « ia »)."""
+
+import logging
+
+from django_tasks import task
+from wagtail.documents import get_document_model
+from wagtail.models import Collection
+
+from . import limiter, routing
+from . import utils as ai_utils
+from .models import Summary
+
+logger = logging.getLogger(__name__)
+
+FAILURE_MSG = "L'analyse a échoué, merci de réessayer plus tard."
+
+
+def _run(summary: Summary, func, *args) -> None:
+    """Exécute l'appel IA et enregistre son résultat (ou l'échec) sur le Summary.
+
+    Le modèle noté est celui du dernier appel au chat : celui qui a produit
+    la réponse.
+    """
+    with routing.recording() as models:
+        try:
+            summary.content = func(*args)
+            summary.status = Summary.Status.DONE
+        except (ai_utils.DocumentTooLarge, limiter.ServiceUnavailable) as exc:
+            summary.content = str(exc)
+            summary.status = Summary.Status.FAILED
+        except Exception:
+            logger.exception("Échec de l'analyse IA (Summary #%s)", summary.pk)
+            summary.content = FAILURE_MSG
+            summary.status = Summary.Status.FAILED
+    summary.model = models[-1] if models else ""
+    summary.lock_key = None
+    summary.save(update_fields=["content", "status", "complete", "model", "lock_key"])
+
+
+@task(backend="ia")
+def extract_document_task(document_id: int, summarize: bool = False, fields: bool = False) -> None:
+    """Extrait (et met en cache) le texte d'un document, puis si demandé ses
+    champs de facture et son résumé.
+
+    Lancée à l'ajout d'un document ou au remplacement de son fichier.
+    """
+    document = get_document_model().objects.filter(pk=document_id).first()
+    if document is None:
+        return  # supprimé entre-temps
+
+    ai_utils.extract_text(document)
+
+    file_hash = document.get_file_hash()
+    if fields and ai_utils.current_invoice_fields(document, file_hash) is None:
+        try:
+            ai_utils.extract_invoice_fields(document)
+        except Exception:
+            logger.exception("Échec de l'extraction des champs de facture (document #%s)", document.pk)
+
+    if summarize and ai_utils.current_summary(document, file_hash) is None:
+        summary, claimed = ai_utils.claim_summary(document, file_hash)
+        if claimed:
+            _run(summary, ai_utils.summarize_document, document)
+
+
+@task(backend="ia")
+def summarize_document_task(summary_id: int) -> None:
+    """Résume le document d'un Summary en attente."""
+    summary = Summary.objects.select_related("document").get(pk=summary_id)
+    pages = ai_utils.parse_pages(summary.pages)
+    _run(summary, ai_utils.summarize_document, summary.document, pages)
+
+
+@task(backend="ia")
+def global_analyze_task(summary_id: int) -> None:
+    """Répond à la question d'un Summary global en attente."""
+    summary = Summary.objects.get(pk=summary_id)
+    documents = ai_utils.documents_to_analyze(summary.scope)
+    pages = ai_utils.parse_pages(summary.pages)
+
+    def analyze(*args) -> str:
+        # Une réponse bâtie sur des documents illisibles n'est pas mise en cache.
+        with ai_utils.unreadable_documents() as unreadable:
+            answer = ai_utils.analyze_all_documents(*args)
+        summary.complete = not unreadable
+        return answer
+
+    _run(summary, analyze, documents, summary.query, pages, summary.scope)
+
+
+@task(backend="ia")
+def refresh_digests_task(collection_id: int) -> None:
+    """Met à jour les synthèses (Digest) d'une collection dont un document a changé."""
+    collection = Collection.objects.filter(pk=collection_id).first()
+    if collection is not None:
+        ai_utils.refresh_digests(collection)
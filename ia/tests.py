@@ -1,11 +1,16 @@
-import io
-from unittest.mock import MagicMock, patch
+import threading
+import json
+from pathlib import Path
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
-from ia.models import Summary
+from core.models import CustomDocument
+from ia.models import ExtractedText, Summary
+from ia.tasks import FAILURE_MSG
 from ia.utils import UNREADABLE_MSG
 
 
@@ -13,19 +18,79 @@ from ia.utils import UNREADABLE_MSG
 # Helpers
 # ---------------------------------------------------------------------------
 
+# Les tâches IA s'exécutent au commit, sans worker, pendant les tests.
+IMMEDIATE_TASKS = {
+    "default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"},
+    "ia": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"},
+}
+
+
 def _make_moderator(username="mod"):
     return User.objects.create_user(
         username=username, password="pass", is_superuser=True
     )
 
 
-def _make_fake_document(title="Facture test", date=None, file_path="/tmp/test.pdf"):
-    """Retourne un objet document factice (pas en BDD) pour les tests utils."""
-    doc = MagicMock()
-    doc.title = title
-    doc.document_date = date
-    doc.file.path = file_path
-    return doc
+def _make_document(title="Facture test", date=None, content=b"%PDF fake", name="test.pdf"):
+    """Crée un document en BDD ; les appels Mistral restent mockés par les tests."""
+    return CustomDocument.objects.create(
+        title=title,
+        document_date=date,
+        file=SimpleUploadedFile(name, content),
+    )
+
+
+def _make_pdf(pages: list[str]) -> bytes:
+    """PDF minimal avec une couche texte par page (chaîne vide = page scannée)."""
+    from io import BytesIO
+
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for text in pages:
+        page = writer.add_blank_page(width=595, height=842)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+        })
+        content = DecodedStreamObject()
+        if text:
+            content.set_data(f"BT /F1 12 Tf 72 760 Td ({text}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _make_photo(size=(3000, 4000), fmt="JPEG") -> bytes:
+    """Photo couleur bruitée (peu compressible), comme une photo de téléphone."""
+    import random
+    from io import BytesIO
+
+    from PIL import Image
+
+    rng = random.Random(1)
+    image = Image.frombytes("RGB", (300, 400), rng.randbytes(300 * 400 * 3)).resize(size)
+    output = BytesIO()
+    image.save(output, fmt, quality=95)
+    return output.getvalue()
+
+
+def _make_scanned_pdf(pages: int = 1) -> bytes:
+    """PDF sans couche texte, une photo couleur pleine page par page."""
+    from io import BytesIO
+
+    from PIL import Image
+
+    photo = Image.open(BytesIO(_make_photo()))
+    output = BytesIO()
+    photo.save(output, "PDF", save_all=True, append_images=[photo] * (pages - 1), quality=95)
+    return output.getvalue()
 
 
 # ---------------------------------------------------------------------------
@@ -35,10 +100,9 @@ def _make_fake_document(title="Facture test", date=None, file_path="/tmp/test.pd
 class SummarizeDocumentUtilsTests(TestCase):
 
     def _call(self, ocr_text, chat_response="Résumé factice"):
-        doc = _make_fake_document()
+        doc = _make_document()
         with (
-            patch("ia.utils.Path.read_bytes", return_value=b"%PDF fake"),
-            patch("ia.utils._call_ocr", return_value=ocr_text) as mock_ocr,
+            patch("ia.utils._call_ocr", return_value={1: ocr_text}) as mock_ocr,
             patch("ia.utils._call_chat", return_value=chat_response) as mock_chat,
         ):
             from ia.utils import summarize_document
@@ -87,12 +151,11 @@ class SummarizeDocumentUtilsTests(TestCase):
         self._call(ocr_text=long_text)
         # On vérifie que le texte OCR est inclus dans le message envoyé au chat
         with (
-            patch("ia.utils.Path.read_bytes", return_value=b"%PDF fake"),
-            patch("ia.utils._call_ocr", return_value=long_text),
+            patch("ia.utils._call_ocr", return_value={1: long_text}),
             patch("ia.utils._call_chat", return_value="ok") as mock_chat,
         ):
             from ia.utils import summarize_document
-            summarize_document(_make_fake_document())
+            summarize_document(_make_document())
 
         call_messages = mock_chat.call_args[0][0]
         user_msg = next(m for m in call_messages if m["role"] == "user")
@@ -111,11 +174,9 @@ class AnalyzeAllDocumentsUtilsTests(TestCase):
         When on appelle analyze_all_documents
         Then aucune exception n'est levée et le chat reçoit un contexte mentionnant « introuvable »
         """
-        doc = _make_fake_document()
-        with (
-            patch("ia.utils.Path.read_bytes", side_effect=FileNotFoundError),
-            patch("ia.utils._call_chat", return_value="réponse") as mock_chat,
-        ):
+        doc = _make_document()
+        doc.file.storage.delete(doc.file.name)
+        with patch("ia.utils._call_chat", return_value="réponse") as mock_chat:
             from ia.utils import analyze_all_documents
             result = analyze_all_documents([doc], query="Quelles factures ?")
 
@@ -131,10 +192,9 @@ class AnalyzeAllDocumentsUtilsTests(TestCase):
         When on appelle analyze_all_documents
         Then le contexte envoyé au chat contient « [contenu illisible] »
         """
-        doc = _make_fake_document()
+        doc = _make_document()
         with (
-            patch("ia.utils.Path.read_bytes", return_value=b"%PDF fake"),
-            patch("ia.utils._call_ocr", return_value="court"),
+            patch("ia.utils._call_ocr", return_value={1: "court"}),
             patch("ia.utils._call_chat", return_value="réponse") as mock_chat,
         ):
             from ia.utils import analyze_all_documents
@@ -150,11 +210,10 @@ class AnalyzeAllDocumentsUtilsTests(TestCase):
         When on appelle analyze_all_documents avec une question
         Then le contexte envoyé au chat contient le titre du document et la question
         """
-        doc = _make_fake_document(title="Facture EDF mai 2026")
+        doc = _make_document(title="Facture EDF mai 2026")
         ocr_text = "Facture EDF — 01/05/2026 — 120,00 € TTC pour l'association CDF"
         with (
-            patch("ia.utils.Path.read_bytes", return_value=b"%PDF fake"),
-            patch("ia.utils._call_ocr", return_value=ocr_text),
+            patch("ia.utils._call_ocr", return_value={1: ocr_text}),
             patch("ia.utils._call_chat", return_value="ok") as mock_chat,
         ):
             from ia.utils import analyze_all_documents
@@ -166,10 +225,269 @@ class AnalyzeAllDocumentsUtilsTests(TestCase):
         self.assertIn("Quelles factures ?", user_msg["content"])
 
 
+    def test_parallel_ocr_keeps_order_and_isolates_failures(self):
+        """
+        Given trois documents dont le deuxième fait échouer l'OCR
+        When on appelle analyze_all_documents
+        Then les deux autres sont analysés et le contexte respecte l'ordre reçu
+        """
+        docs = [
+            _make_document(title=f"Doc {i}", content=f"%PDF contenu {i}".encode())
+            for i in range(3)
+        ]
+
+        def fake_ocr(file_path, **options):
+            content = file_path.read_text()
+            if content.endswith("1"):
+                raise TimeoutError
+            return {1: f"Texte lisible du document, suffisamment long : {content}"}
+
+        with (
+            patch("ia.utils._call_ocr", side_effect=fake_ocr),
+            patch("ia.utils._call_chat", return_value="ok") as mock_chat,
+        ):
+            from ia.utils import analyze_all_documents
+            analyze_all_documents(docs, query="Quelles factures ?")
+
+        user_msg = mock_chat.call_args[0][0][1]["content"]
+        self.assertLess(user_msg.index("Doc 0"), user_msg.index("Doc 1"))
+        self.assertLess(user_msg.index("Doc 1"), user_msg.index("Doc 2"))
+        self.assertIn("%PDF contenu 0", user_msg)
+        self.assertIn("%PDF contenu 2", user_msg)
+        self.assertIn("[fichier introuvable ou illisible]", user_msg)
+
+    @override_settings(IA_GLOBAL_OCR_TIMEOUT=0.2)
+    def test_global_deadline_skips_slow_documents(self):
+        """
+        Given un document dont l'OCR ne répond pas avant le délai global
+        When on appelle analyze_all_documents
+        Then l'analyse aboutit sans l'attendre et le document lent est marqué illisible
+        """
+        release = threading.Event()
+        fast = _make_document(title="Rapide", content=b"%PDF rapide")
+        slow = _make_document(title="Lent", content=b"%PDF lent")
+
+        def fake_ocr(file_path, **options):
+            if file_path.read_bytes() == b"%PDF lent":
+                release.wait(5)
+            return {1: "Texte lisible du document rapide, largement assez long"}
+
+        try:
+            with (
+                patch("ia.utils._call_ocr", side_effect=fake_ocr),
+                patch("ia.utils._call_chat", return_value="ok") as mock_chat,
+            ):
+                from ia.utils import analyze_all_documents
+                analyze_all_documents([fast, slow], query="Quelles factures ?")
+        finally:
+            release.set()
+
+        user_msg = mock_chat.call_args[0][0][1]["content"]
+        self.assertIn("document rapide", user_msg)
+        self.assertIn("Lent (date : inconnue) ---\n[fichier introuvable ou illisible]", user_msg)
+        self.assertFalse(ExtractedText.objects.filter(document=slow).exists())
+
+
+# ---------------------------------------------------------------------------
+# Tests : ia.utils.extract_text (cache OCR)
+# ---------------------------------------------------------------------------
+
+class ExtractTextCacheTests(TestCase):
+
+    OCR_TEXT = "Facture EDF — 01/05/2026 — montant : 120,00 € TTC pour l'association"
+
+    def test_second_call_uses_cache(self):
+        """
+        Given un document déjà OCR-isé une première fois
+        When on appelle extract_text une seconde fois sur le même fichier
+        Then l'OCR distant n'est appelé qu'une seule fois et le texte est identique
+        """
+        from ia.utils import extract_text
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}) as mock_ocr:
+            first = extract_text(doc)
+            second = extract_text(doc)
+
+        self.assertEqual(first, self.OCR_TEXT)
+        self.assertEqual(second, self.OCR_TEXT)
+        mock_ocr.assert_called_once()
+        self.assertEqual(ExtractedText.objects.filter(document=doc).count(), 1)
+
+    def test_replaced_file_invalidates_cache(self):
+        """
+        Given un document dont le texte est en cache
+        When son fichier est remplacé puis qu'on rappelle extract_text
+        Then l'OCR distant est rappelé et l'ancien texte est purgé
+        """
+        from ia.utils import extract_text
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}):
+            extract_text(doc)
+
+        doc.file = SimpleUploadedFile("nouveau.pdf", b"%PDF nouvelle version")
+        doc._set_document_file_metadata()
+        doc.save()
+        self.assertEqual(ExtractedText.objects.filter(document=doc).count(), 0)
+
+        with patch("ia.utils._call_ocr", return_value={1: "Nouveau texte " * 5}) as mock_ocr:
+            text = extract_text(doc)
+
+        mock_ocr.assert_called_once()
+        self.assertEqual(text, ("Nouveau texte " * 5).strip())
+
+
+# ---------------------------------------------------------------------------
+# Tests : ia.retrieval (index BM25)
+# ---------------------------------------------------------------------------
+
+class RetrievalTests(TestCase):
+
+    EDF = "Facture EDF\n\nConsommation électricité du local : 120,00 € TTC"
+    SAUR = "Facture SAUR\n\nConsommation d'eau de la salle des fêtes : 45,00 € TTC"
+
+    def test_tokenize_normalizes_terms(self):
+        """
+        Given un texte avec majuscules, accents, pluriels et mots vides
+        When on le découpe en termes
+        Then les termes sont normalisés et les mots vides écartés
+        """
+        from ia.retrieval import tokenize
+
+        self.assertEqual(
+            tokenize("Les Factures d'Électricité de 2025"),
+            ["facture", "electricite", "2025"],
+        )
+
+    def test_search_ranks_matching_chunk_first(self):
+        """
+        Given deux documents indexés (électricité et eau)
+        When on cherche « électricité »
+        Then seul le passage du document EDF est retourné
+        """
+        from ia.retrieval import index_document, search
+
+        edf = _make_document(title="EDF", content=b"%PDF edf")
+        saur = _make_document(title="SAUR", content=b"%PDF saur")
+        for doc, text in ((edf, self.EDF), (saur, self.SAUR)):
+            index_document(doc, doc.get_file_hash(), [(1, text)])
+
+        chunks = search("Combien pour l'électricité ?", [edf, saur], top_k=5)
+
+        self.assertEqual([chunk.document for chunk in chunks], [edf])
+
+    def test_search_ignores_stale_file_versions(self):
+        """
+        Given un document indexé puis dont le fichier est remplacé
+        When on cherche un terme de l'ancienne version
+        Then aucun passage n'est retourné
+        """
+        from ia.retrieval import index_document, search
+
+        doc = _make_document(content=b"%PDF v1")
+        index_document(doc, doc.get_file_hash(), [(1, self.EDF)])
+
+        doc.file = SimpleUploadedFile("v2.pdf", b"%PDF v2")
+        doc._set_document_file_metadata()
+        doc.save()
+
+        self.assertEqual(search("électricité", [doc], top_k=5), [])
+
+    @override_settings(IA_RETRIEVAL_TOP_K=1)
+    def test_global_analysis_sends_only_relevant_chunks(self):
+        """
+        Given deux documents lisibles dont un seul concerne la question
+        When on appelle analyze_all_documents
+        Then seul l'extrait pertinent est envoyé au chat
+        """
+        edf = _make_document(title="EDF", content=b"%PDF edf")
+        saur = _make_document(title="SAUR", content=b"%PDF saur")
+        texts = {b"%PDF edf": self.EDF, b"%PDF saur": self.SAUR}
+
+        with (
+            patch("ia.utils._call_ocr", side_effect=lambda file_path, **options: {1: texts[file_path.read_bytes()]}),
+            patch("ia.utils._call_chat", return_value="ok") as mock_chat,
+        ):
+            from ia.utils import analyze_all_documents
+            analyze_all_documents([edf, saur], query="Quel montant pour l'eau ?")
+
+        user_msg = mock_chat.call_args[0][0][1]["content"]
+        self.assertIn("salle des fêtes", user_msg)
+        self.assertNotIn("électricité", user_msg)
+        self.assertIn("extrait", user_msg)
+
+
+# ---------------------------------------------------------------------------
+# Tests : map-reduce des analyses globales volumineuses
+# ---------------------------------------------------------------------------
+
+@override_settings(IA_RETRIEVAL_TOP_K=0, IA_CONTEXT_TOKEN_BUDGET=30, IA_BATCH_MAX_DOCUMENTS=10)
+class MapReduceTests(TestCase):
+
+    def test_plan_batches_respects_budget_and_order(self):
+        """
+        Given des sections dont une dépasse à elle seule le budget
+        When on planifie les lots
+        Then aucun lot ne dépasse le budget, l'ordre est conservé et l'en-tête répété
+        """
+        from ia.utils import CHARS_PER_TOKEN, plan_batches
+
+        parts = ["--- A ---\n" + "a" * 50, "--- B ---\n" + "b" * 300, "--- C ---\n" + "c" * 10]
+        batches = plan_batches(parts, budget=30, max_documents=10)
+
+        for batch in batches:
+            self.assertLessEqual(sum(len(piece) for piece in batch), 30 * CHARS_PER_TOKEN)
+        flat = [piece for batch in batches for piece in batch]
+        self.assertTrue(flat[0].startswith("--- A ---"))
+        self.assertTrue(flat[-1].startswith("--- C ---"))
+        self.assertGreater(sum(piece.startswith("--- B ---") for piece in flat), 1)
+
+    def test_plan_batches_limits_documents_per_batch(self):
+        """
+        Given cinq petites sections et au plus deux documents par lot
+        When on planifie les lots
+        Then on obtient trois lots
+        """
+        from ia.utils import plan_batches
+
+        batches = plan_batches([f"--- {i} ---\nx" for i in range(5)], budget=1000, max_documents=2)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+
+    @override_settings(IA_CONTEXT_TOKEN_BUDGET=50)
+    def test_oversized_context_is_mapped_then_reduced_with_cache(self):
+        """
+        Given trois documents qui tiennent chacun dans le budget, mais pas ensemble
+        When on lance deux fois la même analyse globale
+        Then la première fait une analyse par lot puis une fusion,
+        la seconde ne rappelle le modèle que pour la fusion
+        """
+        docs = [_make_document(title=f"Doc {i}", content=f"%PDF {i}".encode()) for i in range(3)]
+        ocr_text = "Facture fournisseur — montant 100,00 € — " + "détail " * 10
+
+        def run():
+            with (
+                patch("ia.utils._call_ocr", return_value={1: ocr_text}),
+                patch("ia.utils._call_chat", return_value="partiel") as mock_chat,
+            ):
+                from ia.utils import analyze_all_documents
+                analyze_all_documents(docs, query="Total ?")
+            return mock_chat
+
+        first = run()
+        self.assertEqual(first.call_count, 4)
+        reduce_msg = first.call_args[0][0][1]["content"]
+        self.assertIn("Analyse partielle 3", reduce_msg)
+
+        second = run()
+        self.assertEqual(second.call_count, 1)
+
+
 # ---------------------------------------------------------------------------
 # Tests : vue summarize_document
 # ---------------------------------------------------------------------------
 
+@override_settings(TASKS=IMMEDIATE_TASKS)
 class SummarizeDocumentViewTests(TestCase):
 
     def setUp(self):
@@ -179,25 +497,134 @@ class SummarizeDocumentViewTests(TestCase):
     def _post(self, doc_id=1):
         return self.client.post(reverse("ia:summarize_document", args=[doc_id]))
 
-    def test_creates_summary_in_db(self):
+    def test_returns_pending_summary_that_polls(self):
+        """
+        Given un modérateur authentifié
+        When il poste sur la vue summarize_document sans que la tâche ait tourné
+        Then un Summary « en cours » est créé et le partial interroge son statut
+        """
+        doc = _make_document()
+        response = self._post(doc_id=doc.pk)
+
+        self.assertEqual(response.status_code, 200)
+        summary = Summary.objects.get(document=doc)
+        self.assertEqual(summary.status, Summary.Status.PENDING)
+        self.assertContains(response, reverse("ia:summary_status", args=[summary.pk]))
+        self.assertContains(response, 'hx-trigger="every 2s"')
+
+    def test_task_completes_summary(self):
         """
         Given un modérateur authentifié
-        When il poste sur la vue summarize_document pour un document existant
-        Then un objet Summary est créé en BDD avec le contenu généré par l'IA
+        When il poste sur la vue summarize_document et que la tâche s'exécute
+        Then le Summary est complété avec le contenu généré par l'IA
         """
+        doc = _make_document()
         with (
-            patch("ia.views.get_object_or_404") as mock_get,
-            patch("ia.views.ai_utils.summarize_document", return_value="Résumé IA"),
-            patch("ia.views.Summary.objects.create") as mock_create,
+            patch("ia.tasks.ai_utils.summarize_document", return_value="Résumé IA"),
+            self.captureOnCommitCallbacks(execute=True),
         ):
-            mock_get.return_value = MagicMock(pk=1)
-            mock_create.return_value = MagicMock(content="Résumé IA")
-            response = self._post(doc_id=1)
+            self._post(doc_id=doc.pk)
 
-        self.assertEqual(response.status_code, 200)
-        mock_create.assert_called_once()
-        _, kwargs = mock_create.call_args
-        self.assertEqual(kwargs["content"], "Résumé IA")
+        summary = Summary.objects.get(document=doc)
+        self.assertEqual(summary.status, Summary.Status.DONE)
+        self.assertEqual(summary.content, "Résumé IA")
+
+    def test_task_failure_marks_summary_failed(self):
+        """
+        Given un appel Mistral qui lève une exception
+        When la tâche de résumé s'exécute
+        Then le Summary passe en échec avec un message lisible
+        """
+        doc = _make_document()
+        with (
+            patch("ia.tasks.ai_utils.summarize_document", side_effect=RuntimeError),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self._post(doc_id=doc.pk)
+
+        summary = Summary.objects.get(document=doc)
+        self.assertEqual(summary.status, Summary.Status.FAILED)
+        self.assertEqual(summary.content, FAILURE_MSG)
+
+    def test_repeat_request_reuses_existing_summary(self):
+        """
+        Given un résumé déjà généré pour ce fichier et ces consignes
+        When le modérateur clique à nouveau sur « Résumer »
+        Then le résumé existant est renvoyé sans nouvelle tâche
+        """
+        from ia.utils import SUMMARY_PROMPT_VERSION
+
+        doc = _make_document()
+        Summary.objects.create(
+            document=doc,
+            content="Résumé existant",
+            file_hash=doc.get_file_hash(),
+            prompt_version=SUMMARY_PROMPT_VERSION,
+        )
+        with patch("ia.views.tasks.summarize_document_task") as mock_task:
+            response = self._post(doc_id=doc.pk)
+
+        self.assertContains(response, "Résumé existant")
+        self.assertEqual(Summary.objects.filter(document=doc).count(), 1)
+        mock_task.enqueue.assert_not_called()
+
+    def test_force_refresh_bypasses_existing_summary(self):
+        """
+        Given un résumé déjà généré pour ce fichier et ces consignes
+        When le modérateur demande « Régénérer » (force=1)
+        Then un nouveau résumé est mis en file
+        """
+        from ia.utils import SUMMARY_PROMPT_VERSION
+
+        doc = _make_document()
+        Summary.objects.create(
+            document=doc,
+            content="Résumé existant",
+            file_hash=doc.get_file_hash(),
+            prompt_version=SUMMARY_PROMPT_VERSION,
+        )
+        with patch("ia.views.tasks.summarize_document_task") as mock_task:
+            self.client.post(
+                reverse("ia:summarize_document", args=[doc.pk]),
+                data={"force": "1"},
+            )
+
+        self.assertEqual(Summary.objects.filter(document=doc).count(), 2)
+        mock_task.enqueue.assert_called_once()
+
+    def test_prompt_change_invalidates_existing_summary(self):
+        """
+        Given un résumé généré avec une ancienne version des consignes
+        When le modérateur clique sur « Résumer »
+        Then un nouveau résumé est mis en file avec la version courante
+        """
+        from ia.utils import SUMMARY_PROMPT_VERSION
+
+        doc = _make_document()
+        Summary.objects.create(
+            document=doc,
+            content="Ancien résumé",
+            file_hash=doc.get_file_hash(),
+            prompt_version="ancienne",
+        )
+        with patch("ia.views.tasks.summarize_document_task"):
+            self._post(doc_id=doc.pk)
+
+        latest = Summary.objects.filter(document=doc).first()
+        self.assertEqual(latest.prompt_version, SUMMARY_PROMPT_VERSION)
+        self.assertEqual(latest.status, Summary.Status.PENDING)
+
+    def test_status_view_stops_polling_when_done(self):
+        """
+        Given un Summary terminé
+        When le partial interroge la vue summary_status
+        Then le contenu est affiché sans déclencheur de polling
+        """
+        summary = Summary.objects.create(document=_make_document(), content="Résumé fini")
+        response = self.client.get(reverse("ia:summary_status", args=[summary.pk]))
+
+        self.assertContains(response, "Résumé fini")
+        self.assertNotContains(response, "hx-trigger")
 
     def test_requires_login(self):
         """
@@ -223,6 +650,7 @@ class SummarizeDocumentViewTests(TestCase):
 # Tests : vue global_analyze
 # ---------------------------------------------------------------------------
 
+@override_settings(TASKS=IMMEDIATE_TASKS)
 class GlobalAnalyzeViewTests(TestCase):
 
     def setUp(self):
@@ -250,15 +678,20 @@ class GlobalAnalyzeViewTests(TestCase):
         self.assertContains(response, "saisir une question")
         self.assertEqual(Summary.objects.count(), 0)
 
+    @override_settings(IA_STREAM_GLOBAL_ANALYSIS=False)
     def test_valid_query_creates_summary(self):
         """
         Given un modérateur authentifié
         When il poste une question valide sur global_analyze
         Then un Summary est créé en BDD avec la question et la réponse de l'IA
         """
-        with patch(
-            "ia.views.ai_utils.analyze_all_documents",
-            return_value="Voici une synthèse des achats.",
+        _make_document()
+        with (
+            patch(
+                "ia.tasks.ai_utils.analyze_all_documents",
+                return_value="Voici une synthèse des achats.",
+            ),
+            self.captureOnCommitCallbacks(execute=True),
         ):
             response = self.client.post(
                 reverse("ia:global_analyze"),
@@ -294,3 +727,2946 @@ class GlobalAnalyzeViewTests(TestCase):
         )
         self.assertNotEqual(response.status_code, 200)
 
+
+
+# ---------------------------------------------------------------------------
+# Tests : cache des réponses de l'analyse globale
+# ---------------------------------------------------------------------------
+
+@override_settings(TASKS=IMMEDIATE_TASKS, IA_STREAM_GLOBAL_ANALYSIS=False)
+class GlobalAnswerCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = _make_moderator()
+        self.client.force_login(self.user)
+        self.doc = _make_document(title="Facture EDF")
+
+    def _ask(self, query):
+        with (
+            patch("ia.tasks.ai_utils.analyze_all_documents", return_value="1 200 €") as mock_analyze,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.client.post(reverse("ia:global_analyze"), data={"query": query})
+        return response, mock_analyze
+
+    def test_normalize_query_ignores_case_accents_and_punctuation(self):
+        """
+        Given deux formulations ne différant que par la casse, les accents et la ponctuation
+        When on les normalise
+        Then on obtient la même forme canonique
+        """
+        from ia.utils import normalize_query
+
+        self.assertEqual(
+            normalize_query("Total des factures 2025 ?"),
+            normalize_query("  total des  FACTURES 2025?"),
+        )
+        self.assertEqual(normalize_query("Dépenses d'été"), "depenses d ete")
+
+    def test_same_question_returns_cached_answer(self):
+        """
+        Given une question déjà posée sur les mêmes documents
+        When un modérateur la repose (formulée un peu différemment)
+        Then la réponse en cache est renvoyée, avec son indicateur, sans nouvelle analyse
+        """
+        self._ask("Total des factures 2025 ?")
+        response, mock_analyze = self._ask("total des factures 2025")
+
+        mock_analyze.assert_not_called()
+        self.assertEqual(Summary.objects.count(), 1)
+        self.assertContains(response, "1 200 €")
+        self.assertContains(response, "Réponse en cache")
+
+    def test_editing_a_document_invalidates_cached_answer(self):
+        """
+        Given une question déjà posée
+        When un document est modifié puis la question reposée
+        Then une nouvelle analyse est lancée
+        """
+        self._ask("Total des factures 2025 ?")
+        self.doc.title = "Facture EDF (corrigée)"
+        self.doc.save()
+        _, mock_analyze = self._ask("Total des factures 2025 ?")
+
+        mock_analyze.assert_called_once()
+        self.assertEqual(Summary.objects.count(), 2)
+
+    def test_adding_a_document_invalidates_cached_answer(self):
+        """
+        Given une question déjà posée
+        When un document est ajouté puis la question reposée
+        Then une nouvelle analyse est lancée
+        """
+        self._ask("Total des factures 2025 ?")
+        _make_document(title="Facture SAUR", content=b"%PDF saur")
+        _, mock_analyze = self._ask("Total des factures 2025 ?")
+
+        mock_analyze.assert_called_once()
+
+    def test_answer_with_unreadable_documents_is_not_reused(self):
+        """
+        Given une analyse où l'OCR d'un document échoue
+        When la question est reposée sans modification des documents
+        Then la réponse incomplète n'est pas servie : une nouvelle analyse est lancée
+        """
+        query = "Total des factures 2025 ?"
+        with (
+            patch("ia.utils._call_ocr", side_effect=RuntimeError("Connexion perdue")),
+            patch("ia.utils._call_chat", return_value="Total partiel") as mock_chat,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.client.post(reverse("ia:global_analyze"), data={"query": query})
+
+        self.assertIn("[fichier introuvable ou illisible]", mock_chat.call_args.args[0][-1]["content"])
+        self.assertFalse(Summary.objects.get().complete)
+        _, mock_analyze = self._ask(query)
+        mock_analyze.assert_called_once()
+
+
+    @override_settings(IA_CONTEXT_TOKEN_BUDGET=50)
+    def test_answer_with_failed_batch_is_not_reused(self):
+        """
+        Given une analyse par lots dont un lot échoue
+        When la question est reposée sans modification des documents
+        Then la réponse est marquée incomplète et une nouvelle analyse est lancée
+        """
+        for i in range(3):
+            _make_document(title=f"Doc {i}", content=f"%PDF {i}".encode())
+        ocr_text = "Facture fournisseur — montant 100,00 € — " + "détail " * 10
+        query = "Total des factures ?"
+
+        def fake_chat(messages, json_mode=False, task=None):
+            if "Doc 1" in messages[-1]["content"] and "analyses partielles" not in messages[-1]["content"]:
+                raise RuntimeError("Modèle indisponible")
+            return "partiel"
+
+        with (
+            patch("ia.utils._call_ocr", return_value={1: ocr_text}),
+            patch("ia.utils._call_chat", side_effect=fake_chat) as mock_chat,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.client.post(reverse("ia:global_analyze"), data={"query": query})
+
+        self.assertIn("[partie non analysée]", mock_chat.call_args.args[0][-1]["content"])
+        summary = Summary.objects.get()
+        self.assertEqual(summary.status, Summary.Status.DONE)
+        self.assertFalse(summary.complete)
+        _, mock_analyze = self._ask(query)
+        mock_analyze.assert_called_once()
+
+# ---------------------------------------------------------------------------
+# Tests : analyse globale en streaming
+# ---------------------------------------------------------------------------
+
+@override_settings(IA_STREAM_GLOBAL_ANALYSIS=True)
+class GlobalAnalyzeStreamTests(TestCase):
+
+    def setUp(self):
+        self.user = _make_moderator()
+        self.client.force_login(self.user)
+
+    def _stream(self, summary):
+        response = self.client.get(reverse("ia:global_analyze_stream", args=[summary.pk]))
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_post_returns_event_source_without_task(self):
+        """
+        Given le mode streaming activé
+        When un modérateur poste une question valide
+        Then le partial ouvre un flux SSE et aucune tâche de fond n'est mise en file
+        """
+        _make_document()
+        with patch("ia.views.tasks.global_analyze_task") as mock_task:
+            response = self.client.post(
+                reverse("ia:global_analyze"),
+                data={"query": "Quelles factures ?"},
+            )
+
+        summary = Summary.objects.get()
+        self.assertEqual(summary.status, Summary.Status.PENDING)
+        self.assertContains(response, reverse("ia:global_analyze_stream", args=[summary.pk]))
+        mock_task.enqueue.assert_not_called()
+
+    def test_stream_forwards_chunks_and_saves_summary(self):
+        """
+        Given une analyse globale en attente
+        When le navigateur ouvre le flux SSE
+        Then chaque fragment est transmis puis la réponse complète est enregistrée
+        """
+        summary = Summary.objects.create(query="Q ?", status=Summary.Status.PENDING)
+        with patch(
+            "ia.views.ai_utils.stream_all_documents",
+            return_value=iter(["Bon", "jour é"]),
+        ):
+            response, body = self._stream(summary)
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertIn('data: "Bon"\n\n', body)
+        self.assertIn('data: "jour \\u00e9"\n\n', body)
+        self.assertIn('event: done\ndata: "done"', body)
+        summary.refresh_from_db()
+        self.assertEqual(summary.status, Summary.Status.DONE)
+        self.assertEqual(summary.content, "Bonjour é")
+
+    def test_status_fallback_enqueues_unstreamed_analysis_once(self):
+        """
+        Given une analyse globale en attente dont le flux SSE n'a jamais été ouvert
+        When le partial se rabat deux fois sur le statut après l'échec du flux
+        Then la tâche de fond est mise en file une seule fois, et le flux ne la relance plus
+        """
+        summary = Summary.objects.create(query="Q ?", status=Summary.Status.PENDING)
+        url = reverse("ia:summary_status", args=[summary.pk]) + "?relance=1"
+        with patch("ia.views.tasks.global_analyze_task") as mock_task:
+            self.client.get(url)
+            self.client.get(url)
+
+        mock_task.enqueue.assert_called_once_with(summary.pk)
+        with patch("ia.views.ai_utils.stream_all_documents") as mock_stream:
+            self._stream(summary)
+        mock_stream.assert_not_called()
+
+    def test_status_fallback_leaves_streamed_analysis_alone(self):
+        """
+        Given une analyse globale prise en charge par le flux SSE
+        When le partial interroge le statut à la fin du flux
+        Then aucune tâche n'est mise en file
+        """
+        summary = Summary.objects.create(query="Q ?", status=Summary.Status.STREAMING)
+        with patch("ia.views.tasks.global_analyze_task") as mock_task:
+            self.client.get(reverse("ia:summary_status", args=[summary.pk]) + "?relance=1")
+
+        mock_task.enqueue.assert_not_called()
+
+    def test_reconnection_does_not_rerun_analysis(self):
+        """
+        Given une analyse globale déjà en cours de diffusion
+        When le navigateur se reconnecte au flux SSE
+        Then seul l'événement de fin est envoyé, sans relancer l'analyse
+        """
+        summary = Summary.objects.create(query="Q ?", status=Summary.Status.STREAMING)
+        with patch("ia.views.ai_utils.stream_all_documents") as mock_stream:
+            _, body = self._stream(summary)
+
+        mock_stream.assert_not_called()
+        self.assertEqual(body, 'event: done\ndata: "streaming"\n\n')
+
+    def test_stream_chat_parses_sse_deltas(self):
+        """
+        Given une réponse Mistral en streaming (lignes « data: » puis [DONE])
+        When on consomme _stream_chat
+        Then seuls les fragments de texte sont produits, dans l'ordre
+        """
+        from ia.utils import _stream_chat
+
+        lines = [
+            b'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+            b"",
+            b'data: {"choices": [{"delta": {"content": "R\xc3\xa9"}}]}',
+            b'data: {"choices": [{"delta": {"content": "ponse"}}]}',
+            b"data: [DONE]",
+        ]
+        with patch("ia.utils.client.post") as mock_post:
+            response = mock_post.return_value.__enter__.return_value
+            response.status_code = 200
+            response.iter_lines.return_value = iter(lines)
+            chunks = list(_stream_chat([{"role": "user", "content": "?"}]))
+
+        self.assertEqual(chunks, ["Ré", "ponse"])
+        self.assertTrue(mock_post.call_args.kwargs["json"]["stream"])
+
+
+# ---------------------------------------------------------------------------
+# Tests : ia.client (session HTTP partagée)
+# ---------------------------------------------------------------------------
+
+class ClientTests(TestCase):
+
+    def setUp(self):
+        from ia import client
+        client.reset_session()
+        self.addCleanup(client.reset_session)
+
+    def test_session_is_shared(self):
+        """
+        Given deux appels successifs à get_session
+        When on compare les sessions retournées
+        Then c'est la même session (connexions réutilisées)
+        """
+        from ia.client import get_session
+
+        self.assertIs(get_session(), get_session())
+
+    @override_settings(MISTRAL_API_KEY="clé")
+    def test_session_does_not_retry_below_the_limiter(self):
+        """
+        Given la session partagée
+        When on inspecte sa politique de nouvelles tentatives
+        Then urllib3 ne retente rien : les tentatives sont faites par client.post
+        """
+        from ia.client import get_session
+
+        session = get_session()
+        self.assertEqual(session.get_adapter("https://api.mistral.ai").max_retries.total, 0)
+        self.assertEqual(session.headers["Authorization"], "Bearer clé")
+
+    @override_settings(IA_HTTP_RETRIES=3, IA_HTTP_BACKOFF=1, IA_HTTP_RETRY_AFTER_MAX=30)
+    def test_each_retry_takes_a_token(self):
+        """
+        Given une réponse 429 puis une réponse 503 puis un succès
+        When on fait un POST
+        Then chaque tentative prend son jeton, après un backoff à jitter borné
+        """
+        from ia import client
+
+        responses = [_fake_response(429), _fake_response(503), _fake_response()]
+        with (
+            patch.object(client.get_session(), "post", side_effect=responses) as mock_post,
+            patch("ia.client.limiter.acquire") as mock_acquire,
+            patch("ia.client.time.sleep") as mock_sleep,
+        ):
+            response = client.post("chat", "https://example.test", json={})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(mock_acquire.call_count, 3)
+        first, second = (call.args[0] for call in mock_sleep.call_args_list)
+        self.assertTrue(1 <= first <= 2)
+        self.assertTrue(2 <= second <= 3)
+
+    @override_settings(IA_HTTP_RETRIES=3, IA_HTTP_RETRY_AFTER_MAX=30)
+    def test_retry_after_is_honoured_up_to_its_maximum(self):
+        """
+        Given une réponse 429 qui demande d'attendre 120 secondes
+        When le client retente
+        Then il attend IA_HTTP_RETRY_AFTER_MAX secondes
+        """
+        from ia import client
+
+        saturated = _fake_response(429)
+        saturated.headers = {"Retry-After": "120"}
+        with (
+            patch.object(client.get_session(), "post", side_effect=[saturated, _fake_response()]),
+            patch("ia.client.limiter.acquire"),
+            patch("ia.client.time.sleep") as mock_sleep,
+        ):
+            client.post("chat", "https://example.test", json={})
+
+        mock_sleep.assert_called_once_with(30)
+
+    @override_settings(
+        IA_HTTP_RETRIES=3,
+        IA_RATE_LIMITS={"chat": {"rate": 0.001, "burst": 1}},
+        IA_RATE_LIMIT_MAX_WAIT=0,
+    )
+    def test_retry_without_token_returns_last_response(self):
+        """
+        Given un seau d'un seul jeton et une réponse 503
+        When le client voudrait retenter
+        Then il n'appelle plus l'API et rend la réponse 503, comptée comme un échec
+        """
+        from ia import client
+        from ia.models import EndpointState
+
+        with (
+            patch.object(client.get_session(), "post", return_value=_fake_response(503)) as mock_post,
+            patch("ia.client.time.sleep"),
+        ):
+            response = client.post("chat", "https://example.test", json={})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(EndpointState.objects.get(endpoint="chat").failures, 1)
+
+    @override_settings(IA_HTTP_RETRIES=1)
+    def test_retry_rewinds_streamed_body(self):
+        """
+        Given un corps en flux et une erreur réseau à la première tentative
+        When le client retente
+        Then le corps est rembobiné avant le nouvel envoi
+        """
+        from unittest.mock import MagicMock
+
+        import requests
+
+        from ia import client
+
+        body = MagicMock()
+        with (
+            patch.object(
+                client.get_session(), "post",
+                side_effect=[requests.ConnectionError(), _fake_response()],
+            ),
+            patch("ia.client.limiter.acquire"),
+            patch("ia.client.time.sleep"),
+        ):
+            client.post("ocr", "https://example.test", data=body)
+
+        body.seek.assert_called_once_with(0)
+
+    @override_settings(IA_HTTP_TIMEOUTS={"ocr": (1, 2), "chat": (3, 4)})
+    def test_post_uses_endpoint_timeout(self):
+        """
+        Given des timeouts différents par type d'appel
+        When on fait un POST « chat » sans timeout explicite
+        Then le timeout « chat » est appliqué
+        """
+        from ia import client
+
+        with patch.object(client.get_session(), "post") as mock_post:
+            client.post("chat", "https://example.test", json={})
+
+        self.assertEqual(mock_post.call_args.kwargs["timeout"], (3, 4))
+
+
+# ---------------------------------------------------------------------------
+# Tests : envoi en flux des fichiers à l'OCR
+# ---------------------------------------------------------------------------
+
+class StreamedUploadTests(TestCase):
+
+    def _body(self, content: bytes):
+        import tempfile
+
+        from ia.client import Base64JSONBody
+
+        tmp = tempfile.NamedTemporaryFile(delete=False)
+        tmp.write(content)
+        tmp.close()
+        self.addCleanup(lambda: Path(tmp.name).unlink())
+        template = json.dumps({"document_url": f"data:;base64,{Base64JSONBody.PLACEHOLDER}"})
+        return Base64JSONBody(template, tmp.name)
+
+    def test_body_matches_full_base64_json(self):
+        """
+        Given un fichier de plusieurs blocs
+        When on lit le corps par petits morceaux
+        Then on obtient exactement le JSON avec le fichier en base64, de la longueur annoncée
+        """
+        import base64
+
+        content = bytes(range(256)) * 3000
+        body = self._body(content)
+        expected = json.dumps({"document_url": f"data:;base64,{base64.b64encode(content).decode()}"})
+
+        chunks = []
+        while chunk := body.read(8192):
+            self.assertLessEqual(len(chunk), 8192)
+            chunks.append(chunk)
+
+        self.assertEqual(b"".join(chunks).decode(), expected)
+        self.assertEqual(len(body), len(expected))
+
+    def test_body_can_be_rewound_for_retries(self):
+        """
+        Given un corps déjà lu entièrement
+        When on le rembobine au début
+        Then une nouvelle lecture redonne le même contenu
+        """
+        body = self._body(b"%PDF contenu")
+        first = body.read()
+        body.seek(0)
+        self.assertEqual(body.tell(), 0)
+        self.assertEqual(body.read(), first)
+
+    def test_requests_sends_known_content_length(self):
+        """
+        Given un corps en flux
+        When requests prépare la requête
+        Then l'en-tête Content-Length est la longueur annoncée (pas de chunked)
+        """
+        import requests
+
+        body = self._body(b"x" * 1000)
+        prepared = requests.Request("POST", "https://example.test", data=body).prepare()
+        self.assertEqual(prepared.headers["Content-Length"], str(len(body)))
+        self.assertNotIn("Transfer-Encoding", prepared.headers)
+
+    @override_settings(IA_OCR_MAX_FILE_SIZE=4)
+    def test_oversized_file_is_rejected_before_ocr(self):
+        """
+        Given un fichier plus gros que IA_OCR_MAX_FILE_SIZE
+        When on demande son résumé
+        Then DocumentTooLarge est levée avec un message clair et l'OCR n'est pas appelé
+        """
+        from ia.utils import DocumentTooLarge, summarize_document
+
+        doc = _make_document(title="Gros scan")
+        with (
+            patch("ia.utils._call_ocr") as mock_ocr,
+            self.assertRaisesMessage(DocumentTooLarge, "« Gros scan » est trop volumineux"),
+        ):
+            summarize_document(doc)
+        mock_ocr.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# Tests : extraction à l'ajout et commande ia_backfill
+# ---------------------------------------------------------------------------
+
+
+@override_settings(TASKS=IMMEDIATE_TASKS)
+class ExtractOnUploadTests(TestCase):
+    OCR_TEXT = "Facture EDF janvier 2024 montant 85 euros TTC, échéance au 15 février."
+
+    @override_settings(IA_EXTRACT_FIELDS_ON_UPLOAD=False)
+    def test_new_document_text_is_extracted_in_background(self):
+        """
+        Given un document qui vient d'être ajouté
+        When la transaction est validée
+        Then son texte est extrait et mis en cache sans action de l'utilisateur
+        """
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}) as mock_ocr,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            doc = _make_document()
+
+        mock_ocr.assert_called_once()
+        self.assertTrue(ExtractedText.objects.filter(document=doc, text=self.OCR_TEXT).exists())
+        self.assertFalse(Summary.objects.filter(document=doc).exists())
+
+    def test_partial_save_without_file_is_not_queued(self):
+        """
+        Given un document existant
+        When on l'enregistre sans toucher au fichier (update_fields)
+        Then aucune extraction n'est mise en file
+        """
+        doc = _make_document()
+        with patch("ia.signals.extract_document_task") as mock_task:
+            doc.title = "Nouveau titre"
+            doc.save(update_fields=["title"])
+        mock_task.enqueue.assert_not_called()
+
+    @override_settings(IA_EXTRACT_ON_UPLOAD=False)
+    def test_setting_disables_extraction_on_upload(self):
+        """
+        Given IA_EXTRACT_ON_UPLOAD désactivé
+        When un document est ajouté
+        Then aucune extraction n'est mise en file
+        """
+        with patch("ia.signals.extract_document_task") as mock_task:
+            _make_document()
+        mock_task.enqueue.assert_not_called()
+
+    @override_settings(IA_SUMMARIZE_ON_UPLOAD=True)
+    def test_summary_generated_on_upload_when_enabled(self):
+        """
+        Given IA_SUMMARIZE_ON_UPLOAD activé
+        When un document est ajouté
+        Then son résumé est aussi généré et réutilisable par la vue
+        """
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", return_value="Résumé IA"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            doc = _make_document()
+
+        summary = Summary.objects.get(document=doc)
+        self.assertEqual(summary.status, Summary.Status.DONE)
+        self.assertEqual(summary.content, "Résumé IA")
+
+    @override_settings(IA_EXTRACT_ON_UPLOAD=False)
+    def test_backfill_skips_documents_already_processed(self):
+        """
+        Given deux documents existants sans texte extrait
+        When on lance ia_backfill deux fois
+        Then la seconde exécution reprend sans refaire aucun OCR
+        """
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        _make_document(title="A")
+        _make_document(title="B")
+
+        with patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}) as mock_ocr:
+            out = StringIO()
+            call_command("ia_backfill", stdout=out)
+            self.assertEqual(mock_ocr.call_count, 2)
+            self.assertIn("2 traité(s)", out.getvalue())
+
+            out = StringIO()
+            call_command("ia_backfill", stdout=out)
+            self.assertEqual(mock_ocr.call_count, 2)
+            self.assertIn("0 traité(s), 2 déjà à jour", out.getvalue())
+
+
+# ---------------------------------------------------------------------------
+# Tests : couche texte PDF locale avant l'OCR distant
+# ---------------------------------------------------------------------------
+
+
+class PdfTextLayerTests(TestCase):
+    INVOICE = "Facture EDF janvier 2024 montant 85 euros TTC"
+    STATEMENT = "Releve bancaire fevrier 2024 solde crediteur 1200 euros"
+
+    def test_born_digital_pdf_skips_remote_ocr(self):
+        """
+        Given un PDF natif dont toutes les pages ont une couche texte
+        When on extrait son texte
+        Then le texte vient du PDF et l'OCR distant n'est jamais appelé
+        """
+        from ia.utils import extract_text
+
+        doc = _make_document(content=_make_pdf([self.INVOICE, self.STATEMENT]))
+        with patch("ia.utils._call_ocr") as mock_ocr:
+            text = extract_text(doc)
+
+        mock_ocr.assert_not_called()
+        self.assertIn(self.INVOICE, text)
+        self.assertIn(self.STATEMENT, text)
+        self.assertLess(text.index(self.INVOICE), text.index(self.STATEMENT))
+
+    def test_oversized_pdf_is_not_parsed_locally(self):
+        """
+        Given un PDF natif plus gros que IA_OCR_MAX_FILE_SIZE
+        When on extrait son texte
+        Then il est refusé sans être ouvert par pypdf (mémoire bornée)
+        """
+        from ia.utils import DocumentTooLarge, extract_text
+
+        doc = _make_document(content=_make_pdf([self.INVOICE]))
+        with (
+            override_settings(IA_OCR_MAX_FILE_SIZE=10),
+            patch("ia.extraction.PdfReader") as mock_reader,
+            self.assertRaises(DocumentTooLarge),
+        ):
+            extract_text(doc)
+        mock_reader.assert_not_called()
+
+    def test_pdf_text_layer_is_read_from_an_open_file(self):
+        """
+        Given un PDF natif
+        When on lit sa couche texte
+        Then pypdf reçoit un fichier ouvert (lu au fil des pages), pas un chemin
+        """
+        from ia import extraction
+
+        doc = _make_document(content=_make_pdf([self.INVOICE]))
+        with patch("ia.extraction.PdfReader", wraps=extraction.PdfReader) as mock_reader:
+            self.assertEqual(extraction.pdf_page_texts(Path(doc.file.path)), [self.INVOICE])
+
+        self.assertTrue(hasattr(mock_reader.call_args.args[0], "read"))
+
+    def test_only_scanned_pages_are_sent_to_ocr(self):
+        """
+        Given un PDF dont la page 2 n'a pas de texte (page scannée)
+        When on extrait son texte
+        Then seule la page 2 est demandée à l'OCR et son texte est réinséré à sa place
+        """
+        from ia.utils import extract_text
+
+        doc = _make_document(content=_make_pdf([self.INVOICE, "", self.STATEMENT]))
+        scanned = "Bon de livraison scanne, 3 cartons de fournitures"
+        with patch("ia.utils._call_ocr", return_value={2: scanned}) as mock_ocr:
+            text = extract_text(doc)
+
+        self.assertEqual(mock_ocr.call_args.kwargs["pages"], [2])
+        self.assertLess(text.index(self.INVOICE), text.index(scanned))
+        self.assertLess(text.index(scanned), text.index(self.STATEMENT))
+
+    def test_short_text_layer_page_counts_as_scanned(self):
+        """
+        Given une page dont la couche texte fait moins de 30 caractères
+        When on extrait le texte
+        Then cette page part à l'OCR comme une page scannée
+        """
+        from ia.utils import extract_text
+
+        doc = _make_document(content=_make_pdf(["Page 1", self.STATEMENT]))
+        with patch("ia.utils._call_ocr", return_value={1: ""}) as mock_ocr:
+            text = extract_text(doc)
+
+        self.assertEqual(mock_ocr.call_args.kwargs["pages"], [1])
+        # L'OCR n'a rien trouvé de mieux : le texte local est conservé.
+        self.assertIn("Page 1", text)
+
+    def test_unparsable_pdf_falls_back_to_full_ocr(self):
+        """
+        Given un fichier .pdf illisible localement
+        When on extrait son texte
+        Then il est envoyé en entier à l'OCR distant
+        """
+        from ia.utils import extract_text
+
+        doc = _make_document(content=b"%PDF fake")
+        with patch("ia.utils._call_ocr", return_value={1: "Texte OCR"}) as mock_ocr:
+            self.assertEqual(extract_text(doc), "Texte OCR")
+        mock_ocr.assert_called_once()
+
+    def test_ocr_pages_request_only_asked_pages(self):
+        """
+        Given une demande d'OCR limitée à certaines pages
+        When on appelle l'API
+        Then le corps contient `pages` (numérotées à partir de 0 pour l'API)
+        And la réponse est indexée par numéro de page à partir de 1
+        """
+        from unittest.mock import MagicMock
+
+        from ia.utils import _call_ocr
+
+        doc = _make_document()
+        response = MagicMock()
+        response.status_code = 200
+        response.content = b"{}"
+        response.json.return_value = {"pages": [{"index": 2, "markdown": "Page trois"}]}
+        with patch("ia.utils.client.post", return_value=response) as mock_post:
+            pages = _call_ocr(Path(doc.file.path), pages=[3])
+
+        self.assertEqual(pages, {3: "Page trois"})
+        body = mock_post.call_args.kwargs["data"].read()
+        self.assertEqual(json.loads(body)["pages"], [2])
+
+
+# ---------------------------------------------------------------------------
+# Tests : extraction native des formats bureautiques
+# ---------------------------------------------------------------------------
+
+
+def _zip(files: dict[str, str]) -> bytes:
+    from io import BytesIO
+    from zipfile import ZipFile
+
+    output = BytesIO()
+    with ZipFile(output, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return output.getvalue()
+
+
+class OfficeFormatExtractionTests(TestCase):
+    def _extract(self, name, content):
+        from ia.utils import extract_text
+
+        doc = _make_document(content=content, name=name)
+        with patch("ia.utils._call_ocr") as mock_ocr:
+            text = extract_text(doc)
+        mock_ocr.assert_not_called()
+        return text
+
+    def test_xlsx_is_read_locally_sheet_by_sheet(self):
+        """
+        Given un classeur Excel de deux feuilles
+        When on extrait son texte
+        Then chaque feuille et ses valeurs sont lues sans OCR
+        """
+        from io import BytesIO
+
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.title = "Janvier"
+        workbook.active.append(["Fournisseur", "Montant"])
+        workbook.active.append(["EDF", 85.5])
+        workbook.create_sheet("Février").append(["Orange", 39.99])
+        output = BytesIO()
+        workbook.save(output)
+
+        text = self._extract("budget.xlsx", output.getvalue())
+
+        self.assertIn("## Janvier\nFournisseur ; Montant\nEDF ; 85.5", text)
+        self.assertIn("## Février\nOrange ; 39.99", text)
+
+    def test_xlsx_is_opened_read_only(self):
+        """
+        Given un classeur Excel
+        When on l'extrait
+        Then il est ouvert en mode flux (read_only) pour borner la mémoire
+        """
+        from io import BytesIO
+
+        from openpyxl import Workbook, load_workbook
+
+        output = BytesIO()
+        Workbook().save(output)
+        with patch("ia.extraction.load_workbook", wraps=load_workbook) as mock_load:
+            self._extract("vide.xlsx", output.getvalue())
+        self.assertTrue(mock_load.call_args.kwargs["read_only"])
+
+    def test_csv_with_semicolons_and_windows_encoding(self):
+        """
+        Given un export CSV français (« ; », encodage Windows-1252)
+        When on extrait son texte
+        Then les lignes et les accents sont conservés
+        """
+        content = "Date;Libellé;Montant\n15/01/2024;Électricité;85,50\n".encode("cp1252")
+        text = self._extract("releve.csv", content)
+        self.assertEqual(text, "Date ; Libellé ; Montant\n15/01/2024 ; Électricité ; 85,50")
+
+    def test_txt_is_read_as_is(self):
+        """
+        Given un fichier texte UTF-8
+        When on extrait son texte
+        Then il est renvoyé tel quel
+        """
+        self.assertEqual(self._extract("note.txt", "Réunion du bureau\n".encode()), "Réunion du bureau")
+
+    def test_docx_paragraphs(self):
+        """
+        Given un document Word
+        When on extrait son texte
+        Then on obtient un paragraphe par ligne
+        """
+        ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+        xml = (
+            f'<w:document xmlns:w="{ns}"><w:body>'
+            "<w:p><w:r><w:t>Convention de </w:t></w:r><w:r><w:t>partenariat</w:t></w:r></w:p>"
+            "<w:p><w:r><w:t>Montant : 500 €</w:t></w:r></w:p>"
+            "</w:body></w:document>"
+        )
+        text = self._extract("convention.docx", _zip({"word/document.xml": xml}))
+        self.assertEqual(text, "Convention de partenariat\nMontant : 500 €")
+
+    def test_odt_paragraphs_and_headings(self):
+        """
+        Given un document OpenDocument avec un titre et un paragraphe
+        When on extrait son texte
+        Then les deux sont lus, y compris le texte des balises imbriquées
+        """
+        ns = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+        xml = (
+            f'<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:text="{ns}">'
+            "<office:body><office:text>"
+            "<text:h>Compte rendu</text:h>"
+            "<text:p>Présents : <text:span>Alice</text:span> et Bob</text:p>"
+            "</office:text></office:body></office:document-content>"
+        )
+        text = self._extract("cr.odt", _zip({"content.xml": xml}))
+        self.assertEqual(text, "Compte rendu\nPrésents : Alice et Bob")
+
+    def test_pptx_slides_in_order(self):
+        """
+        Given une présentation dont les diapositives 2 et 10 sont stockées dans le désordre
+        When on extrait son texte
+        Then les diapositives sont lues dans l'ordre numérique
+        """
+        ns = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+        def slide(text):
+            return f'<p:sld xmlns:p="p" xmlns:a="{ns}"><a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:sld>'
+
+        content = _zip({
+            "ppt/slides/slide10.xml": slide("Fin"),
+            "ppt/slides/slide2.xml": slide("Début"),
+        })
+        text = self._extract("bilan.pptx", content)
+        self.assertEqual(text, "## Diapositive 1\nDébut\n\n## Diapositive 2\nFin")
+
+    def test_unsupported_format_is_unreadable_without_ocr(self):
+        """
+        Given une archive zip
+        When on demande son résumé
+        Then aucun appel distant n'est fait et le document est déclaré illisible
+        """
+        from ia.utils import summarize_document
+
+        doc = _make_document(content=_zip({"a.txt": "x"}), name="archive.zip")
+        with (
+            patch("ia.utils._call_ocr") as mock_ocr,
+            patch("ia.utils._call_chat") as mock_chat,
+        ):
+            self.assertEqual(summarize_document(doc), UNREADABLE_MSG)
+        mock_ocr.assert_not_called()
+        mock_chat.assert_not_called()
+
+    def test_corrupted_office_file_is_unreadable(self):
+        """
+        Given un .docx corrompu
+        When on extrait son texte
+        Then le texte est vide plutôt qu'une erreur
+        """
+        self.assertEqual(self._extract("casse.docx", b"pas un zip"), "")
+
+
+# ---------------------------------------------------------------------------
+# Tests : pages extraites, reprise des pages en échec et plages de pages
+# ---------------------------------------------------------------------------
+
+
+class ExtractedPageTests(TestCase):
+    INVOICE = "Facture EDF janvier 2024 montant 85 euros TTC"
+    STATEMENT = "Releve bancaire fevrier 2024 solde crediteur 1200 euros"
+    SCAN_2 = "Bon de livraison scanne, 3 cartons de fournitures de bureau"
+    SCAN_3 = "Ticket de caisse scanne, achat de timbres pour 24 euros"
+
+    def test_pages_are_stored_with_number_and_hash(self):
+        """
+        Given un PDF de trois pages dont la deuxième est scannée
+        When on extrait son texte
+        Then chaque page est enregistrée avec son numéro et l'empreinte de son texte
+        """
+        import hashlib
+
+        from ia.models import ExtractedPage
+        from ia.utils import extract_text
+
+        doc = _make_document(content=_make_pdf([self.INVOICE, "", self.STATEMENT]))
+        with patch("ia.utils._call_ocr", return_value={2: self.SCAN_2}):
+            extract_text(doc)
+
+        pages = list(ExtractedPage.objects.filter(document=doc))
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertEqual(pages[1].text, self.SCAN_2)
+        self.assertEqual(pages[1].text_hash, hashlib.sha1(self.SCAN_2.encode()).hexdigest())
+        self.assertTrue(all(page.status == ExtractedPage.Status.DONE for page in pages))
+
+    def test_only_failed_pages_are_requested_again(self):
+        """
+        Given un PDF dont les pages 2 et 3 sont scannées et dont l'OCR n'a renvoyé que la page 2
+        When on relance l'extraction
+        Then seule la page 3 est redemandée et le texte complet est enfin mis en cache
+        """
+        from ia.models import ExtractedPage
+        from ia.utils import ExtractionIncomplete, extract_text
+
+        doc = _make_document(content=_make_pdf([self.INVOICE, "", ""]))
+        with (
+            patch("ia.utils._call_ocr", return_value={2: self.SCAN_2}),
+            self.assertRaises(ExtractionIncomplete),
+        ):
+            extract_text(doc)
+
+        self.assertFalse(ExtractedText.objects.filter(document=doc).exists())
+        self.assertEqual(
+            ExtractedPage.objects.get(document=doc, number=3).status,
+            ExtractedPage.Status.FAILED,
+        )
+
+        with patch("ia.utils._call_ocr", return_value={3: self.SCAN_3}) as mock_ocr:
+            text = extract_text(doc)
+
+        self.assertEqual(mock_ocr.call_args.kwargs["pages"], [3])
+        self.assertEqual(text, f"{self.INVOICE}\n\n{self.SCAN_2}\n\n{self.SCAN_3}")
+
+    def test_ocr_error_marks_scanned_pages_failed(self):
+        """
+        Given une erreur réseau pendant l'OCR des pages scannées
+        When on extrait le texte
+        Then les pages lues localement sont conservées et les pages scannées restent à refaire
+        """
+        from ia.models import ExtractedPage
+        from ia.utils import ExtractionIncomplete, extract_text
+
+        doc = _make_document(content=_make_pdf([self.INVOICE, ""]))
+        with (
+            patch("ia.utils._call_ocr", side_effect=TimeoutError),
+            self.assertRaises(ExtractionIncomplete),
+        ):
+            extract_text(doc)
+
+        statuses = dict(
+            ExtractedPage.objects.filter(document=doc).values_list("number", "status")
+        )
+        self.assertEqual(statuses, {1: "done", 2: "failed"})
+
+    def test_parse_and_format_page_ranges(self):
+        """
+        Given des plages de pages saisies librement
+        When on les analyse puis les normalise
+        Then on obtient des numéros triés sans doublon et une forme canonique
+        """
+        from ia.utils import format_pages, parse_pages
+
+        self.assertEqual(parse_pages("3, 1-2,2"), [1, 2, 3])
+        self.assertEqual(parse_pages(""), [])
+        self.assertEqual(format_pages([5, 1, 2, 3, 7, 8]), "1-3,5,7-8")
+        for invalid in ("0", "3-1", "a", "1-99999"):
+            with self.assertRaises(ValueError):
+                parse_pages(invalid)
+
+    def test_summarize_page_range_sends_only_those_pages(self):
+        """
+        Given un PDF de trois pages
+        When on résume seulement la page 3
+        Then seul le texte de la page 3 est envoyé au chat
+        """
+        from ia.utils import summarize_document
+
+        doc = _make_document(content=_make_pdf([self.INVOICE, self.SCAN_2, self.STATEMENT]))
+        with patch("ia.utils._call_chat", return_value="Résumé") as mock_chat:
+            summarize_document(doc, pages=[3])
+
+        user_msg = mock_chat.call_args[0][0][1]["content"]
+        self.assertIn(self.STATEMENT, user_msg)
+        self.assertNotIn(self.INVOICE, user_msg)
+
+    def test_retrieved_excerpts_cite_their_page(self):
+        """
+        Given un document de deux pages indexé
+        When une analyse globale retient un passage de la page 2
+        Then l'en-tête du passage envoyé au chat indique la page
+        """
+        from ia.utils import analyze_all_documents
+
+        doc = _make_document(title="Relevé", content=_make_pdf([self.INVOICE, self.STATEMENT]))
+        with patch("ia.utils._call_chat", return_value="ok") as mock_chat:
+            analyze_all_documents([doc], query="Quel solde bancaire ?")
+
+        user_msg = mock_chat.call_args[0][0][1]["content"]
+        self.assertIn("--- Document : Relevé (date : inconnue) — page 2, extrait 2 ---", user_msg)
+        self.assertNotIn(self.INVOICE, user_msg)
+
+    @override_settings(IA_RETRIEVAL_TOP_K=0)
+    def test_global_analysis_page_range(self):
+        """
+        Given deux documents de deux pages
+        When on lance l'analyse globale sur la page 1 uniquement
+        Then seule la première page de chaque document est envoyée
+        """
+        from ia.utils import analyze_all_documents
+
+        first = _make_document(title="A", content=_make_pdf([self.INVOICE, self.STATEMENT]))
+        second = _make_document(title="B", content=_make_pdf([self.SCAN_3, self.SCAN_2]))
+        with patch("ia.utils._call_chat", return_value="ok") as mock_chat:
+            analyze_all_documents([first, second], query="Quels achats ?", pages=[1])
+
+        user_msg = mock_chat.call_args[0][0][1]["content"]
+        self.assertIn(self.INVOICE, user_msg)
+        self.assertIn(self.SCAN_3, user_msg)
+        self.assertNotIn(self.STATEMENT, user_msg)
+        self.assertNotIn(self.SCAN_2, user_msg)
+
+
+@override_settings(TASKS=IMMEDIATE_TASKS)
+class PageRangeViewTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_make_moderator())
+
+    def test_summary_page_range_is_stored_and_reused(self):
+        """
+        Given un résumé déjà généré pour les pages « 1-2 »
+        When on redemande les pages « 2, 1 »
+        Then le même résumé est renvoyé, mais pas pour tout le document
+        """
+        doc = _make_document()
+        url = reverse("ia:summarize_document", args=[doc.pk])
+        with (
+            patch("ia.tasks.ai_utils.summarize_document", return_value="Résumé p1-2") as mock_summarize,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.client.post(url, {"pages": "1-2"})
+        self.assertEqual(mock_summarize.call_args[0][1], [1, 2])
+
+        with patch("ia.views.tasks.summarize_document_task") as mock_task:
+            response = self.client.post(url, {"pages": "2, 1"})
+            self.assertContains(response, "Résumé p1-2")
+            mock_task.enqueue.assert_not_called()
+
+            self.client.post(url)
+            mock_task.enqueue.assert_called_once()
+
+        self.assertEqual(
+            list(Summary.objects.filter(document=doc).values_list("pages", flat=True)),
+            ["", "1-2"],
+        )
+
+    def test_invalid_page_range_is_rejected(self):
+        """
+        Given une plage de pages invalide
+        When on demande un résumé
+        Then un message d'erreur est affiché et rien n'est mis en file
+        """
+        doc = _make_document()
+        with patch("ia.views.tasks.summarize_document_task") as mock_task:
+            response = self.client.post(
+                reverse("ia:summarize_document", args=[doc.pk]),
+                {"pages": "3-1"},
+            )
+        self.assertContains(response, "Plage de pages invalide")
+        mock_task.enqueue.assert_not_called()
+
+    def test_page_range_too_long_to_store_is_rejected(self):
+        """
+        Given une plage valide dont la forme canonique dépasse Summary.pages (pages impaires 1 à 41)
+        When on demande un résumé puis une analyse globale
+        Then un message d'erreur est affiché, sans Summary créé ni tâche mise en file
+        """
+        doc = _make_document()
+        pages = ",".join(str(number) for number in range(1, 42, 2))
+        with patch("ia.views.tasks") as mock_tasks:
+            response = self.client.post(reverse("ia:summarize_document", args=[doc.pk]), {"pages": pages})
+            self.assertContains(response, "Plage de pages trop longue")
+            response = self.client.post(reverse("ia:global_analyze"), {"query": "Total ?", "pages": pages})
+            self.assertContains(response, "Plage de pages trop longue")
+
+        self.assertFalse(Summary.objects.exists())
+        mock_tasks.summarize_document_task.enqueue.assert_not_called()
+        mock_tasks.global_analyze_task.enqueue.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# Tests : commande ia_summarize (résumés en masse)
+# ---------------------------------------------------------------------------
+
+
+@override_settings(IA_EXTRACT_ON_UPLOAD=False)
+class BulkSummarizeCommandTests(TestCase):
+    OCR_TEXT = "Facture EDF janvier 2024 montant 85 euros TTC, échéance au 15 février."
+
+    def _call(self, *args):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        out, err = StringIO(), StringIO()
+        call_command("ia_summarize", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_summarizes_missing_and_resumes_without_redoing(self):
+        """
+        Given trois documents dont un déjà résumé
+        When on lance ia_summarize deux fois
+        Then seuls les deux autres sont résumés, et la seconde exécution n'a rien à faire
+        """
+        from ia.utils import SUMMARY_PROMPT_VERSION
+
+        docs = [_make_document(title=f"Doc {i}", content=f"%PDF {i}".encode()) for i in range(3)]
+        Summary.objects.create(
+            document=docs[0],
+            content="Déjà fait",
+            file_hash=docs[0].get_file_hash(),
+            prompt_version=SUMMARY_PROMPT_VERSION,
+        )
+
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", return_value="Résumé IA") as mock_chat,
+        ):
+            out, _ = self._call("--workers", "2", "--batch-size", "1")
+            self.assertEqual(mock_chat.call_count, 2)
+            self.assertIn("2 document(s) à résumer.", out)
+            self.assertIn("2 résumé(s)", out)
+            self.assertIn("0 échec(s)", out)
+
+            out, _ = self._call()
+            self.assertEqual(mock_chat.call_count, 2)
+            self.assertIn("0 document(s) à résumer.", out)
+
+        self.assertEqual(
+            Summary.objects.filter(document=docs[2], status=Summary.Status.DONE).count(), 1
+        )
+
+    def test_filters_by_collection_and_date(self):
+        """
+        Given des documents dans une collection, sa sous-collection et ailleurs, à des dates différentes
+        When on filtre par collection et par période
+        Then seuls les documents de la collection (et descendants) dans la période sont résumés
+        """
+        import datetime
+
+        from wagtail.models import Collection
+
+        root = Collection.get_first_root_node()
+        invoices = root.add_child(name="Factures")
+        energy = invoices.add_child(name="Énergie")
+        other = root.add_child(name="Divers")
+
+        def make(title, collection, date):
+            doc = _make_document(title=title, date=date, content=title.encode())
+            doc.collection = collection
+            doc.save()
+            return doc
+
+        make("Dans la période", energy, datetime.date(2024, 3, 1))
+        make("Trop ancien", invoices, datetime.date(2023, 3, 1))
+        make("Autre collection", other, datetime.date(2024, 3, 1))
+
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", return_value="Résumé IA"),
+        ):
+            self._call(
+                "--collection", str(invoices.pk),
+                "--since", "2024-01-01",
+                "--until", "2024-12-31",
+            )
+
+        self.assertEqual(
+            list(Summary.objects.values_list("document__title", flat=True)),
+            ["Dans la période"],
+        )
+
+    def test_malformed_date_is_a_command_error(self):
+        """
+        Given une date --since mal formée
+        When on lance la commande
+        Then elle s'arrête sur une CommandError explicite, sans rien résumer
+        """
+        from django.core.management import CommandError
+
+        _make_document()
+        with self.assertRaisesMessage(CommandError, "Date invalide (AAAA-MM-JJ attendu) : 2024-13-01"):
+            self._call("--since", "2024-13-01")
+        self.assertFalse(Summary.objects.exists())
+
+    def test_failures_are_reported_and_retried_next_run(self):
+        """
+        Given un document dont le résumé échoue
+        When la commande se termine
+        Then l'échec est listé, enregistré comme tel et retenté à l'exécution suivante
+        """
+        doc = _make_document(title="Capricieux")
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", side_effect=RuntimeError("quota")),
+        ):
+            out, err = self._call()
+        self.assertIn("1 échec(s)", out)
+        self.assertIn("Capricieux — quota", err)
+        self.assertEqual(Summary.objects.get(document=doc).status, Summary.Status.FAILED)
+
+        with patch("ia.utils._call_chat", return_value="Résumé IA"):
+            out, _ = self._call()
+        self.assertIn("1 résumé(s)", out)
+        self.assertTrue(
+            Summary.objects.filter(document=doc, status=Summary.Status.DONE).exists()
+        )
+
+
+# ---------------------------------------------------------------------------
+# Tests : serveur Mistral simulé (ia.standin)
+# ---------------------------------------------------------------------------
+
+
+class StandinServerTests(TestCase):
+    def _start(self, **options):
+        from ia.client import reset_session
+        from ia.standin import StandinConfig, make_server
+
+        server = make_server("127.0.0.1", 0, StandinConfig(seed=1, **options))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        reset_session()
+        self.addCleanup(reset_session)
+
+        base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        settings_override = override_settings(
+            MISTRAL_OCR_URL=f"{base}/ocr",
+            MISTRAL_CHAT_URL=f"{base}/chat/completions",
+            IA_HTTP_BACKOFF=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return server
+
+    def test_summarize_end_to_end_against_standin(self):
+        """
+        Given le serveur simulé et un PDF sans couche texte
+        When on résume le document
+        Then l'OCR et le chat simulés sont appelés via les URL configurées
+        """
+        from ia.utils import extract_text, summarize_document
+
+        server = self._start(chat_chars=120)
+        doc = _make_document()
+
+        summary = summarize_document(doc)
+
+        self.assertEqual(server.requests_count, 2)
+        self.assertIn("Page 1", extract_text(doc))
+        self.assertTrue(summary.startswith("Facture n° 2024-"))
+
+    def test_429_burst_is_retried_by_client(self):
+        """
+        Given un serveur qui répond 429 aux deux premières requêtes
+        When on appelle le chat
+        Then le client retente et obtient la réponse
+        """
+        from ia.utils import _call_chat
+
+        server = self._start(burst_every=100, burst_length=2, retry_after=0)
+        answer = _call_chat([{"role": "user", "content": "Bonjour"}])
+
+        self.assertEqual(server.requests_count, 3)
+        self.assertTrue(answer)
+
+    def test_streamed_chat(self):
+        """
+        Given le serveur simulé
+        When on appelle le chat en streaming
+        Then la réponse arrive par fragments
+        """
+        from ia.utils import _stream_chat
+
+        self._start(chat_chars=60)
+        chunks = list(_stream_chat([{"role": "user", "content": "Bonjour"}]))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue("".join(chunks).startswith("Facture n°"))
+
+    def test_replay_serves_recorded_response(self):
+        """
+        Given une réponse enregistrée pour une requête donnée
+        When la même requête est rejouée
+        Then la réponse enregistrée est renvoyée telle quelle
+        """
+        import hashlib
+        import shutil
+        import tempfile
+
+        from ia import client
+        from ia.utils import _call_chat
+
+        replay_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, replay_dir)
+        self._start(replay_dir=replay_dir)
+
+        messages = [{"role": "user", "content": "Bonjour"}]
+        with patch("ia.utils.client.post", wraps=client.post) as spy:
+            _call_chat(messages)
+        body = json.dumps(spy.call_args.kwargs["json"]).encode()
+        key = hashlib.sha256(b"/v1/chat/completions\x1f" + body).hexdigest()
+        (replay_dir / f"{key}.json").write_text(json.dumps({
+            "status": 200,
+            "content_type": "application/json",
+            "body": json.dumps({"choices": [{"message": {"content": "Réponse enregistrée"}}]}),
+        }))
+
+        self.assertEqual(_call_chat(messages), "Réponse enregistrée")
+
+    def test_benchmark_compares_preprocessing(self):
+        """
+        Given le serveur simulé sur un lien montant lent et une photo scannée
+        When on lance ia_benchmark --compare-preprocess
+        Then octets envoyés et latence de l'OCR sont mesurés sans puis avec prétraitement
+        And le prétraitement réduit les octets envoyés
+        """
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from ia.models import ApiCall
+
+        self._start(uplink_kbps=100_000)
+        _make_document(content=_make_photo(), name="photo.jpg")
+        out = StringIO()
+
+        call_command("ia_benchmark", "--compare-preprocess", stdout=out, stderr=StringIO())
+
+        output = out.getvalue()
+        self.assertIn("OCR sans prétraitement : 1 document(s)", output)
+        self.assertIn("OCR avec prétraitement : 1 document(s)", output)
+        self.assertIn("% de moins", output)
+        self.assertFalse(ApiCall.objects.exists())
+
+
+# ---------------------------------------------------------------------------
+# Tests : mesures des appels IA (ia.metrics)
+# ---------------------------------------------------------------------------
+
+
+def _fake_response(status_code=200, payload=None):
+    from unittest.mock import MagicMock
+
+    import requests
+
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = {}
+    response.content = json.dumps(payload or {}).encode()
+    response.json.return_value = payload or {}
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(str(status_code), response=response)
+    return response
+
+
+class MetricsTests(TestCase):
+    CHAT_PAYLOAD = {
+        "choices": [{"message": {"content": "Réponse"}}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 30},
+    }
+
+    def test_chat_call_is_recorded(self):
+        """
+        Given une réponse chat avec son usage
+        When on appelle le chat
+        Then l'appel est enregistré avec durée, octets, jetons et résultat
+        """
+        from ia.models import ApiCall
+        from ia.utils import _call_chat
+
+        with patch("ia.utils.client.post", return_value=_fake_response(payload=self.CHAT_PAYLOAD)):
+            _call_chat([{"role": "user", "content": "Bonjour"}])
+
+        call = ApiCall.objects.get()
+        self.assertEqual(call.endpoint, "chat")
+        self.assertEqual(call.outcome, ApiCall.Outcome.OK)
+        self.assertEqual((call.prompt_tokens, call.completion_tokens), (120, 30))
+        self.assertGreater(call.request_bytes, len("Bonjour"))
+        self.assertEqual(call.response_bytes, len(json.dumps(self.CHAT_PAYLOAD).encode()))
+        self.assertEqual(call.status_code, 200)
+
+    def test_failures_are_recorded_with_their_outcome(self):
+        """
+        Given une erreur HTTP puis une erreur réseau, sur les deux modèles de la route
+        When on appelle le chat
+        Then chaque appel est enregistré avec son modèle, en erreur HTTP puis en erreur réseau
+        """
+        import requests
+
+        from django.conf import settings
+
+        from ia.models import ApiCall
+        from ia.utils import _call_chat
+
+        with patch("ia.utils.client.post", return_value=_fake_response(503)):
+            with self.assertRaises(requests.HTTPError):
+                _call_chat([])
+        with patch("ia.utils.client.post", side_effect=requests.ConnectionError):
+            with self.assertRaises(requests.ConnectionError):
+                _call_chat([])
+
+        route = settings.IA_CHAT_MODELS["summary"]
+        primary, fallback = route["model"], route["fallback"]
+        self.assertEqual(
+            list(ApiCall.objects.order_by("pk").values_list("model", "outcome", "status_code")),
+            [
+                (primary, "http_error", 503),
+                (fallback, "http_error", 503),
+                (primary, "error", None),
+                (fallback, "error", None),
+            ],
+        )
+
+    def test_pool_threads_calls_are_flushed_by_caller(self):
+        """
+        Given trois documents extraits en parallèle par le pool OCR
+        When l'extraction se termine
+        Then les trois appels OCR sont enregistrés, ainsi que les défauts de cache
+        """
+        from ia.models import ApiCall, CacheStat
+        from ia.utils import extract_texts
+
+        docs = [_make_document(title=f"Doc {i}", content=f"%PDF {i}".encode()) for i in range(3)]
+        ocr = _fake_response(payload={"pages": [{"index": 0, "markdown": "Texte"}]})
+        with patch("ia.utils.client.post", return_value=ocr):
+            extract_texts(docs)
+            extract_texts(docs)
+
+        self.assertEqual(ApiCall.objects.filter(endpoint="ocr", outcome="ok").count(), 3)
+        stat = CacheStat.objects.get(cache="text")
+        self.assertEqual((stat.hits, stat.misses), (3, 3))
+
+    def test_metrics_endpoint_renders_counters(self):
+        """
+        Given des appels enregistrés
+        When un modérateur interroge /ia/metriques/
+        Then les compteurs sont renvoyés au format texte
+        """
+        from ia.utils import _call_chat
+
+        with patch("ia.utils.client.post", return_value=_fake_response(payload=self.CHAT_PAYLOAD)):
+            _call_chat([])
+
+        self.client.force_login(_make_moderator())
+        response = self.client.get(reverse("ia:metrics"))
+
+        self.assertEqual(response["Content-Type"].split(";")[0], "text/plain")
+        body = response.content.decode()
+        self.assertIn('ia_calls_total{endpoint="chat",outcome="ok"} 1', body)
+        self.assertIn('ia_tokens_total{endpoint="chat",kind="prompt"} 120', body)
+
+    @override_settings(IA_METRICS_TOKEN="")
+    def test_metrics_endpoint_requires_moderator_even_from_localhost(self):
+        """
+        Given une requête anonyme arrivant de 127.0.0.1 (comme tout ce qui passe par le proxy)
+        When elle interroge les métriques sans jeton configuré
+        Then l'accès est refusé, mais un modérateur y a accès
+        """
+        url = reverse("ia:metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code, 403)
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer "}).status_code, 403)
+        self.client.force_login(_make_moderator())
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(IA_METRICS_TOKEN="s3cret")
+    def test_metrics_endpoint_accepts_configured_bearer_token(self):
+        """
+        Given un jeton de collecte configuré
+        When un collecteur anonyme présente le bon jeton, puis un mauvais
+        Then le premier est servi et le second refusé
+        """
+        url = reverse("ia:metrics")
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer s3cret"}).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer autre"}).status_code, 403)
+
+    def test_admin_usage_report(self):
+        """
+        Given des appels enregistrés et des statistiques de cache
+        When un administrateur ouvre le rapport Wagtail
+        Then les agrégats par jour et par endpoint et le taux de succès des caches sont affichés
+        """
+        from ia import metrics
+        from ia.utils import _call_chat
+
+        with patch("ia.utils.client.post", return_value=_fake_response(payload=self.CHAT_PAYLOAD)):
+            _call_chat([])
+            _call_chat([])
+        metrics.record_cache("summary", hits=3, misses=1)
+
+        self.client.force_login(_make_moderator())
+        response = self.client.get(reverse("ia_usage_report"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Statistiques IA")
+        self.assertContains(response, "chat")
+        self.assertContains(response, "75 %")
+
+
+# ---------------------------------------------------------------------------
+# Tests : limiteur de débit et disjoncteur partagés (ia.limiter)
+# ---------------------------------------------------------------------------
+
+@override_settings(
+    IA_RATE_LIMITS={"chat": {"rate": 1.0, "burst": 2}},
+    IA_RATE_LIMIT_MAX_WAIT=0,
+    IA_HTTP_RETRIES=0,
+    IA_CIRCUIT_FAILURES=2,
+    IA_CIRCUIT_RESET_AFTER=60,
+)
+class LimiterTests(TestCase):
+
+    def setUp(self):
+        from ia import client
+        client.reset_session()
+        self.addCleanup(client.reset_session)
+
+    def _post(self, **session_mock):
+        from ia import client
+
+        with patch.object(client.get_session(), "post", **session_mock) as mock_post:
+            try:
+                client.post("chat", "https://example.test", json={})
+            finally:
+                self.calls = mock_post.call_count
+
+    def test_token_bucket_allows_burst_then_limits(self):
+        """
+        Given un seau de 2 jetons qui se remplit d'un jeton par seconde
+        When trois appels partent dans la même seconde sans attente autorisée
+        Then les deux premiers passent et le troisième est refusé
+        """
+        from ia.limiter import RateLimited, acquire
+
+        acquire("chat")
+        acquire("chat")
+        with self.assertRaises(RateLimited):
+            acquire("chat")
+
+    @override_settings(IA_RATE_LIMIT_MAX_WAIT=5)
+    def test_waits_for_token_refill(self):
+        """
+        Given un seau vide et une attente autorisée
+        When un appel demande un jeton
+        Then il attend le remplissage au lieu d'échouer
+        """
+        from ia import limiter
+        from ia.models import EndpointState
+
+        now = 1_000_000.0
+        EndpointState.objects.create(endpoint="chat", tokens=0, refilled_at=now)
+        with (
+            patch("ia.limiter.time.time", side_effect=[now, now + 1]),
+            patch("ia.limiter.time.sleep") as mock_sleep,
+        ):
+            limiter.acquire("chat")
+
+        mock_sleep.assert_called_once_with(1.0)
+
+    @override_settings(IA_RATE_LIMIT_MAX_WAIT=5)
+    def test_locked_database_is_retried(self):
+        """
+        Given une base verrouillée par une autre prise de jeton
+        When un appel demande un jeton
+        Then il réessaie au lieu d'échouer
+        """
+        from django.db import OperationalError
+
+        from ia import limiter
+
+        with (
+            patch("ia.limiter._try_acquire", side_effect=[OperationalError("database is locked"), 0]),
+            patch("ia.limiter.time.sleep") as mock_sleep,
+        ):
+            limiter.acquire("chat")
+
+        mock_sleep.assert_called_once_with(limiter.LOCKED_RETRY_DELAY)
+
+    def test_locked_database_is_not_blamed_on_the_file(self):
+        """
+        Given une base verrouillée pendant tout le délai d'attente
+        When l'analyse globale lit un fichier
+        Then le service est dit indisponible et aucun échec n'est mémorisé pour le fichier
+        """
+        from django.db import OperationalError
+
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        with (
+            patch("ia.limiter._try_acquire", side_effect=OperationalError("database is locked")),
+            patch("ia.utils.client.get_session") as mock_session,
+        ):
+            self.assertEqual(extract_texts([doc]), [None])
+
+        mock_session.assert_not_called()
+        self.assertFalse(ExtractionFailure.objects.exists())
+
+    def test_endpoint_without_limit_is_not_throttled(self):
+        """
+        Given un endpoint absent de IA_RATE_LIMITS
+        When on enchaîne les appels
+        Then aucun n'est refusé
+        """
+        from ia.limiter import acquire
+
+        for _ in range(5):
+            acquire("ocr")
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        """
+        Given deux erreurs réseau consécutives sur le chat
+        When un troisième appel est tenté
+        Then il échoue aussitôt (CircuitOpen) sans appeler l'API
+        """
+        import requests
+
+        from ia.limiter import CircuitOpen, is_open
+
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                self._post(side_effect=requests.ConnectionError)
+        self.assertTrue(is_open("ocr", "chat"))
+
+        with self.assertRaises(CircuitOpen):
+            self._post(return_value=_fake_response())
+        self.assertEqual(self.calls, 0)
+
+    @override_settings(IA_RATE_LIMITS={})
+    def test_server_errors_count_and_success_resets(self):
+        """
+        Given une réponse 503 (nouvelles tentatives épuisées)
+        When l'appel suivant réussit
+        Then le compteur d'échecs repart de zéro
+        """
+        from ia.models import EndpointState
+
+        self._post(return_value=_fake_response(503))
+        self.assertEqual(EndpointState.objects.get(endpoint="chat").failures, 1)
+
+        self._post(return_value=_fake_response())
+        self.assertEqual(EndpointState.objects.get(endpoint="chat").failures, 0)
+
+    @override_settings(IA_RATE_LIMITS={})
+    def test_half_open_circuit_lets_one_probe_through(self):
+        """
+        Given un circuit ouvert dont le délai est écoulé
+        When un appel d'essai réussit
+        Then le circuit est refermé
+        """
+        import time
+
+        from ia.limiter import is_open
+        from ia.models import EndpointState
+
+        EndpointState.objects.create(endpoint="chat", failures=2, open_until=time.time() - 1)
+
+        self._post(return_value=_fake_response())
+
+        self.assertEqual(self.calls, 1)
+        self.assertFalse(is_open("chat"))
+        self.assertEqual(EndpointState.objects.get(endpoint="chat").failures, 0)
+
+    def test_views_fail_fast_when_circuit_is_open(self):
+        """
+        Given un circuit ouvert sur l'OCR
+        When un modérateur demande un résumé ou une analyse globale
+        Then un message d'indisponibilité est affiché et rien n'est mis en file
+        """
+        import time
+
+        from ia.models import EndpointState
+
+        EndpointState.objects.create(endpoint="ocr", failures=5, open_until=time.time() + 60)
+        self.client.force_login(_make_moderator())
+        doc = _make_document()
+
+        with patch("ia.views.tasks.summarize_document_task") as mock_task:
+            response = self.client.post(reverse("ia:summarize_document", args=[doc.pk]))
+        self.assertContains(response, "momentanément indisponible")
+        mock_task.enqueue.assert_not_called()
+
+        response = self.client.post(reverse("ia:global_analyze"), data={"query": "Total ?"})
+        self.assertContains(response, "momentanément indisponible")
+        self.assertFalse(Summary.objects.exists())
+
+    def test_task_reports_unavailable_service(self):
+        """
+        Given un circuit qui s'ouvre pendant l'exécution d'une tâche
+        When la tâche de résumé tourne
+        Then le Summary échoue avec le message d'indisponibilité
+        """
+        from ia.limiter import CircuitOpen
+        from ia.tasks import summarize_document_task
+
+        doc = _make_document()
+        summary = Summary.objects.create(document=doc, status=Summary.Status.PENDING)
+        with patch("ia.tasks.ai_utils.summarize_document", side_effect=CircuitOpen("chat")):
+            summarize_document_task.call(summary.pk)
+
+        summary.refresh_from_db()
+        self.assertEqual(summary.status, Summary.Status.FAILED)
+        self.assertEqual(summary.content, CircuitOpen.message)
+
+
+# ---------------------------------------------------------------------------
+# Tests : périmètre de l'analyse globale (collection, dates, titre)
+# ---------------------------------------------------------------------------
+
+@override_settings(TASKS=IMMEDIATE_TASKS, IA_STREAM_GLOBAL_ANALYSIS=False)
+class ScopedGlobalAnalysisTests(TestCase):
+
+    def setUp(self):
+        import datetime
+
+        from wagtail.models import Collection
+
+        self.client.force_login(_make_moderator())
+        root = Collection.get_first_root_node()
+        self.invoices = root.add_child(name="Factures")
+        self.invoices_2024 = self.invoices.add_child(name="2024")
+        archives = root.add_child(name="Archives")
+
+        self.edf = self._document("Facture EDF", datetime.date(2024, 3, 1), self.invoices_2024)
+        self.water = self._document("Facture eau", datetime.date(2023, 6, 1), self.invoices)
+        self.old = self._document("Facture EDF 2015", datetime.date(2015, 1, 1), archives)
+
+    def _document(self, title, date, collection):
+        doc = _make_document(title=title, date=date)
+        doc.collection = collection
+        doc.save()
+        return doc
+
+    def _analyze(self, **data):
+        with (
+            patch("ia.tasks.ai_utils.analyze_all_documents", return_value="Réponse") as mock_analyze,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.client.post(reverse("ia:global_analyze"), data={"query": "Total ?", **data})
+        return response, mock_analyze
+
+    def test_scope_filters_collection_descendants_dates_and_title(self):
+        """
+        Given des documents répartis dans une arborescence de collections
+        When on restreint le périmètre
+        Then la collection inclut ses sous-collections et les filtres se cumulent
+        """
+        from ia.utils import documents_to_analyze
+
+        self.assertCountEqual(
+            documents_to_analyze({"collection": self.invoices.pk}),
+            [self.edf, self.water],
+        )
+        self.assertCountEqual(
+            documents_to_analyze({"date_from": "2023-01-01", "date_to": "2023-12-31"}),
+            [self.water],
+        )
+        self.assertCountEqual(documents_to_analyze({"title": "edf"}), [self.edf, self.old])
+        self.assertCountEqual(
+            documents_to_analyze({"collection": self.invoices.pk, "title": "EDF"}),
+            [self.edf],
+        )
+
+    def test_view_analyzes_only_scoped_documents(self):
+        """
+        Given un périmètre « Factures depuis 2024 »
+        When un modérateur pose sa question
+        Then le périmètre est enregistré et seuls les documents retenus sont analysés
+        """
+        response, mock_analyze = self._analyze(
+            collection=self.invoices.pk,
+            date_from="2024-01-01",
+        )
+
+        summary = Summary.objects.get()
+        self.assertEqual(summary.scope, {"collection": self.invoices.pk, "date_from": "2024-01-01"})
+        self.assertEqual(list(mock_analyze.call_args.args[0]), [self.edf])
+        self.assertContains(response, "Périmètre : collection « Factures », depuis le 01/01/2024")
+
+    def test_empty_scope_is_rejected(self):
+        """
+        Given un périmètre qui ne retient aucun document
+        When un modérateur pose sa question
+        Then un message l'indique et aucune analyse n'est lancée
+        """
+        response, mock_analyze = self._analyze(title="introuvable")
+
+        self.assertContains(response, "Aucun document ne correspond")
+        mock_analyze.assert_not_called()
+        self.assertFalse(Summary.objects.exists())
+
+    def test_reversed_dates_are_rejected(self):
+        """
+        Given une date de début postérieure à la date de fin
+        When un modérateur pose sa question
+        Then le formulaire est refusé
+        """
+        response, _ = self._analyze(date_from="2024-12-31", date_to="2024-01-01")
+
+        self.assertContains(response, "La date de début doit précéder la date de fin.")
+        self.assertFalse(Summary.objects.exists())
+
+
+# ---------------------------------------------------------------------------
+# Tests : champs structurés des factures (InvoiceFields)
+# ---------------------------------------------------------------------------
+
+class InvoiceFieldsTests(TestCase):
+    OCR_TEXT = "Facture EDF n° 42 du 1er mars 2025, total 1 234,50 € TTC, échéance au 15 avril."
+    ANSWER = json.dumps({
+        "is_invoice": True,
+        "issuer": " EDF ",
+        "total": "1 234,50 €",
+        "currency": "€",
+        "invoice_date": "2025-03-01",
+        "category": "Energie",
+    })
+
+    def _invoice(self, doc, **fields):
+        from ia.models import InvoiceFields
+        from ia.utils import FIELDS_PROMPT_VERSION
+
+        return InvoiceFields.objects.create(
+            document=doc,
+            file_hash=doc.get_file_hash(),
+            prompt_version=FIELDS_PROMPT_VERSION,
+            **fields,
+        )
+
+    def test_answer_is_normalized(self):
+        """
+        Given une réponse du modèle aux formats libres (montant français, symbole €)
+        When on l'analyse
+        Then montant, devise, date et catégorie sont normalisés
+        """
+        import datetime
+        from decimal import Decimal
+
+        from ia.utils import parse_invoice_fields
+
+        fields = parse_invoice_fields(self.ANSWER)
+
+        self.assertEqual(fields, {
+            "is_invoice": True,
+            "issuer": "EDF",
+            "total": Decimal("1234.50"),
+            "currency": "EUR",
+            "invoice_date": datetime.date(2025, 3, 1),
+            "category": "energie",
+        })
+        self.assertEqual(
+            parse_invoice_fields('{"is_invoice": true, "total": "1,234.50", "category": "?"}')["total"],
+            Decimal("1234.50"),
+        )
+        self.assertEqual(parse_invoice_fields('{"category": "?"}')["category"], "autre")
+        with self.assertRaises(ValueError):
+            parse_invoice_fields("Voici les champs : EDF")
+
+    def test_non_invoice_has_no_total(self):
+        """
+        Given un relevé bancaire pour lequel le modèle donne quand même un montant
+        When on analyse sa réponse
+        Then le document n'est pas une facture et aucun montant n'est retenu
+        """
+        from ia.utils import parse_invoice_fields
+
+        for answer in ('{"is_invoice": false, "total": "3 000 €"}', '{"total": "3 000 €"}'):
+            fields = parse_invoice_fields(answer)
+            self.assertFalse(fields["is_invoice"])
+            self.assertIsNone(fields["total"])
+
+    def test_fields_are_extracted_once_per_prompt_version(self):
+        """
+        Given un document dont le texte est lisible
+        When on extrait ses champs de facture
+        Then ils sont enregistrés, réutilisés, puis à refaire si les consignes changent
+        """
+        from ia import utils as ai_utils
+        from ia.models import InvoiceFields
+
+        doc = _make_document()
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", return_value=self.ANSWER) as mock_chat,
+        ):
+            ai_utils.extract_invoice_fields(doc)
+
+        self.assertTrue(mock_chat.call_args.kwargs["json_mode"])
+        invoice = InvoiceFields.objects.get(document=doc)
+        self.assertEqual(invoice.status, InvoiceFields.Status.DONE)
+        self.assertEqual(invoice.issuer, "EDF")
+        self.assertEqual(ai_utils.current_invoice_fields(doc, doc.file_hash), invoice)
+        with patch("ia.utils.FIELDS_PROMPT_VERSION", "nouvelle"):
+            self.assertIsNone(ai_utils.current_invoice_fields(doc, doc.file_hash))
+
+    def test_unusable_answer_is_recorded_as_failed(self):
+        """
+        Given une réponse du modèle qui n'est pas du JSON
+        When on extrait les champs
+        Then une ligne en échec est enregistrée (pas de nouvel appel à chaque lecture)
+        """
+        from ia.models import InvoiceFields
+        from ia.utils import extract_invoice_fields
+
+        doc = _make_document()
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", return_value="Je ne sais pas."),
+        ):
+            invoice = extract_invoice_fields(doc)
+
+        self.assertEqual(invoice.status, InvoiceFields.Status.FAILED)
+        self.assertIsNone(invoice.total)
+
+    @override_settings(TASKS=IMMEDIATE_TASKS)
+    def test_fields_extracted_in_background_on_upload(self):
+        """
+        Given IA_EXTRACT_FIELDS_ON_UPLOAD activé (par défaut)
+        When un document est ajouté
+        Then ses champs de facture sont extraits après son texte
+        """
+        from ia.models import InvoiceFields
+
+        with (
+            patch("ia.utils._call_ocr", return_value={1: self.OCR_TEXT}),
+            patch("ia.utils._call_chat", return_value=self.ANSWER),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            doc = _make_document()
+
+        self.assertEqual(InvoiceFields.objects.get(document=doc).category, "energie")
+
+    @override_settings(IA_EXTRACT_ON_UPLOAD=False)
+    def test_backfill_reprocesses_stale_fields(self):
+        """
+        Given un document dont les champs ont été extraits avec d'anciennes consignes
+        When on lance ia_backfill --fields
+        Then ses champs sont ré-extraits
+        """
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from ia.models import ExtractedText, InvoiceFields
+
+        doc = _make_document()
+        ExtractedText.objects.create(document=doc, file_hash=doc.get_file_hash(), text=self.OCR_TEXT)
+        self._invoice(doc, issuer="Ancien")
+        InvoiceFields.objects.update(prompt_version="ancienne")
+
+        with patch("ia.utils._call_chat", return_value=self.ANSWER):
+            call_command("ia_backfill", "--fields", stdout=StringIO())
+
+        self.assertEqual(InvoiceFields.objects.get(document=doc).issuer, "EDF")
+
+    def test_figures_are_aggregated_in_sql_for_global_analysis(self):
+        """
+        Given des champs de facture extraits pour plusieurs documents
+        When on prépare l'analyse globale
+        Then les totaux par émetteur et par catégorie, calculés en base, sont fournis au modèle
+        """
+        import datetime
+        from decimal import Decimal
+
+        from ia.utils import _global_messages, invoice_figures
+
+        first = _make_document(title="EDF janvier", content=b"%PDF a")
+        second = _make_document(title="EDF février", content=b"%PDF b")
+        other = _make_document(title="Assurance", content=b"%PDF c")
+        for doc, total in ((first, "100.00"), (second, "50.50")):
+            self._invoice(
+                doc,
+                is_invoice=True,
+                issuer="EDF",
+                total=Decimal(total),
+                currency="EUR",
+                invoice_date=datetime.date(2025, 1, 15),
+                category="energie",
+            )
+        self._invoice(other, is_invoice=True, issuer="MAIF", total=None, category="assurance")
+        statement = _make_document(title="Relevé bancaire", content=b"%PDF d")
+        self._invoice(statement, issuer="EDF", total=Decimal("3000.00"), currency="EUR")
+
+        documents = CustomDocument.objects.all()
+        figures = invoice_figures(documents)
+        self.assertIn("- EDF — 2025 — 2 facture(s) — 150,50 EUR", figures)
+        self.assertIn("- Énergie — 2025 — 2 facture(s) — 150,50 EUR", figures)
+        self.assertNotIn("MAIF", figures)
+        self.assertNotIn("3\u202f000", figures)
+        self.assertEqual(invoice_figures(documents.filter(pk=other.pk)), "")
+
+        with (
+            override_settings(IA_RETRIEVAL_TOP_K=0),
+            patch("ia.utils.extract_texts", return_value=[self.OCR_TEXT] * 4),
+        ):
+            messages = _global_messages(documents, "Combien chez EDF en 2025 ?")
+        self.assertIn("Montants des factures calculés en base", messages[1]["content"])
+
+
+# ---------------------------------------------------------------------------
+# Tests : un seul résumé en cours par document (single-flight)
+# ---------------------------------------------------------------------------
+
+class SummarySingleFlightTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(_make_moderator())
+        self.doc = _make_document()
+        self.file_hash = self.doc.get_file_hash()
+
+    def test_concurrent_claims_share_one_summary(self):
+        """
+        Given un résumé en cours pour un fichier
+        When une seconde demande arrive pour le même fichier et les mêmes pages
+        Then elle reçoit le même Summary sans avoir à lancer de calcul
+        """
+        from ia.utils import claim_summary
+
+        leader, claimed = claim_summary(self.doc, self.file_hash)
+        follower, follower_claimed = claim_summary(self.doc, self.file_hash)
+        other_pages, other_claimed = claim_summary(self.doc, self.file_hash, "1")
+
+        self.assertTrue(claimed)
+        self.assertFalse(follower_claimed)
+        self.assertEqual(follower, leader)
+        self.assertTrue(other_claimed)
+        self.assertNotEqual(other_pages, leader)
+
+    def test_forced_double_click_enqueues_once(self):
+        """
+        Given deux clics rapides sur « Régénérer »
+        When les deux requêtes arrivent
+        Then une seule tâche est mise en file et les deux réponses suivent le même Summary
+        """
+        url = reverse("ia:summarize_document", args=[self.doc.pk])
+        with patch("ia.views.tasks.summarize_document_task") as mock_task:
+            first = self.client.post(url, {"force": "1"})
+            second = self.client.post(url, {"force": "1"})
+
+        summary = Summary.objects.get()
+        mock_task.enqueue.assert_called_once_with(summary.pk)
+        status_url = reverse("ia:summary_status", args=[summary.pk])
+        self.assertContains(first, status_url)
+        self.assertContains(second, status_url)
+
+    def test_lock_released_when_summary_finishes(self):
+        """
+        Given un résumé en cours
+        When la tâche se termine
+        Then le verrou est libéré et une régénération lance un nouveau calcul
+        """
+        from ia.tasks import summarize_document_task
+        from ia.utils import claim_summary
+
+        summary, _ = claim_summary(self.doc, self.file_hash)
+        with patch("ia.tasks.ai_utils.summarize_document", return_value="Résumé IA"):
+            summarize_document_task.call(summary.pk)
+
+        summary.refresh_from_db()
+        self.assertIsNone(summary.lock_key)
+        self.assertEqual(summary.status, Summary.Status.DONE)
+        regenerated, claimed = claim_summary(self.doc, self.file_hash)
+        self.assertTrue(claimed)
+        self.assertNotEqual(regenerated, summary)
+
+    @override_settings(IA_SUMMARY_LOCK_TIMEOUT=60)
+    def test_stale_lock_is_taken_over(self):
+        """
+        Given un résumé resté en cours au-delà du délai (worker interrompu)
+        When une nouvelle demande arrive
+        Then l'ancien est marqué en échec et un nouveau calcul est lancé
+        """
+        import datetime
+
+        from django.utils import timezone
+
+        from ia.utils import STALE_SUMMARY_MSG, claim_summary
+
+        stale, _ = claim_summary(self.doc, self.file_hash)
+        Summary.objects.filter(pk=stale.pk).update(
+            created_at=timezone.now() - datetime.timedelta(minutes=5),
+        )
+
+        summary, claimed = claim_summary(self.doc, self.file_hash)
+
+        self.assertTrue(claimed)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, Summary.Status.FAILED)
+        self.assertEqual(stale.content, STALE_SUMMARY_MSG)
+        self.assertIsNone(stale.lock_key)
+
+
+# ---------------------------------------------------------------------------
+# Tests : cache négatif des fichiers illisibles (ExtractionFailure)
+# ---------------------------------------------------------------------------
+
+class ExtractionFailureTests(TestCase):
+
+    def _failure(self, doc):
+        from ia.models import ExtractionFailure
+
+        return ExtractionFailure.objects.get(document=doc)
+
+    def test_ocr_failure_is_skipped_until_retry_after(self):
+        """
+        Given un scan dont l'OCR échoue
+        When deux analyses globales se suivent
+        Then l'échec est mémorisé et la seconde saute le fichier sans appel, sans le dire illisible
+        """
+        from ia.models import ExtractionFailure
+        from ia.utils import _global_messages, extract_texts
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", side_effect=RuntimeError("422 Unprocessable")) as mock_ocr:
+            self.assertEqual(extract_texts([doc]), [None])
+            failure = self._failure(doc)
+            self.assertEqual(failure.reason, ExtractionFailure.Reason.OCR_ERROR)
+            self.assertEqual(failure.detail, "422 Unprocessable")
+
+            self.assertEqual(extract_texts([doc]), [None])
+            with override_settings(IA_RETRIEVAL_TOP_K=0):
+                messages = _global_messages([doc], "Total ?")
+        self.assertEqual(mock_ocr.call_count, 1)
+        self.assertIn("[fichier introuvable ou illisible]", messages[1]["content"])
+
+    @override_settings(IA_FAILURE_RETRY_AFTER=60, IA_FAILURE_RETRY_MAX=100)
+    def test_retry_delay_doubles_up_to_maximum(self):
+        """
+        Given un scan illisible qui l'est encore après son délai
+        When il est retenté puis reste illisible
+        Then le délai double, dans la limite du maximum
+        """
+        import datetime
+
+        from django.utils import timezone
+
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", return_value={1: "~ ~"}):
+            for attempt in range(3):
+                ExtractionFailure.objects.update(retry_after=timezone.now() - datetime.timedelta(seconds=1))
+                ExtractedText.objects.all().delete()
+                before = timezone.now()
+                extract_texts([doc])
+        failure = self._failure(doc)
+        self.assertEqual(failure.attempts, 3)
+        self.assertAlmostEqual((failure.retry_after - before).total_seconds(), 100, delta=5)
+
+    @override_settings(IA_FAILURE_RETRY_AFTER=60, IA_FAILURE_RETRY_MAX=100)
+    def test_ocr_error_delay_does_not_double(self):
+        """
+        Given un fichier dont l'OCR échoue à nouveau après son délai
+        When il est retenté puis échoue encore
+        Then le délai reste IA_FAILURE_RETRY_AFTER
+        """
+        import datetime
+
+        from django.utils import timezone
+
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", side_effect=RuntimeError("422 Unprocessable")):
+            for attempt in range(3):
+                ExtractionFailure.objects.update(retry_after=timezone.now() - datetime.timedelta(seconds=1))
+                before = timezone.now()
+                extract_texts([doc])
+        failure = self._failure(doc)
+        self.assertEqual(failure.attempts, 3)
+        self.assertAlmostEqual((failure.retry_after - before).total_seconds(), 60, delta=5)
+
+    def test_transient_errors_are_not_recorded(self):
+        """
+        Given une OCR saturée (429), en panne (503) ou trop lente
+        When l'analyse globale lit le fichier
+        Then aucun échec n'est mémorisé et l'analyse suivante le redemande
+        """
+        import requests
+
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        errors = [
+            requests.HTTPError("429", response=_fake_response(429)),
+            requests.HTTPError("503", response=_fake_response(503)),
+            requests.ReadTimeout(),
+        ]
+        with patch("ia.utils._call_ocr", side_effect=errors) as mock_ocr:
+            for _ in errors:
+                self.assertEqual(extract_texts([doc]), [None])
+
+        self.assertEqual(mock_ocr.call_count, 3)
+        self.assertFalse(ExtractionFailure.objects.exists())
+
+    def test_missing_file_is_recorded(self):
+        """
+        Given un document dont le fichier a disparu du stockage
+        When on l'analyse
+        Then l'échec « introuvable » est mémorisé
+        """
+        import os
+
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        os.remove(doc.file.path)
+
+        self.assertEqual(extract_texts([doc]), [None])
+        self.assertEqual(self._failure(doc).reason, ExtractionFailure.Reason.MISSING)
+        self.assertEqual(extract_texts([doc]), [None])
+
+    def test_skipped_failure_is_not_summarized_as_unreadable(self):
+        """
+        Given un fichier en échec OCR passager, sauté par le cache négatif
+        When ia_summarize le traite pendant le délai
+        Then le résumé est en échec (à retenter), pas « illisible » et terminé
+        """
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from ia.utils import UNREADABLE_MSG, extract_texts
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", side_effect=RuntimeError("Connexion perdue")):
+            extract_texts([doc])
+        with patch("ia.utils._call_ocr") as mock_ocr:
+            call_command("ia_summarize", stdout=StringIO(), stderr=StringIO())
+
+        mock_ocr.assert_not_called()
+        summary = Summary.objects.get(document=doc)
+        self.assertEqual(summary.status, Summary.Status.FAILED)
+        self.assertNotEqual(summary.content, UNREADABLE_MSG)
+
+    @override_settings(IA_OCR_MAX_WORKERS=1, IA_GLOBAL_OCR_TIMEOUT=0.3)
+    def test_deadline_flags_nothing_and_late_result_is_collected(self):
+        """
+        Given un seul thread d'OCR et un premier fichier plus lent que le délai global
+        When le délai global expire
+        Then aucun fichier n'est mémorisé en échec, les autres ne sont pas envoyés
+        And le résultat du fichier en cours est enregistré à son arrivée
+        """
+        import threading
+        import time
+
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        docs = [_make_document(title=f"d{i}", content=f"%PDF {i}".encode()) for i in range(4)]
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_ocr(file_path, **options):
+            release.wait(5)
+            return {1: "Facture EDF janvier 2024, 85 euros TTC."}
+
+        with (
+            patch("ia.utils._call_ocr", side_effect=slow_ocr) as mock_ocr,
+            patch("ia.utils._collect_late_extraction") as mock_collect,
+        ):
+            self.assertEqual(extract_texts(docs), [None] * 4)
+            self.assertFalse(ExtractionFailure.objects.exists())
+            release.set()
+            for _ in range(50):
+                if mock_collect.called:
+                    break
+                time.sleep(0.05)
+
+        mock_ocr.assert_called_once()
+        mock_collect.assert_called_once()
+        future = mock_collect.call_args.args[0]
+        self.assertEqual(mock_collect.call_args.kwargs["doc"], docs[0])
+        self.assertEqual(future.result(), {1: "Facture EDF janvier 2024, 85 euros TTC."})
+
+    def test_late_extraction_is_stored(self):
+        """
+        Given une extraction du pool terminée après le délai global
+        When elle est enregistrée
+        Then son texte est mis en cache pour la prochaine analyse
+        """
+        from concurrent.futures import Future
+
+        from ia.utils import _collect_late_extraction
+
+        doc = _make_document()
+        future = Future()
+        future.set_result({1: "Facture EDF janvier 2024, 85 euros TTC."})
+
+        _collect_late_extraction(future, doc=doc, file_hash=doc.get_file_hash())
+
+        self.assertEqual(
+            ExtractedText.objects.get(document=doc).text,
+            "Facture EDF janvier 2024, 85 euros TTC.",
+        )
+
+    def test_fan_out_ocr_is_not_retried(self):
+        """
+        Given l'extraction parallèle de l'analyse globale
+        When un fichier part à l'OCR
+        Then l'appel est fait sans nouvelles tentatives (budget par document borné)
+        """
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        ocr = _fake_response(payload={"pages": [{"index": 0, "markdown": "Texte"}]})
+        with patch("ia.utils.client.post", return_value=ocr) as mock_post:
+            extract_texts([doc])
+
+        self.assertIs(mock_post.call_args.kwargs["retries"], False)
+
+    def test_unreadable_scan_flag_can_be_cleared_from_admin(self):
+        """
+        Given un scan dont l'OCR ne donne presque rien
+        When un modérateur utilise l'action « Réessayer l'extraction »
+        Then le drapeau et le texte mis en cache sont oubliés et l'OCR est refait
+        """
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", return_value={1: "~ ~"}):
+            self.assertEqual(extract_texts([doc]), ["~ ~"])
+        failure = self._failure(doc)
+        self.assertEqual(failure.reason, ExtractionFailure.Reason.UNREADABLE)
+
+        self.client.force_login(_make_moderator())
+        url = (
+            reverse("wagtail_bulk_action", args=["ia", "extractionfailure", "retry_extraction"])
+            + f"?id={failure.pk}&next=/admin/"
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url)
+
+        self.assertFalse(ExtractionFailure.objects.exists())
+        self.assertFalse(ExtractedText.objects.filter(document=doc).exists())
+        better = "Facture EDF janvier 2024 montant 85 euros TTC, relevé complet."
+        with patch("ia.utils._call_ocr", return_value={1: better}) as mock_ocr:
+            self.assertEqual(extract_texts([doc]), [better])
+        mock_ocr.assert_called_once()
+
+    def test_successful_extraction_clears_failures(self):
+        """
+        Given un fichier en échec dont le délai est passé
+        When l'OCR réussit enfin
+        Then l'échec est effacé
+        """
+        from ia.models import ExtractionFailure
+        from ia.utils import extract_texts
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", side_effect=RuntimeError):
+            extract_texts([doc])
+        ExtractionFailure.objects.update(retry_after="2000-01-01T00:00:00Z")
+        with patch("ia.utils._call_ocr", return_value={1: "Facture EDF janvier 2024, 85 euros TTC."}):
+            extract_texts([doc])
+
+        self.assertFalse(ExtractionFailure.objects.exists())
+
+
+# ---------------------------------------------------------------------------
+# Tests : allègement des images avant l'OCR
+# ---------------------------------------------------------------------------
+
+
+class OcrPreprocessTests(TestCase):
+
+    def _sent(self, doc, ocr_result=None):
+        """Appelle l'extraction et capture ce qui part à l'OCR (image, taille, options)."""
+        from io import BytesIO
+
+        from PIL import Image
+
+        from ia.utils import _extract_file
+
+        sent = {}
+
+        def fake_ocr(file_path, **options):
+            sent.update(options, path=file_path, size=file_path.stat().st_size)
+            content = file_path.read_bytes()
+            if options.get("mime_type", "").startswith("image/"):
+                sent["image"] = Image.open(BytesIO(content))
+            else:
+                from pypdf import PdfReader
+
+                sent["image"] = PdfReader(BytesIO(content)).pages[0].images[0].image
+            return ocr_result or {1: "Texte OCR"}
+
+        with patch("ia.utils._call_ocr", side_effect=fake_ocr):
+            _extract_file(doc)
+        return sent
+
+    @override_settings(IA_OCR_MAX_DIMENSION=1000, IA_OCR_JPEG_QUALITY=60)
+    def test_photo_is_sent_downscaled_in_grayscale_jpeg(self):
+        """
+        Given une photo de téléphone en couleur, en 3000×4000
+        When son texte est extrait
+        Then l'OCR reçoit un JPEG en niveaux de gris de 1000 px de haut au plus
+        And le fichier envoyé est plus petit que l'original, puis supprimé
+        """
+        content = _make_photo()
+        doc = _make_document(content=content, name="photo.jpg")
+
+        sent = self._sent(doc)
+
+        self.assertEqual(sent["mime_type"], "image/jpeg")
+        self.assertEqual(sent["image"].mode, "L")
+        self.assertEqual(sent["image"].size, (750, 1000))
+        self.assertLess(sent["size"], len(content))
+        self.assertFalse(sent["path"].exists())
+
+    @override_settings(IA_OCR_MAX_DIMENSION=1000)
+    def test_scanned_pdf_images_are_downscaled(self):
+        """
+        Given un PDF scanné en couleur, sans couche texte
+        When son texte est extrait
+        Then l'OCR reçoit un PDF dont l'image est en niveaux de gris et réduite
+        And les pages à océriser sont inchangées
+        """
+        content = _make_scanned_pdf(pages=2)
+        doc = _make_document(content=content)
+
+        sent = self._sent(doc, {1: "Page un " * 10, 2: "Page deux " * 10})
+
+        self.assertEqual(sent["pages"], [1, 2])
+        self.assertEqual(sent["image"].mode, "L")
+        self.assertEqual(max(sent["image"].size), 1000)
+        self.assertLess(sent["size"], len(content))
+
+    def test_quality_ceiling_bounds_recompression(self):
+        """
+        Given la même photo allégée avec deux plafonds de qualité JPEG
+        When on prépare l'envoi
+        Then le plafond le plus bas donne le fichier le plus petit
+        """
+        from ia import preprocess
+
+        doc = _make_document(content=_make_photo(), name="photo.jpg")
+        sizes = []
+        for quality in (90, 40):
+            with (
+                override_settings(IA_OCR_JPEG_QUALITY=quality),
+                preprocess.prepared(Path(doc.file.path)) as (path, _),
+            ):
+                sizes.append(path.stat().st_size)
+        self.assertLess(sizes[1], sizes[0])
+
+    def test_original_is_sent_when_not_smaller(self):
+        """
+        Given une petite image déjà compacte (PNG uni)
+        When on prépare l'envoi
+        Then le fichier original part tel quel, avec son type
+        """
+        from io import BytesIO
+
+        from PIL import Image
+
+        from ia import preprocess
+
+        output = BytesIO()
+        Image.new("L", (20, 20), "white").save(output, "PNG")
+        doc = _make_document(content=output.getvalue(), name="blanc.png")
+
+        with preprocess.prepared(Path(doc.file.path)) as (path, mime_type):
+            self.assertEqual(path, Path(doc.file.path))
+            self.assertEqual(mime_type, "image/png")
+
+    def test_oversized_original_is_not_preprocessed(self):
+        """
+        Given une photo plus grosse que IA_OCR_MAX_FILE_SIZE
+        When son texte est extrait
+        Then elle n'est même pas ouverte pour l'allègement, et DocumentTooLarge est levée
+        """
+        from ia.utils import DocumentTooLarge, _extract_file
+
+        doc = _make_document(content=_make_photo(), name="photo.jpg")
+        with (
+            override_settings(IA_OCR_MAX_FILE_SIZE=1000),
+            patch("ia.preprocess.Image.open") as mock_open,
+            patch("ia.utils._call_ocr") as mock_ocr,
+            self.assertRaises(DocumentTooLarge),
+        ):
+            _extract_file(doc)
+        mock_open.assert_not_called()
+        mock_ocr.assert_not_called()
+
+    @override_settings(IA_OCR_PREPROCESS=False)
+    def test_preprocessing_can_be_disabled(self):
+        """
+        Given IA_OCR_PREPROCESS désactivé
+        When le texte d'une photo est extrait
+        Then l'OCR reçoit le fichier original
+        """
+        doc = _make_document(content=_make_photo(), name="photo.jpg")
+
+        sent = self._sent(doc)
+
+        self.assertEqual(sent["path"], Path(doc.file.path))
+        self.assertEqual(sent["image"].mode, "RGB")
+
+    def test_unreadable_file_is_sent_as_is(self):
+        """
+        Given un PDF que pypdf ne sait pas lire
+        When son texte est extrait
+        Then le fichier part tel quel à l'OCR, sans erreur
+        """
+        from ia.utils import _extract_file
+
+        doc = _make_document()
+        with patch("ia.utils._call_ocr", return_value={1: "Texte OCR"}) as mock_ocr:
+            _extract_file(doc)
+        mock_ocr.assert_called_once_with(Path(doc.file.path))
+
+    def test_image_payload_uses_image_url(self):
+        """
+        Given une image à océriser
+        When on appelle l'API
+        Then le document est envoyé en `image_url` avec son type MIME
+        """
+        from unittest.mock import MagicMock
+
+        from ia.utils import _call_ocr
+
+        doc = _make_document(content=b"jpeg", name="photo.jpg")
+        response = MagicMock()
+        response.status_code = 200
+        response.content = b"{}"
+        response.json.return_value = {"pages": [{"index": 0, "markdown": "Reçu"}]}
+        with patch("ia.utils.client.post", return_value=response) as mock_post:
+            pages = _call_ocr(Path(doc.file.path), mime_type="image/jpeg")
+
+        self.assertEqual(pages, {1: "Reçu"})
+        document = json.loads(mock_post.call_args.kwargs["data"].read())["document"]
+        self.assertEqual(document["type"], "image_url")
+        self.assertTrue(document["image_url"].startswith("data:image/jpeg;base64,"))
+
+
+# ---------------------------------------------------------------------------
+# Tests : synthèses par collection et par mois (Digest)
+# ---------------------------------------------------------------------------
+
+
+@override_settings(IA_DIGEST_MIN_DOCUMENTS=3)
+class DigestTests(TestCase):
+
+    def setUp(self):
+        import datetime
+
+        from wagtail.models import Collection
+
+        root = Collection.get_first_root_node()
+        self.invoices = root.add_child(name="Factures")
+        self.minutes = root.add_child(name="Comptes rendus")
+        self.edf = self._document("Facture EDF", datetime.date(2024, 1, 10), self.invoices)
+        self.water = self._document("Facture eau", datetime.date(2024, 1, 20), self.invoices)
+        self.phone = self._document("Facture téléphone", datetime.date(2024, 2, 5), self.invoices)
+        self.meeting = self._document("CR assemblée générale", datetime.date(2024, 2, 8), self.minutes)
+
+    def _document(self, title, date, collection):
+        text = f"{title} : texte complet du document, montant 42 euros TTC, réglé.".encode()
+        doc = _make_document(title=title, date=date, content=text, name="doc.txt")
+        doc.collection = collection
+        doc.save()
+        return doc
+
+    def _chat(self, answers=()):
+        """Faux modèle : une synthèse par appel, puis les réponses données dans l'ordre."""
+        answers = list(answers)
+
+        def fake_chat(messages, json_mode=False, task=None):
+            prompt = messages[-1]["content"]
+            if prompt.startswith("Collection :"):
+                return "Synthèse : " + prompt.splitlines()[0]
+            return answers.pop(0)
+
+        return patch("ia.utils._call_chat", side_effect=fake_chat)
+
+    def test_refresh_builds_month_then_collection_digests(self):
+        """
+        Given une collection avec des documents sur deux mois
+        When on met à jour ses synthèses
+        Then une synthèse par mois puis une pour la collection sont enregistrées
+        """
+        from ia.models import Digest
+        from ia.utils import refresh_digests
+
+        with self._chat() as mock_chat:
+            digests = refresh_digests(self.invoices)
+
+        self.assertEqual(mock_chat.call_count, 3)
+        self.assertEqual([digest.period for digest in digests], ["2024-01", "2024-02", Digest.WHOLE])
+        january = Digest.objects.get(collection=self.invoices, period="2024-01")
+        self.assertEqual(january.document_count, 2)
+        self.assertEqual(january.period_label, "01/2024")
+        january_prompt = mock_chat.call_args_list[0].args[0][-1]["content"]
+        self.assertIn("Facture EDF", january_prompt)
+        self.assertNotIn("Facture téléphone", january_prompt)
+
+    def test_refresh_only_recomputes_changed_months(self):
+        """
+        Given des synthèses à jour
+        When un document de février est renommé
+        Then seules les synthèses de février et de la collection sont recalculées
+        And une nouvelle mise à jour sans changement n'appelle pas le modèle
+        """
+        from ia.models import Digest
+        from ia.utils import refresh_digests
+
+        with self._chat():
+            refresh_digests(self.invoices)
+        january = Digest.objects.get(collection=self.invoices, period="2024-01")
+
+        with self._chat() as mock_chat:
+            refresh_digests(self.invoices)
+        mock_chat.assert_not_called()
+
+        self.phone.title = "Facture Orange"
+        self.phone.save()
+        with self._chat() as mock_chat:
+            refresh_digests(self.invoices)
+
+        self.assertEqual(mock_chat.call_count, 2)
+        self.assertEqual(
+            Digest.objects.get(collection=self.invoices, period="2024-01").updated_at,
+            january.updated_at,
+        )
+
+    def test_month_with_unavailable_text_is_retried(self):
+        """
+        Given un document de janvier dont le texte n'a pas pu être lu à temps
+        When on met à jour les synthèses, puis à nouveau une fois le texte lisible
+        Then la synthèse de janvier n'est pas enregistrée la première fois
+        And elle est calculée à la mise à jour suivante
+        """
+        from ia.models import Digest
+        from ia.utils import refresh_digests
+
+        with (
+            self._chat() as mock_chat,
+            patch("ia.utils.extract_texts", side_effect=lambda docs: [None] * len(docs)),
+        ):
+            self.assertIsNone(refresh_digests(self.invoices))
+        self.assertFalse(Digest.objects.filter(collection=self.invoices, period="2024-01").exists())
+
+        with self._chat() as mock_chat:
+            digests = refresh_digests(self.invoices)
+
+        self.assertEqual([digest.period for digest in digests], ["2024-01", "2024-02", Digest.WHOLE])
+        self.assertIn("Facture EDF", mock_chat.call_args_list[0].args[0][-1]["content"])
+
+    def test_month_without_documents_loses_its_digest(self):
+        """
+        Given des synthèses à jour
+        When le seul document de février est supprimé
+        Then la synthèse de février disparaît et celle de la collection est recalculée
+        """
+        from ia.models import Digest
+        from ia.utils import refresh_digests
+
+        with self._chat():
+            refresh_digests(self.invoices)
+        self.phone.delete()
+        with self._chat() as mock_chat:
+            refresh_digests(self.invoices)
+
+        self.assertEqual(mock_chat.call_count, 1)
+        self.assertCountEqual(
+            Digest.objects.filter(collection=self.invoices).values_list("period", flat=True),
+            ["2024-01", Digest.WHOLE],
+        )
+
+    def test_broad_question_is_answered_from_digests(self):
+        """
+        Given une analyse globale de tous les documents
+        When le modèle répond à partir des synthèses
+        Then le texte des documents n'est pas relu
+        And la question porte sur une synthèse par collection
+        """
+        from ia.utils import analyze_all_documents, documents_to_analyze, refresh_digests
+
+        with self._chat():
+            refresh_digests(self.invoices)
+            refresh_digests(self.minutes)
+        with (
+            self._chat(["Réponse tirée des synthèses"]) as mock_chat,
+            patch("ia.utils.extract_texts") as mock_extract,
+        ):
+            answer = analyze_all_documents(documents_to_analyze({}), "Quels postes de dépense ?", scope={})
+
+        self.assertEqual(answer, "Réponse tirée des synthèses")
+        mock_extract.assert_not_called()
+        self.assertEqual(mock_chat.call_count, 1)
+        prompt = mock_chat.call_args.args[0][-1]["content"]
+        # Collections dans l'ordre de l'arborescence (alphabétique).
+        self.assertIn("[S1] Collection « Comptes rendus » — toute la collection (1 documents)", prompt)
+        self.assertIn("[S2] Collection « Factures » — toute la collection (3 documents)", prompt)
+        self.assertNotIn("texte complet du document", prompt)
+
+    def test_detail_request_reads_only_cited_digest_documents(self):
+        """
+        Given une question qui demande le détail d'une synthèse
+        When le modèle répond « DÉTAIL REQUIS : [S1] »
+        Then seul le texte des documents de cette synthèse est envoyé au second appel
+        """
+        from ia.utils import analyze_all_documents, documents_to_analyze
+
+        with override_settings(IA_RETRIEVAL_TOP_K=0), self._chat(
+            ["DÉTAIL REQUIS : [S1]", "Réponse détaillée"],
+        ) as mock_chat:
+            answer = analyze_all_documents(documents_to_analyze({}), "Que dit le CR de l'AG ?", scope={})
+
+        self.assertEqual(answer, "Réponse détaillée")
+        prompt = mock_chat.call_args.args[0][-1]["content"]
+        self.assertIn("CR assemblée générale : texte complet du document", prompt)
+        self.assertNotIn("Facture EDF", prompt)
+
+    def test_whole_month_scope_uses_month_digests(self):
+        """
+        Given un périmètre limité au mois de janvier 2024
+        When on pose la question
+        Then seule la synthèse de janvier des Factures est envoyée
+        """
+        import datetime
+
+        from ia.utils import analyze_all_documents, documents_to_analyze
+
+        self._document("Facture gaz", datetime.date(2024, 1, 25), self.invoices)
+        scope = {"date_from": "2024-01-01", "date_to": "2024-01-31"}
+        with self._chat(["Réponse"]) as mock_chat:
+            analyze_all_documents(documents_to_analyze(scope), "Total de janvier ?", scope=scope)
+
+        prompt = mock_chat.call_args.args[0][-1]["content"]
+        self.assertIn("[S1] Collection « Factures » — 01/2024 (3 documents)", prompt)
+        self.assertNotIn("[S2] Collection", prompt)
+
+    def test_partial_month_or_small_scope_reads_raw_text(self):
+        """
+        Given un périmètre qui coupe un mois, puis un périmètre trop petit
+        When on pose la question
+        Then aucune synthèse n'est calculée : le texte des documents est lu directement
+        """
+        from ia.models import Digest
+        from ia.utils import analyze_all_documents, documents_to_analyze
+
+        for scope in ({"date_from": "2024-01-15"}, {"collection": self.minutes.pk}):
+            with self._chat(["Réponse"]) as mock_chat:
+                analyze_all_documents(documents_to_analyze(scope), "Quoi ?", scope=scope)
+            self.assertEqual(mock_chat.call_count, 1)
+            self.assertNotIn("synthèses", mock_chat.call_args.args[0][-1]["content"])
+        self.assertFalse(Digest.objects.exists())
+
+    def test_streamed_answer_follows_detail_request(self):
+        """
+        Given une analyse globale diffusée en streaming
+        When la réponse tirée des synthèses demande le détail
+        Then le marqueur n'est pas diffusé et la réponse détaillée l'est
+        """
+        from ia.utils import documents_to_analyze, refresh_digests, stream_all_documents
+
+        with self._chat():
+            refresh_digests(self.invoices)
+            refresh_digests(self.minutes)
+        streams = iter([["DÉTAIL ", "REQUIS : [S2]"], ["Réponse ", "détaillée"]])
+        with patch("ia.utils._stream_chat", side_effect=lambda messages, task=None: iter(next(streams))) as mock_stream:
+            fragments = list(stream_all_documents(documents_to_analyze({}), "Détail EDF ?", scope={}))
+
+        self.assertEqual(fragments, ["Réponse ", "détaillée"])
+        self.assertIn("Facture EDF", mock_stream.call_args.args[0][-1]["content"])
+
+        streams = iter([["Réponse ", "des synthèses"]])
+        with patch("ia.utils._stream_chat", side_effect=lambda messages, task=None: iter(next(streams))):
+            fragments = list(stream_all_documents(documents_to_analyze({}), "Bilan ?", scope={}))
+        self.assertEqual("".join(fragments), "Réponse des synthèses")
+
+    def test_document_change_queues_deferred_refresh(self):
+        """
+        Given une collection d'au moins IA_DIGEST_MIN_DOCUMENTS documents
+        When un de ses documents est modifié
+        Then la mise à jour de ses synthèses est mise en file, différée
+        """
+        with patch("ia.signals.refresh_digests_task") as mock_task:
+            self.edf.title = "Facture EDF corrigée"
+            self.edf.save()
+            self.meeting.save()  # collection trop petite
+
+        mock_task.using.assert_called_once()
+        self.assertIn("run_after", mock_task.using.call_args.kwargs)
+        mock_task.using.return_value.enqueue.assert_called_once_with(self.invoices.pk)
+
+
+# ---------------------------------------------------------------------------
+# Tests : choix du modèle par type d'appel et modèle de repli (ia.routing)
+# ---------------------------------------------------------------------------
+
+
+@override_settings(
+    IA_CHAT_MODELS={
+        "summary": {"model": "petit", "fallback": "mini", "timeout": 10},
+        "global": {"model": "moyen", "fallback": "petit", "timeout": 20},
+        "extraction": {"model": "extracteur"},
+    },
+    IA_HTTP_TIMEOUTS={"ocr": (1, 2), "chat": (3, 60)},
+    IA_CIRCUIT_FAILURES=2,
+    IA_CIRCUIT_RESET_AFTER=60,
+)
+class RoutingTests(TestCase):
+    ANSWER = {"choices": [{"message": {"content": "Réponse"}}]}
+
+    def _models(self, mock_post):
+        return [call.kwargs["json"]["model"] for call in mock_post.call_args_list]
+
+    def test_each_task_type_uses_its_model(self):
+        """
+        Given une route par type d'appel
+        When on appelle le chat pour un résumé, une analyse globale et une extraction
+        Then chaque appel part vers le modèle principal de sa route
+        """
+        from ia import routing
+        from ia.utils import _call_chat
+
+        with patch("ia.utils.client.post", return_value=_fake_response(payload=self.ANSWER)) as mock_post:
+            _call_chat([], task=routing.SUMMARY)
+            _call_chat([], task=routing.GLOBAL)
+            _call_chat([], json_mode=True, task=routing.EXTRACTION)
+
+        self.assertEqual(self._models(mock_post), ["petit", "moyen", "extracteur"])
+        first, second, third = mock_post.call_args_list
+        self.assertEqual((first.kwargs["retries"], first.kwargs["timeout"]), (False, (3, 10)))
+        self.assertEqual(second.kwargs["timeout"], (3, 20))
+        # Sans repli : nouvelles tentatives et timeout par défaut du client.
+        self.assertNotIn("retries", third.kwargs)
+        self.assertNotIn("timeout", third.kwargs)
+
+    def test_rate_limited_primary_falls_back(self):
+        """
+        Given un modèle principal qui répond 429
+        When on appelle le chat
+        Then le modèle de repli répond, et c'est lui qui est noté
+        """
+        from ia import routing
+        from ia.models import ApiCall
+        from ia.utils import _call_chat
+
+        responses = [_fake_response(429), _fake_response(payload=self.ANSWER)]
+        with (
+            patch("ia.utils.client.post", side_effect=responses) as mock_post,
+            routing.recording() as models,
+        ):
+            answer = _call_chat([], task=routing.GLOBAL)
+
+        self.assertEqual(answer, "Réponse")
+        self.assertEqual(self._models(mock_post), ["moyen", "petit"])
+        self.assertNotIn("retries", mock_post.call_args.kwargs)
+        self.assertEqual(models, ["petit"])
+        self.assertEqual(
+            list(ApiCall.objects.order_by("pk").values_list("model", "outcome")),
+            [("moyen", "http_error"), ("petit", "ok")],
+        )
+
+    def test_slow_primary_falls_back(self):
+        """
+        Given un modèle principal qui dépasse son délai de lecture
+        When on appelle le chat
+        Then le modèle de repli répond
+        """
+        import requests
+
+        from ia.utils import _call_chat
+
+        responses = [requests.ReadTimeout(), _fake_response(payload=self.ANSWER)]
+        with patch("ia.utils.client.post", side_effect=responses) as mock_post:
+            self.assertEqual(_call_chat([]), "Réponse")
+
+        self.assertEqual(self._models(mock_post), ["petit", "mini"])
+
+    def test_invalid_request_does_not_fall_back(self):
+        """
+        Given un modèle principal qui rejette la requête (400)
+        When on appelle le chat
+        Then l'erreur est remontée sans appeler le modèle de repli
+        """
+        import requests
+
+        from ia.utils import _call_chat
+
+        with patch("ia.utils.client.post", return_value=_fake_response(400)) as mock_post:
+            with self.assertRaises(requests.HTTPError):
+                _call_chat([])
+
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_failing_primary_is_skipped_while_its_circuit_is_open(self):
+        """
+        Given un modèle principal en échec IA_CIRCUIT_FAILURES fois de suite
+        When on appelle à nouveau le chat
+        Then l'appel part directement vers le modèle de repli
+        """
+        from ia.utils import _call_chat
+
+        def fake_post(endpoint, url, json, **options):
+            return _fake_response(503 if json["model"] == "petit" else 200, payload=self.ANSWER)
+
+        with patch("ia.utils.client.post", side_effect=fake_post) as mock_post:
+            _call_chat([])
+            _call_chat([])
+            mock_post.reset_mock()
+            _call_chat([])
+
+        self.assertEqual(self._models(mock_post), ["mini"])
+
+    def test_streamed_chat_falls_back_before_first_fragment(self):
+        """
+        Given un modèle principal qui répond 503 en streaming
+        When on consomme _stream_chat
+        Then les fragments viennent du modèle de repli
+        """
+        from unittest.mock import MagicMock
+
+        from ia.utils import _stream_chat
+
+        unavailable = _fake_response(503)
+        available = MagicMock(status_code=200)
+        available.iter_lines.return_value = iter([
+            b'data: {"choices": [{"delta": {"content": "Bonjour"}}]}',
+            b"data: [DONE]",
+        ])
+        with patch("ia.utils.client.post") as mock_post:
+            mock_post.return_value.__enter__.side_effect = [unavailable, available]
+            chunks = list(_stream_chat([]))
+
+        self.assertEqual(chunks, ["Bonjour"])
+        self.assertEqual(self._models(mock_post), ["moyen", "petit"])
+
+    def test_summary_records_the_answering_model(self):
+        """
+        Given un modèle principal saturé
+        When une tâche de résumé s'exécute
+        Then le Summary enregistre le modèle de repli qui a répondu
+        """
+        from ia import tasks
+        from ia.utils import summarize_text
+
+        summary = Summary.objects.create(document=_make_document(), status=Summary.Status.PENDING)
+        responses = [_fake_response(429), _fake_response(payload=self.ANSWER)]
+        with patch("ia.utils.client.post", side_effect=responses):
+            tasks._run(summary, summarize_text, "Facture EDF du 12/01/2024, montant 84,20 €. " * 3)
+
+        summary.refresh_from_db()
+        self.assertEqual((summary.status, summary.content, summary.model), ("done", "Réponse", "mini"))
@@ -7,4 +7,7 @@ app_name = "ia"
 urlpatterns = [
     path("documents/<int:doc_id>/resumer/", views.summarize_document, name="summarize_document"),
     path("analyser/", views.global_analyze, name="global_analyze"),
+    path("analyser/<int:pk>/flux/", views.global_analyze_stream, name="global_analyze_stream"),
+    path("resumes/<int:pk>/", views.summary_status, name="summary_status"),
+    path("metriques/", views.metrics_text, name="metrics"),
 ]
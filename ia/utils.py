@@ -1,141 +1,1552 @@
 """Wrappers Mistral pour l'analyse de documents."""
 
-import base64
+import hashlib
+import json
 import logging
+import re
+import threading
+import unicodedata
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from functools import partial
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
 
-import requests
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from wagtail.documents import get_document_model
+from wagtail.models import Collection
+
+from . import client, extraction, limiter, metrics, preprocess, retrieval, routing
+from .models import (
+    Digest,
+    ExtractedPage,
+    ExtractedText,
+    ExtractionFailure,
+    InvoiceFields,
+    PartialAnalysis,
+    Summary,
+    TextChunk,
+)
 
 logger = logging.getLogger(__name__)
 
-MISTRAL_OCR_URL = "https://api.mistral.ai/v1/ocr"
-MISTRAL_CHAT_URL = "https://api.mistral.ai/v1/chat/completions"
-CHAT_MODEL = "mistral-small-latest"
 OCR_MODEL = "mistral-ocr-latest"
 
 UNREADABLE_MSG = (
     "Ce fichier a été scanné comme un bourrin par Gab, donc illisible 🐴"
 )
 
+SUMMARY_SYSTEM_PROMPT = (
+    "Tu es un assistant qui analyse des factures et documents "
+    "pour une association. Réponds toujours en français, de façon "
+    "concise et structurée."
+)
+SUMMARY_USER_PROMPT = (
+    "Voici le contenu extrait d'un document. "
+    "Fais un résumé court : objet, fournisseur/émetteur, "
+    "montant si présent, date si présente."
+)
+# Change dès que les consignes ou les modèles changent : les résumés
+# enregistrés avec une autre version ne sont plus réutilisés.
+SUMMARY_PROMPT_VERSION = hashlib.sha256(
+    "\x1f".join(
+        [OCR_MODEL, *routing.models(routing.SUMMARY), SUMMARY_SYSTEM_PROMPT, SUMMARY_USER_PROMPT]
+    ).encode()
+).hexdigest()[:12]
+
+GLOBAL_SYSTEM_PROMPT = (
+    "Tu es un assistant qui analyse des factures et documents "
+    "pour une association. Réponds toujours en français. "
+    "Cite tes sources : titre du document et page lorsqu'elle est indiquée. "
+    "Pour les totaux et comptages, appuie-toi sur les montants calculés "
+    "en base lorsqu'ils sont fournis."
+)
+
+GLOBAL_PROMPT_VERSION = hashlib.sha256(
+    "\x1f".join([OCR_MODEL, *routing.models(routing.GLOBAL), GLOBAL_SYSTEM_PROMPT]).encode()
+).hexdigest()[:12]
+
+INVOICE_FIELDS_PROMPT = (
+    "Tu extrais les informations d'un document reçu par une association. "
+    "Réponds uniquement par un objet JSON avec les clés : "
+    "\"is_invoice\" (true si le document est une facture ou un reçu de paiement, "
+    "false sinon : relevé bancaire, courrier, devis, compte rendu…), "
+    "\"issuer\" (émetteur / fournisseur), "
+    "\"total\" (montant total TTC de la facture, nombre ; null si ce n'est pas une facture), "
+    "\"currency\" (code ISO 4217, ex. EUR), "
+    "\"invoice_date\" (date de la facture, AAAA-MM-JJ), "
+    "\"category\" (une valeur parmi : "
+    + ", ".join(InvoiceFields.Category.values)
+    + "). Mets null pour une information absente."
+)
+# Comme SUMMARY_PROMPT_VERSION : un changement relance l'extraction (ia_backfill --fields).
+FIELDS_PROMPT_VERSION = hashlib.sha256(
+    "\x1f".join([OCR_MODEL, *routing.models(routing.EXTRACTION), INVOICE_FIELDS_PROMPT]).encode()
+).hexdigest()[:12]
+
+STALE_SUMMARY_MSG = "Le résumé n'a pas abouti dans les temps, merci de relancer."
+
+DIGEST_SYSTEM_PROMPT = (
+    "Tu rédiges des synthèses de documents (factures, courriers, comptes "
+    "rendus) pour une association. Réponds toujours en français, de façon "
+    "factuelle."
+)
+MONTH_DIGEST_PROMPT = (
+    "Voici les documents d'une collection pour une période. Rédige-en une "
+    "synthèse d'au plus 15 lignes : types de documents, émetteurs, montants "
+    "et dates notables, sujets abordés. Cite le titre des documents importants."
+)
+COLLECTION_DIGEST_PROMPT = (
+    "Voici les synthèses mensuelles des documents d'une collection. Rédige une "
+    "synthèse d'ensemble d'au plus 25 lignes : évolution dans le temps, "
+    "émetteurs récurrents, montants notables, sujets principaux."
+)
+# Comme SUMMARY_PROMPT_VERSION : un changement fait recalculer les synthèses.
+DIGEST_PROMPT_VERSION = hashlib.sha256(
+    "\x1f".join(
+        [
+            *routing.models(routing.SUMMARY),
+            DIGEST_SYSTEM_PROMPT,
+            MONTH_DIGEST_PROMPT,
+            COLLECTION_DIGEST_PROMPT,
+        ]
+    ).encode()
+).hexdigest()[:12]
+
+DETAIL_MARKER = "DÉTAIL REQUIS"
+DIGEST_ANSWER_PROMPT = (
+    "Réponds à partir de ces synthèses. Si elles ne suffisent pas pour répondre "
+    "précisément (contenu exact d'un document, ligne de facture, citation…), "
+    f"réponds uniquement « {DETAIL_MARKER} : » suivi des références ([S1], "
+    "[S2]…) des synthèses à approfondir."
+)
+
+# Estimation grossière (français) utilisée pour le budget de contexte.
+CHARS_PER_TOKEN = 4
+
+
+class DocumentTooLarge(Exception):
+    """Le fichier dépasse IA_OCR_MAX_FILE_SIZE : il n'est pas envoyé à l'OCR."""
+
 
-def _headers() -> dict:
+def _call_ocr(
+    file_path: Path,
+    pages: list[int] | None = None,
+    mime_type: str = preprocess.PDF_MIME,
+    retries: bool = True,
+) -> dict[int, str]:
+    """Extrait le texte d'un PDF ou d'une image via l'API OCR Mistral, par numéro de page (à partir de 1).
+
+    `pages` limite l'OCR à certaines pages. Le fichier est encodé en base64
+    au fil de l'envoi (Base64JSONBody), sans jamais être chargé entièrement
+    en mémoire. `retries=False` : un seul essai, borné par le timeout « ocr ».
+    """
+    data_url = f"data:{mime_type};base64,{client.Base64JSONBody.PLACEHOLDER}"
+    if mime_type.startswith("image/"):
+        document = {"type": "image_url", "image_url": data_url}
+    else:
+        document = {"type": "document_url", "document_url": data_url}
+    payload = {"model": OCR_MODEL, "document": document}
+    if pages is not None:
+        # L'API numérote les pages à partir de 0.
+        payload["pages"] = [number - 1 for number in pages]
+    body = client.Base64JSONBody(json.dumps(payload), file_path)
+    with metrics.measure("ocr", len(body), model=OCR_MODEL) as call:
+        response = client.post("ocr", settings.MISTRAL_OCR_URL, data=body, retries=retries)
+        call.status_code = response.status_code
+        call.response_bytes = len(response.content)
+        response.raise_for_status()
+        data = response.json()
     return {
-        "Authorization": f"Bearer {settings.MISTRAL_API_KEY}",
-        "Content-Type": "application/json",
+        page.get("index", position) + 1: page.get("markdown", "").strip()
+        for position, page in enumerate(data.get("pages", []))
     }
 
 
-def _call_ocr(pdf_b64: str) -> str:
-    """Extrait le texte d'un PDF via l'API OCR Mistral."""
-    response = requests.post(
-        MISTRAL_OCR_URL,
-        headers=_headers(),
-        json={
-            "model": OCR_MODEL,
-            "document": {
-                "type": "document_url",
-                "document_url": f"data:application/pdf;base64,{pdf_b64}",
-            },
-        },
-        timeout=60,
+def _payload_size(payload: dict) -> int:
+    return len(json.dumps(payload).encode())
+
+
+def _call_chat(
+    messages: list[dict],
+    json_mode: bool = False,
+    task: str = routing.SUMMARY,
+) -> str:
+    """Appelle le modèle de chat de la route `task` (réponse JSON imposée si `json_mode`).
+
+    Le modèle de repli de la route prend le relais si le principal est
+    saturé, en panne ou trop lent (voir ia.routing).
+    """
+    for attempt in routing.attempts(task):
+        with attempt:
+            return _chat_completion(messages, attempt.model, json_mode, **attempt.options)
+
+
+def _chat_completion(messages: list[dict], model: str, json_mode: bool = False, **options) -> str:
+    payload = {
+        "model": model,
+        "messages": messages,
+    }
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+    with metrics.measure("chat", _payload_size(payload), model=model) as call:
+        response = client.post("chat", settings.MISTRAL_CHAT_URL, json=payload, **options)
+        call.status_code = response.status_code
+        call.response_bytes = len(response.content)
+        response.raise_for_status()
+        data = response.json()
+        call.usage = data.get("usage") or {}
+    return data["choices"][0]["message"]["content"].strip()
+
+
+def _stream_chat(messages: list[dict], task: str = routing.GLOBAL) -> Iterator[str]:
+    """Appelle le modèle de chat de la route `task` en streaming et produit le texte au fil de l'eau.
+
+    Le repli n'est possible qu'avant le premier fragment : une fois la
+    diffusion commencée, une erreur est propagée telle quelle.
+    """
+    for attempt in routing.attempts(task):
+        with attempt:
+            fragments = _chat_stream(messages, attempt.model, **attempt.options)
+            first = next(fragments, None)
+            break
+    if first is not None:
+        yield first
+        yield from fragments
+
+
+def _chat_stream(messages: list[dict], model: str, **options) -> Iterator[str]:
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+    }
+    with (
+        metrics.measure("chat_stream", _payload_size(payload), model=model) as call,
+        client.post("chat", settings.MISTRAL_CHAT_URL, json=payload, stream=True, **options) as response,
+    ):
+        call.status_code = response.status_code
+        response.raise_for_status()
+        # Flux SSE : une ligne « data: {...} » par fragment, « data: [DONE] » à la fin.
+        for line in response.iter_lines():
+            call.response_bytes += len(line) + 1
+            line = line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue
+            data = line.removeprefix("data:").strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            # L'usage arrive avec le dernier fragment.
+            call.usage = event.get("usage") or call.usage
+            delta = event["choices"][0]["delta"].get("content")
+            if delta:
+                yield delta
+
+
+def _check_ocr_size(document, file_path: Path) -> None:
+    size = file_path.stat().st_size
+    if size > settings.IA_OCR_MAX_FILE_SIZE:
+        raise DocumentTooLarge(
+            f"« {document.title} » est trop volumineux pour l'analyse "
+            f"({size / 1024 / 1024:.1f} Mo, maximum "
+            f"{settings.IA_OCR_MAX_FILE_SIZE / 1024 / 1024:.0f} Mo)."
+        )
+
+
+def _ocr_file(
+    document,
+    file_path: Path,
+    pages: list[int] | None = None,
+    retries: bool = True,
+) -> dict[int, str]:
+    """OCR de la version allégée du fichier (ia.preprocess), si l'original passe IA_OCR_MAX_FILE_SIZE."""
+    with preprocess.prepared(file_path, pages) as (path, mime_type):
+        _check_ocr_size(document, path)
+        options = {} if pages is None else {"pages": pages}
+        if mime_type != preprocess.PDF_MIME:
+            options["mime_type"] = mime_type
+        if not retries:
+            options["retries"] = False
+        return _call_ocr(path, **options)
+
+
+def _extract_file(
+    document,
+    known: dict[int, str] | None = None,
+    retries: bool = True,
+) -> dict[int, str | None]:
+    """Extrait le texte d'un document page par page, sans passer par le cache.
+
+    Les formats bureautiques (txt, csv, xlsx, docx, odt, pptx) sont lus
+    localement, en une seule « page ». Les images (photos, scans) partent à
+    l'OCR distant. Pour un PDF, la couche texte est lue localement : seules
+    les pages sans texte suffisant (scans) et absentes de `known` (pages déjà
+    lues) partent à l'OCR distant. Les autres formats (zip, key, rtf…) ne
+    sont pas analysables et donnent un texte vide.
+
+    Une page dont l'OCR a échoué vaut None. `retries=False` : chaque appel
+    OCR est fait une seule fois (voir _call_ocr).
+    """
+    known = known or {}
+    file_path = Path(document.file.path)
+    if extraction.has_local_extractor(file_path):
+        return {1: extraction.local_text(file_path)}
+    if preprocess.is_image(file_path):
+        return _ocr_file(document, file_path, retries=retries)
+    if not extraction.is_pdf(file_path):
+        logger.info("Format non pris en charge par l'analyse : %s", document.title)
+        return {1: ""}
+
+    # Mémoire bornée : un PDF trop volumineux n'est même pas ouvert.
+    _check_ocr_size(document, file_path)
+    page_texts = extraction.pdf_page_texts(file_path)
+    if page_texts is None:
+        return _ocr_file(document, file_path, retries=retries)
+
+    pages: dict[int, str | None] = {
+        number: known.get(number, text)
+        for number, text in enumerate(page_texts, start=1)
+    }
+    weak = [
+        number for number in extraction.weak_pages(pages)
+        if number not in known
+    ]
+    if weak:
+        try:
+            ocr_pages = _ocr_file(document, file_path, pages=weak, retries=retries)
+        except (DocumentTooLarge, limiter.ServiceUnavailable):
+            raise  # fichier refusé ou service coupé : rien à reprocher aux pages
+        except Exception:
+            logger.warning("OCR des pages %s impossible : %s", weak, document.title)
+            return {**pages, **dict.fromkeys(weak)}
+        for number in weak:
+            if number not in ocr_pages:
+                pages[number] = None  # absente de la réponse : redemandée plus tard
+            elif len(ocr_pages[number]) > len(pages[number]):
+                pages[number] = ocr_pages[number]
+            # sinon, le texte local est conservé : l'OCR ne fait pas mieux.
+    return pages
+
+
+def _join_pages(pages) -> str:
+    return "\n\n".join(text for _, text in sorted(pages) if text).strip()
+
+
+class ExtractionIncomplete(Exception):
+    """Certaines pages n'ont pas pu être lues ; elles seront redemandées."""
+
+
+@transaction.atomic
+def _store_pages(document, file_hash: str, pages: dict[int, str | None]) -> str | None:
+    """Enregistre les pages extraites ; met en cache le texte complet si aucune n'a échoué.
+
+    Retourne le texte complet, ou None s'il reste des pages en échec.
+    """
+    ExtractedPage.objects.filter(document=document, file_hash=file_hash).delete()
+    ExtractedPage.objects.bulk_create(
+        ExtractedPage(
+            document=document,
+            file_hash=file_hash,
+            number=number,
+            text=text or "",
+            text_hash=hashlib.sha1((text or "").encode()).hexdigest(),
+            status=ExtractedPage.Status.FAILED if text is None else ExtractedPage.Status.DONE,
+        )
+        for number, text in sorted(pages.items())
+    )
+    if None in pages.values():
+        return None
+
+    text = _join_pages(pages.items())
+    ExtractedText.objects.update_or_create(
+        document=document,
+        file_hash=file_hash,
+        defaults={"text": text},
     )
-    response.raise_for_status()
-    pages = response.json().get("pages", [])
-    return "\n\n".join(page.get("markdown", "") for page in pages).strip()
+    retrieval.index_document(document, file_hash, sorted(pages.items()))
+    return text
 
 
-def _call_chat(messages: list[dict]) -> str:
-    """Appelle le modèle de chat Mistral."""
-    response = requests.post(
-        MISTRAL_CHAT_URL,
-        headers=_headers(),
-        json={
-            "model": CHAT_MODEL,
-            "messages": messages,
+def _known_pages(document, file_hash: str) -> dict[int, str]:
+    return dict(
+        ExtractedPage.objects.filter(
+            document=document,
+            file_hash=file_hash,
+            status=ExtractedPage.Status.DONE,
+        ).values_list("number", "text")
+    )
+
+
+def _record_failure(document, file_hash: str, reason: str, detail: str = "") -> None:
+    """Mémorise un échec d'extraction.
+
+    Pour un fichier introuvable, trop volumineux ou illisible, le délai avant
+    nouvel essai double à chaque fois ; un échec de l'OCR est retenté après
+    IA_FAILURE_RETRY_AFTER.
+    """
+    previous = (
+        ExtractionFailure.objects.filter(document=document, file_hash=file_hash)
+        .values_list("attempts", flat=True)
+        .first()
+    )
+    attempts = (previous or 0) + 1
+    if reason == ExtractionFailure.Reason.OCR_ERROR:
+        delay = settings.IA_FAILURE_RETRY_AFTER
+    else:
+        delay = min(
+            settings.IA_FAILURE_RETRY_AFTER * 2 ** (attempts - 1),
+            settings.IA_FAILURE_RETRY_MAX,
+        )
+    ExtractionFailure.objects.update_or_create(
+        document=document,
+        file_hash=file_hash,
+        defaults={
+            "reason": reason,
+            "detail": detail[:255],
+            "attempts": attempts,
+            "retry_after": timezone.now() + timedelta(seconds=delay),
         },
-        timeout=60,
     )
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"].strip()
 
 
-def summarize_document(document) -> str:
-    """Résume un document individuel via OCR + Chat.
+def _record_outcome(document, file_hash: str, text: str | None) -> None:
+    """Mémorise une extraction illisible, ou efface les échecs passés.
+
+    Une extraction incomplète n'est pas mémorisée : seules ses pages
+    manquantes seront redemandées.
+    """
+    if text is None:
+        return
+    if len(text) < 30:
+        _record_failure(document, file_hash, ExtractionFailure.Reason.UNREADABLE)
+    else:
+        ExtractionFailure.objects.filter(document=document).delete()
+
+
+def clear_extraction_failures(failures) -> int:
+    """Lève le cache négatif : les fichiers seront ré-extraits à la prochaine analyse.
+
+    Pour un contenu illisible, le texte déjà extrait est aussi oublié afin
+    que l'OCR soit refait (par exemple avec un meilleur modèle).
+    """
+    count = 0
+    for failure in failures:
+        if failure.reason == ExtractionFailure.Reason.UNREADABLE:
+            for model in (ExtractedText, ExtractedPage, TextChunk):
+                model.objects.filter(
+                    document_id=failure.document_id,
+                    file_hash=failure.file_hash,
+                ).delete()
+        failure.delete()
+        count += 1
+    return count
+
+
+def extract_text(document) -> str:
+    """Retourne le texte extrait d'un document.
+
+    Le résultat est mis en cache par empreinte du fichier : l'extraction
+    (et l'OCR distant) n'est refaite que si le fichier a été remplacé depuis.
+    Si des pages ont échoué, seules celles-ci sont redemandées à l'appel
+    suivant ; en attendant, ExtractionIncomplete est levée.
+    """
+    file_hash = document.get_file_hash()
+    cached = ExtractedText.objects.filter(
+        document=document,
+        file_hash=file_hash,
+    ).first()
+    metrics.record_cache("text", hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        return cached.text
+
+    pages = _extract_file(document, _known_pages(document, file_hash))
+    text = _store_pages(document, file_hash, pages)
+    _record_outcome(document, file_hash, text)
+    if text is None:
+        raise ExtractionIncomplete(
+            f"Certaines pages de « {document.title} » n'ont pas pu être lues."
+        )
+    return text
+
+
+def _collect_extraction(future, doc, file_hash: str) -> str | None:
+    """Enregistre le résultat d'une extraction du pool (texte, ou échec mémorisé)."""
+    try:
+        pages = future.result()
+    except DocumentTooLarge as exc:
+        logger.warning("%s", exc)
+        _record_failure(doc, file_hash, ExtractionFailure.Reason.TOO_LARGE, str(exc))
+        return None
+    except FileNotFoundError:
+        logger.warning("Fichier introuvable : %s", doc.title)
+        _record_failure(doc, file_hash, ExtractionFailure.Reason.MISSING)
+        return None
+    except limiter.ServiceUnavailable:
+        logger.warning("Service d'IA indisponible, fichier non lu : %s", doc.title)
+        return None
+    except Exception as exc:
+        if client.is_transient(exc):
+            # Saturation ou panne passagère : rien à reprocher au fichier.
+            logger.warning("OCR indisponible (%s), fichier non lu : %s", exc, doc.title)
+            return None
+        logger.warning("Impossible de lire le fichier : %s", doc.title)
+        _record_failure(
+            doc,
+            file_hash,
+            ExtractionFailure.Reason.OCR_ERROR,
+            str(exc) or type(exc).__name__,
+        )
+        return None
+    text = _store_pages(doc, file_hash, pages)
+    _record_outcome(doc, file_hash, text)
+    return text
+
+
+def _collect_late_extraction(future, doc, file_hash: str) -> None:
+    """Enregistre une extraction terminée après IA_GLOBAL_OCR_TIMEOUT.
+
+    Appelée dans le thread du pool qui l'a faite : comme pour ia.limiter,
+    la connexion BDD du thread est fermée ensuite.
+    """
+    try:
+        _collect_extraction(future, doc, file_hash)
+        metrics.flush()
+    except Exception:
+        logger.exception("Impossible d'enregistrer l'extraction tardive : %s", doc.title)
+    finally:
+        limiter.release_connection()
+
+
+def extract_texts(documents) -> list[str | None]:
+    """Extrait le texte de plusieurs documents, en parallèle.
+
+    Les documents absents du cache sont extraits par un pool de
+    IA_OCR_MAX_WORKERS threads. Chaque appel OCR est fait une seule fois,
+    borné par le timeout « ocr » de IA_HTTP_TIMEOUTS, et l'ensemble par
+    IA_GLOBAL_OCR_TIMEOUT : un fichier introuvable, en erreur ou trop lent
+    vaut None sans bloquer les autres. Une extraction encore en cours au
+    délai global est enregistrée quand elle se termine (pour la prochaine
+    analyse).
+
+    Ces échecs sont mémorisés (ExtractionFailure) : jusqu'à leur date de
+    nouvel essai, les fichiers concernés sont sautés sans nouvel appel. Ils
+    valent "" si leur contenu est illisible, None pour les autres échecs
+    (les appelants ne doivent pas les prendre pour un contenu illisible).
+    Les fichiers dont l'OCR n'a pas commencé avant IA_GLOBAL_OCR_TIMEOUT
+    valent None sans être mémorisés.
+
+    Le résultat suit l'ordre des documents reçus.
+    """
+    documents = list(documents)
+    texts: list[str | None] = [None] * len(documents)
+
+    cached = {
+        (entry.document_id, entry.file_hash): entry.text
+        for entry in ExtractedText.objects.filter(document__in=documents)
+    }
+    skipped = {
+        (document_id, file_hash): reason
+        for document_id, file_hash, reason in ExtractionFailure.objects.filter(
+            document__in=documents,
+            retry_after__gt=timezone.now(),
+        ).values_list("document_id", "file_hash", "reason")
+    }
+    pending = []
+    for index, doc in enumerate(documents):
+        if (doc.pk, doc.file_hash) in skipped:
+            if skipped[(doc.pk, doc.file_hash)] == ExtractionFailure.Reason.UNREADABLE:
+                texts[index] = ""
+            continue
+        try:
+            file_hash = doc.get_file_hash()
+        except FileNotFoundError:
+            logger.warning("Fichier introuvable : %s", doc.title)
+            _record_failure(doc, "", ExtractionFailure.Reason.MISSING)
+            continue
+        except Exception:
+            logger.warning("Impossible de lire le fichier : %s", doc.title)
+            continue
+        if (doc.pk, file_hash) in cached:
+            texts[index] = cached[(doc.pk, file_hash)]
+        else:
+            pending.append((index, doc, file_hash, _known_pages(doc, file_hash)))
+
+    metrics.record_cache("text", hits=len(documents) - len(pending), misses=len(pending))
+    if not pending:
+        return texts
+
+    # Les threads ne font que des appels réseau : les lectures et écritures
+    # en BDD restent dans le thread appelant (sauf extraction tardive).
+    executor = ThreadPoolExecutor(
+        max_workers=settings.IA_OCR_MAX_WORKERS,
+        thread_name_prefix=metrics.POOL_THREAD_PREFIX,
+    )
+    futures = {
+        executor.submit(_extract_file, doc, known, retries=False): (index, doc, file_hash)
+        for index, doc, file_hash, known in pending
+    }
+    done, not_done = wait(futures, timeout=settings.IA_GLOBAL_OCR_TIMEOUT)
+    # Les extractions pas encore commencées sont annulées ; celles en cours
+    # vont au bout (leur appel OCR est payé) et sont enregistrées à leur fin.
+    executor.shutdown(wait=False, cancel_futures=True)
+    metrics.flush()
+
+    for future in done:
+        index, doc, file_hash = futures[future]
+        texts[index] = _collect_extraction(future, doc, file_hash)
+
+    for future in not_done:
+        _, doc, file_hash = futures[future]
+        if future.cancelled():
+            continue  # jamais commencé : rien à reprocher au fichier
+        logger.warning("OCR hors délai global, enregistré à sa fin : %s", doc.title)
+        future.add_done_callback(partial(_collect_late_extraction, doc=doc, file_hash=file_hash))
+
+    return texts
+
+
+class PageRangeTooLong(ValueError):
+    """La plage de pages, même sous forme canonique, dépasse Summary.pages."""
+
+    message = "Plage de pages trop longue : regroupez les pages consécutives (ex. 1-40)."
+
+    def __init__(self):
+        super().__init__(self.message)
+
+
+def parse_pages(spec: str) -> list[int]:
+    """Convertit une plage de pages saisie (« 1-3, 5 ») en numéros triés.
+
+    Une chaîne vide donne une liste vide (tout le document). Lève ValueError
+    si la saisie est invalide.
+    """
+    numbers: set[int] = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        first, last = int(start), int(end or start)
+        if first < 1 or last < first or last - first > 9999:
+            raise ValueError(f"Plage de pages invalide : {part}")
+        numbers.update(range(first, last + 1))
+    return sorted(numbers)
+
+
+def format_pages(numbers: list[int]) -> str:
+    """Forme canonique d'une liste de pages : « 1-3,5 »."""
+    ranges: list[list[int]] = []
+    for number in sorted(set(numbers)):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}"
+        for first, last in ranges
+    )
+
+
+def canonical_pages(spec: str) -> str:
+    """Plage saisie sous forme canonique, telle qu'enregistrée sur le Summary.
+
+    Lève ValueError si la saisie est invalide, PageRangeTooLong si elle ne
+    tient pas dans Summary.pages.
+    """
+    pages = format_pages(parse_pages(spec))
+    if len(pages) > Summary._meta.get_field("pages").max_length:
+        raise PageRangeTooLong()
+    return pages
+
+
+def pages_text(document, pages: list[int]) -> str:
+    """Texte des pages demandées d'un document (extrait au besoin)."""
+    extract_text(document)
+    return _join_pages(
+        ExtractedPage.objects.filter(
+            document=document,
+            file_hash=document.file_hash,
+            number__in=pages,
+        ).values_list("number", "text")
+    )
+
+
+def current_summary(document, file_hash: str, pages: str = ""):
+    """Dernier résumé réutilisable (non échoué) pour ce fichier, ces pages et ces consignes."""
+    return (
+        Summary.objects.filter(
+            document=document,
+            file_hash=file_hash,
+            prompt_version=SUMMARY_PROMPT_VERSION,
+            pages=pages,
+        )
+        .exclude(status=Summary.Status.FAILED)
+        .first()
+    )
+
+
+def summary_lock_key(document, file_hash: str, pages: str = "") -> str:
+    return hashlib.sha256(
+        f"{document.pk}\x1f{file_hash}\x1f{pages}\x1f{SUMMARY_PROMPT_VERSION}".encode()
+    ).hexdigest()
+
+
+def claim_summary(document, file_hash: str, pages: str = "") -> tuple[Summary, bool]:
+    """Summary à calculer pour ce fichier et ces pages, ou celui déjà en cours.
+
+    Renvoie (summary, True) à l'appelant qui doit lancer le calcul, et
+    (summary, False) aux demandes simultanées (double clic, autre modérateur,
+    autre processus), qui attendent le même résultat sans appel distant. Un
+    verrou plus vieux que IA_SUMMARY_LOCK_TIMEOUT (worker interrompu) est
+    abandonné.
+    """
+    key = summary_lock_key(document, file_hash, pages)
+    Summary.objects.filter(
+        lock_key=key,
+        created_at__lt=timezone.now() - timedelta(seconds=settings.IA_SUMMARY_LOCK_TIMEOUT),
+    ).update(lock_key=None, status=Summary.Status.FAILED, content=STALE_SUMMARY_MSG)
+
+    while True:
+        try:
+            with transaction.atomic():
+                summary = Summary.objects.create(
+                    document=document,
+                    file_hash=file_hash,
+                    prompt_version=SUMMARY_PROMPT_VERSION,
+                    pages=pages,
+                    status=Summary.Status.PENDING,
+                    lock_key=key,
+                )
+            return summary, True
+        except IntegrityError:
+            # Le calcul en cours vient peut-être de se terminer : on renvoie
+            # alors son résultat.
+            leader = (
+                Summary.objects.filter(lock_key=key).first()
+                or current_summary(document, file_hash, pages)
+            )
+            if leader is not None:
+                return leader, False
+
+
+def summarize_document(document, pages: list[int] | None = None) -> str:
+    """Résume un document individuel (ou certaines de ses pages) via OCR + Chat.
 
     Retourne UNREADABLE_MSG si le document est illisible.
     """
-    file_path = Path(document.file.path)
-    pdf_b64 = base64.b64encode(file_path.read_bytes()).decode()
+    text = pages_text(document, pages) if pages else extract_text(document)
+    return summarize_text(text)
 
-    text = _call_ocr(pdf_b64)
 
+def summarize_text(text: str) -> str:
+    """Résume un texte déjà extrait (un seul appel Chat, sans accès à la BDD)."""
     if len(text) < 30:
         return UNREADABLE_MSG
 
     messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{SUMMARY_USER_PROMPT}\n\n{text}"},
+    ]
+    return _call_chat(messages, task=routing.SUMMARY)
+
+
+def current_invoice_fields(document, file_hash: str):
+    """Champs de facture à jour pour ce fichier et ces consignes (None s'il faut les extraire)."""
+    return InvoiceFields.objects.filter(
+        document=document,
+        file_hash=file_hash,
+        prompt_version=FIELDS_PROMPT_VERSION,
+    ).first()
+
+
+def _parse_amount(value) -> Decimal | None:
+    """Montant tel que renvoyé par le modèle (« 1 234,50 € », 1234.5…) en Decimal."""
+    if value is None or isinstance(value, bool):
+        return None
+    text = re.sub(r"[^\d,.\-]", "", str(value))
+    if "," in text and "." in text:
+        # Le dernier séparateur est le séparateur décimal.
+        thousands = "," if text.rfind(".") > text.rfind(",") else "."
+        text = text.replace(thousands, "")
+    text = text.replace(",", ".")
+    try:
+        amount = Decimal(text).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return None
+    return amount if abs(amount) < Decimal("1e10") else None
+
+
+def parse_invoice_fields(raw: str) -> dict:
+    """Valide et normalise la réponse JSON du modèle ; ValueError si elle est inexploitable."""
+    raw = raw.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("Objet JSON attendu.")
+
+    currency = str(data.get("currency") or "").strip().upper()
+    currency = {"€": "EUR", "$": "USD", "£": "GBP"}.get(currency, currency)
+    try:
+        invoice_date = date.fromisoformat(str(data.get("invoice_date") or ""))
+    except ValueError:
+        invoice_date = None
+    category = str(data.get("category") or "").strip().lower()
+    # Sans « is_invoice » : true explicite, le montant n'est pas celui d'une facture.
+    is_invoice = data.get("is_invoice") is True
+    return {
+        "is_invoice": is_invoice,
+        "issuer": str(data.get("issuer") or "").strip()[:255],
+        "total": _parse_amount(data.get("total")) if is_invoice else None,
+        "currency": currency if re.fullmatch(r"[A-Z]{3}", currency) else "",
+        "invoice_date": invoice_date,
+        "category": (
+            category if category in InvoiceFields.Category.values
+            else InvoiceFields.Category.OTHER
+        ),
+    }
+
+
+def extract_invoice_fields(document) -> InvoiceFields:
+    """Extrait (un appel Chat) et enregistre les champs structurés d'une facture.
+
+    Une réponse inexploitable ou un document illisible donne une ligne en
+    échec : elle n'est retentée qu'au changement de fichier ou de consignes.
+    """
+    file_hash = document.get_file_hash()
+    text = extract_text(document)
+    fields, status = {}, InvoiceFields.Status.FAILED
+    if len(text) >= 30:
+        messages = [
+            {"role": "system", "content": INVOICE_FIELDS_PROMPT},
+            {"role": "user", "content": text[:settings.IA_FIELDS_MAX_CHARS]},
+        ]
+        try:
+            fields = parse_invoice_fields(_call_chat(messages, json_mode=True, task=routing.EXTRACTION))
+            status = InvoiceFields.Status.DONE
+        except ValueError:
+            logger.warning("Champs de facture inexploitables (document #%s)", document.pk)
+    defaults = {
+        "is_invoice": False,
+        "issuer": "",
+        "total": None,
+        "currency": "",
+        "invoice_date": None,
+        "category": InvoiceFields.Category.OTHER,
+        **fields,
+    }
+    invoice, _ = InvoiceFields.objects.update_or_create(
+        document=document,
+        defaults={
+            **defaults,
+            "file_hash": file_hash,
+            "prompt_version": FIELDS_PROMPT_VERSION,
+            "status": status,
+        },
+    )
+    return invoice
+
+
+def _format_amount(amount: Decimal) -> str:
+    return f"{amount:,.2f}".replace(",", "\u202f").replace(".", ",")
+
+
+def invoice_figures(documents) -> str:
+    """Totaux des factures des documents, calculés en SQL, pour le contexte du modèle.
+
+    Seuls les champs extraits du fichier courant d'une facture sont comptés
+    (pas ceux d'un relevé ou d'un courrier) ; chaîne vide si aucun document
+    n'a de champs exploitables.
+    """
+    invoices = InvoiceFields.objects.filter(
+        document__in=documents,
+        status=InvoiceFields.Status.DONE,
+        is_invoice=True,
+        file_hash=F("document__file_hash"),
+        total__isnull=False,
+    )
+    groupings = [
+        ("émetteur", "issuer", lambda row: row["issuer"] or "émetteur inconnu"),
+        ("catégorie", "category", lambda row: InvoiceFields.Category(row["category"]).label),
+    ]
+    sections = []
+    for label, field, name in groupings:
+        rows = (
+            invoices.annotate(year=ExtractYear("invoice_date"))
+            .values(field, "year", "currency")
+            .annotate(count=Count("pk"), amount=Sum("total"))
+            .order_by(field, "year", "currency")
+        )
+        lines = [
+            f"- {name(row)} — {row['year'] or 'année inconnue'} — "
+            f"{row['count']} facture(s) — {_format_amount(row['amount'])} {row['currency']}".rstrip()
+            for row in rows
+        ]
+        if lines:
+            sections.append(f"Par {label} et par année :\n" + "\n".join(lines))
+    if not sections:
+        return ""
+    return (
+        "Montants des factures calculés en base (champs extraits de chaque facture) :\n\n"
+        + "\n\n".join(sections)
+    )
+
+
+def documents_to_analyze(scope: dict | None = None):
+    """Documents soumis à l'analyse globale, du plus récent au plus ancien.
+
+    `scope` (Summary.scope) restreint l'ensemble avant toute extraction :
+    collection (sous-collections incluses), bornes de document_date au
+    format ISO et fragment de titre.
+    """
+    documents = get_document_model().objects.order_by(
+        "-document_date",
+        "-created_at",
+    )
+    scope = scope or {}
+    if collection_id := scope.get("collection"):
+        root = Collection.objects.filter(pk=collection_id).first()
+        if root is None:
+            return documents.none()
+        documents = documents.filter(
+            collection__in=Collection.objects.descendant_of(root, inclusive=True),
+        )
+    if date_from := scope.get("date_from"):
+        documents = documents.filter(document_date__gte=date_from)
+    if date_to := scope.get("date_to"):
+        documents = documents.filter(document_date__lte=date_to)
+    if title := scope.get("title"):
+        documents = documents.filter(title__icontains=title)
+    return documents
+
+
+def normalize_query(query: str) -> str:
+    """Forme canonique d'une question : minuscules, sans accents ni ponctuation."""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def query_key(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()
+
+
+def corpus_fingerprint(documents) -> str:
+    """Empreinte de l'ensemble de documents analysé.
+
+    Elle change dès qu'un document est ajouté, supprimé, renommé, redaté ou
+    que son fichier est remplacé.
+    """
+    return _documents_fingerprint(documents.order_by("pk"))
+
+
+def _documents_fingerprint(documents) -> str:
+    digest = hashlib.sha256()
+    for doc in documents:
+        file_hash = doc.file_hash
+        if not file_hash:
+            try:
+                file_hash = doc.get_file_hash()
+            except FileNotFoundError:
+                file_hash = "introuvable"
+        digest.update(
+            f"{doc.pk}\x1f{file_hash}\x1f{doc.title}\x1f{doc.document_date}\x1e".encode()
+        )
+    return digest.hexdigest()
+
+
+_unreadable = threading.local()
+
+
+@contextmanager
+def unreadable_documents() -> Iterator[list]:
+    """Collecte les documents remplacés par un substitut (introuvables ou
+    illisibles), et les lots non analysés, dans les analyses globales faites
+    par ce thread : une liste non vide signale une réponse incomplète."""
+    documents: list = []
+    previous = getattr(_unreadable, "documents", None)
+    _unreadable.documents = documents
+    try:
+        yield documents
+    finally:
+        _unreadable.documents = previous
+
+
+def _note_unreadable(doc) -> None:
+    documents = getattr(_unreadable, "documents", None)
+    if documents is not None:
+        documents.append(doc)
+
+
+def _document_header(doc, suffix: str = "") -> str:
+    return (
+        f"--- Document : {doc.title} "
+        f"(date : {doc.document_date or 'inconnue'}){suffix} ---"
+    )
+
+
+def _global_messages(documents, query: str, pages: list[int] | None = None) -> list[dict]:
+    """Construit les messages de l'analyse globale.
+
+    Les documents sont OCR-isés en parallèle (ou lus depuis le cache). Si
+    IA_RETRIEVAL_TOP_K est défini, seuls les passages les plus pertinents pour
+    la question sont envoyés, avec leur page ; sinon (ou si aucun passage ne
+    correspond), le texte complet de chaque document. `pages` restreint
+    l'analyse à ces numéros de page de chaque document.
+    """
+    documents = list(documents)
+    readable: list[tuple] = []
+    unreadable_parts: list[str] = []
+    full_parts: list[str] = []
+
+    texts = extract_texts(documents)
+    if pages:
+        texts = [
+            None if text is None else _join_pages(page_rows)
+            for text, page_rows in zip(texts, _pages_by_document(documents, pages))
+        ]
+
+    for doc, text in zip(documents, texts):
+        if text is None:
+            placeholder = "[fichier introuvable ou illisible]"
+        elif len(text) < 30:
+            placeholder = "[contenu illisible]"
+        else:
+            readable.append((doc, text))
+            full_parts.append(f"{_document_header(doc)}\n{text}")
+            continue
+        _note_unreadable(doc)
+        part = f"{_document_header(doc)}\n{placeholder}"
+        full_parts.append(part)
+        unreadable_parts.append(part)
+
+    context_parts = full_parts
+    intro = "Voici le contenu de tous les documents disponibles"
+    if settings.IA_RETRIEVAL_TOP_K and readable:
+        retrieval.ensure_indexed(readable)
+        chunks = retrieval.search(
+            query,
+            [doc for doc, _ in readable],
+            top_k=settings.IA_RETRIEVAL_TOP_K,
+            pages=pages,
+        )
+        if chunks:
+            order = {doc.pk: index for index, doc in enumerate(documents)}
+            chunks.sort(key=lambda chunk: (order[chunk.document_id], chunk.position))
+            context_parts = [
+                f"{_document_header(chunk.document, _chunk_label(chunk))}\n{chunk.text}"
+                for chunk in chunks
+            ] + unreadable_parts
+            intro = "Voici les extraits des documents les plus pertinents pour la question"
+
+    figures = invoice_figures(documents)
+    full_context = "\n\n".join(context_parts)
+    if estimate_tokens(full_context) > settings.IA_CONTEXT_TOKEN_BUDGET:
+        return _map_reduce_messages(context_parts, query, figures)
+
+    return [
+        {"role": "system", "content": GLOBAL_SYSTEM_PROMPT},
         {
-            "role": "system",
+            "role": "user",
             "content": (
-                "Tu es un assistant qui analyse des factures et documents "
-                "pour une association. Réponds toujours en français, de façon "
-                "concise et structurée."
+                (f"{figures}\n\n" if figures else "")
+                + f"{intro} :\n\n"
+                f"{full_context}\n\n"
+                f"Question : {query}"
             ),
         },
+    ]
+
+
+def _chunk_label(chunk) -> str:
+    if chunk.page is None:
+        return f" — extrait {chunk.position + 1}"
+    return f" — page {chunk.page}, extrait {chunk.position + 1}"
+
+
+def _pages_by_document(documents, pages: list[int]) -> list[list[tuple[int, str]]]:
+    """Pages demandées de chaque document (version courante du fichier), dans l'ordre reçu."""
+    rows: dict[int, list[tuple[int, str]]] = {}
+    for document_id, file_hash, number, text in ExtractedPage.objects.filter(
+        document__in=documents,
+        number__in=pages,
+        status=ExtractedPage.Status.DONE,
+    ).values_list("document_id", "file_hash", "number", "text"):
+        rows.setdefault((document_id, file_hash), []).append((number, text))
+    return [rows.get((doc.pk, doc.file_hash), []) for doc in documents]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def plan_batches(parts: list[str], budget: int, max_documents: int) -> list[list[str]]:
+    """Répartit les sections de contexte en lots qui tiennent dans le budget.
+
+    L'ordre des sections est conservé. Une section plus grosse que le budget
+    est découpée en morceaux, chacun précédé de l'en-tête de son document.
+    """
+    limit = budget * CHARS_PER_TOKEN
+    batches: list[list[str]] = []
+    current: list[str] = []
+    size = 0
+
+    for part in parts:
+        header, _, body = part.partition("\n")
+        pieces = [part]
+        if len(part) > limit:
+            step = max(limit - len(header) - 1, 1)
+            pieces = [f"{header}\n{body[i:i + step]}" for i in range(0, len(body), step)]
+        for piece in pieces:
+            if current and (size + len(piece) > limit or len(current) >= max_documents):
+                batches.append(current)
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece)
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _map_messages(batch: list[str], query: str) -> list[dict]:
+    context = "\n\n".join(batch)
+    return [
+        {"role": "system", "content": GLOBAL_SYSTEM_PROMPT},
         {
             "role": "user",
             "content": (
-                "Voici le contenu extrait d'un document. "
-                "Fais un résumé court : objet, fournisseur/émetteur, "
-                "montant si présent, date si présente.\n\n"
-                f"{text}"
+                "Voici une partie des documents disponibles :\n\n"
+                f"{context}\n\n"
+                "Relève tout ce qui aide à répondre à la question ci-dessous "
+                "(montants, dates, fournisseurs, titres des documents). "
+                "Si rien n'est pertinent, réponds « Rien de pertinent ».\n\n"
+                f"Question : {query}"
             ),
         },
     ]
-    return _call_chat(messages)
 
 
-def analyze_all_documents(documents, query: str) -> str:
-    """Analyse un ensemble de documents en répondant à la question posée.
+def _map_partial_answers(batches: list[list[str]], query: str) -> list[str]:
+    """Analyse chaque lot en parallèle ; les réponses partielles sont mises en cache."""
+    keys = [
+        hashlib.sha256(
+            "\x1f".join([*routing.models(routing.GLOBAL), GLOBAL_SYSTEM_PROMPT, query, *batch]).encode()
+        ).hexdigest()
+        for batch in batches
+    ]
+    cached = dict(
+        PartialAnalysis.objects.filter(key__in=keys).values_list("key", "content")
+    )
+    answers: list[str | None] = [cached.get(key) for key in keys]
+    missing = [index for index, answer in enumerate(answers) if answer is None]
+    metrics.record_cache("partial", hits=len(keys) - len(missing), misses=len(missing))
+
+    with ThreadPoolExecutor(
+        max_workers=settings.IA_MAP_MAX_WORKERS,
+        thread_name_prefix=metrics.POOL_THREAD_PREFIX,
+    ) as executor:
+        futures = {
+            executor.submit(_call_chat, _map_messages(batches[index], query), task=routing.GLOBAL): index
+            for index in missing
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                answers[index] = future.result()
+            except Exception:
+                logger.warning("Échec de l'analyse partielle du lot %s", index + 1)
+                answers[index] = "[partie non analysée]"
+                _note_unreadable(f"lot {index + 1}")
+                continue
+            PartialAnalysis.objects.get_or_create(
+                key=keys[index],
+                defaults={"content": answers[index]},
+            )
+    metrics.flush()
+
+    return answers
 
-    Chaque document est OCR-isé individuellement puis le contexte
-    est envoyé en un seul appel Chat.
+
+def _map_reduce_messages(context_parts: list[str], query: str, figures: str = "") -> list[dict]:
+    """Contexte trop volumineux : analyse par lots puis messages de fusion (reduce).
+
+    Les montants calculés en base (`figures`) ne sont donnés qu'à la fusion.
     """
-    context_parts: list[str] = []
+    batches = plan_batches(
+        context_parts,
+        budget=settings.IA_CONTEXT_TOKEN_BUDGET,
+        max_documents=settings.IA_BATCH_MAX_DOCUMENTS,
+    )
+    answers = _map_partial_answers(batches, query)
+    partials = "\n\n".join(
+        f"--- Analyse partielle {index} ---\n{answer}"
+        for index, answer in enumerate(answers, start=1)
+    )
+    return [
+        {"role": "system", "content": GLOBAL_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                (f"{figures}\n\n" if figures else "")
+                + "Les documents étant trop nombreux pour être lus en une fois, "
+                "ils ont été analysés par lots. Voici les analyses partielles :\n\n"
+                f"{partials}\n\n"
+                "Fusionne-les en une réponse unique et cohérente "
+                "(additionne les montants si nécessaire).\n\n"
+                f"Question : {query}"
+            ),
+        },
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Synthèses par collection et par mois (Digest)
+# ---------------------------------------------------------------------------
+
 
+def _digest_period(document) -> str:
+    if document.document_date is None:
+        return Digest.UNDATED
+    return document.document_date.strftime("%Y-%m")
+
+
+def _documents_by_period(collection) -> dict[str, list]:
+    """Documents rattachés directement à `collection`, par période de synthèse."""
+    periods: dict[str, list] = {}
+    for doc in get_document_model().objects.filter(collection=collection).order_by("pk"):
+        periods.setdefault(_digest_period(doc), []).append(doc)
+    return periods
+
+
+def _period_fingerprint(documents) -> str:
+    return hashlib.sha256(
+        f"{DIGEST_PROMPT_VERSION}\x1f{_documents_fingerprint(documents)}".encode()
+    ).hexdigest()
+
+
+def _whole_fingerprint(months: list[Digest]) -> str:
+    return hashlib.sha256("\x1f".join(
+        [DIGEST_PROMPT_VERSION, *(f"{digest.period}:{digest.fingerprint}" for digest in months)]
+    ).encode()).hexdigest()
+
+
+def _month_digest_messages(collection, period: str, documents: list) -> list[dict] | None:
+    """Messages de la synthèse d'un mois : résumé à jour de chaque document s'il
+    existe, sinon le début de son texte, plus les montants calculés en base.
+
+    None si le texte d'un document n'a pas pu être lu pour une raison passagère
+    (délai, saturation) : la synthèse ne le remplacerait pas une fois lisible.
+    """
+    summaries = {
+        (document_id, file_hash): content
+        for document_id, file_hash, content in Summary.objects.filter(
+            document__in=documents,
+            prompt_version=SUMMARY_PROMPT_VERSION,
+            pages="",
+            status=Summary.Status.DONE,
+        ).order_by("created_at").values_list("document_id", "file_hash", "content")
+    }
+    without_summary = [doc for doc in documents if (doc.pk, doc.file_hash) not in summaries]
+    texts = dict(zip((doc.pk for doc in without_summary), extract_texts(without_summary)))
+    if any(text is None for text in texts.values()):
+        return None
+    limit = min(
+        settings.IA_DIGEST_DOCUMENT_CHARS,
+        max(settings.IA_CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN // len(documents), 200),
+    )
+    parts = []
     for doc in documents:
-        try:
-            file_path = Path(doc.file.path)
-            pdf_b64 = base64.b64encode(file_path.read_bytes()).decode()
-            text = _call_ocr(pdf_b64)
-            if len(text) < 30:
-                text = "[contenu illisible]"
-        except Exception:
-            logger.warning("Impossible de lire le fichier : %s", doc.title)
-            text = "[fichier introuvable ou illisible]"
+        content = summaries.get((doc.pk, doc.file_hash)) or texts.get(doc.pk) or "[contenu illisible]"
+        parts.append(f"{_document_header(doc)}\n{content[:limit]}")
 
-        context_parts.append(
-            f"--- Document : {doc.title} "
-            f"(date : {doc.document_date or 'inconnue'}) ---\n{text}"
-        )
+    label = Digest(period=period).period_label
+    figures = invoice_figures(get_document_model().objects.filter(pk__in=[doc.pk for doc in documents]))
+    return [
+        {"role": "system", "content": DIGEST_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"Collection : {collection.name} — période : {label}\n\n"
+                + (f"{figures}\n\n" if figures else "")
+                + "\n\n".join(parts)
+                + f"\n\n{MONTH_DIGEST_PROMPT}"
+            ),
+        },
+    ]
 
-    full_context = "\n\n".join(context_parts)
 
-    messages = [
+def _collection_digest_messages(collection, months: list[Digest]) -> list[dict]:
+    """Messages de la synthèse d'une collection, à partir de ses synthèses mensuelles."""
+    limit = settings.IA_CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN // len(months)
+    parts = [
+        f"--- {digest.period_label} ({digest.document_count} documents) ---\n{digest.content[:limit]}"
+        for digest in months
+    ]
+    figures = invoice_figures(get_document_model().objects.filter(collection=collection))
+    return [
+        {"role": "system", "content": DIGEST_SYSTEM_PROMPT},
         {
-            "role": "system",
+            "role": "user",
             "content": (
-                "Tu es un assistant qui analyse des factures et documents "
-                "pour une association. Réponds toujours en français."
+                f"Collection : {collection.name}\n\n"
+                + (f"{figures}\n\n" if figures else "")
+                + "\n\n".join(parts)
+                + f"\n\n{COLLECTION_DIGEST_PROMPT}"
             ),
         },
+    ]
+
+
+def _save_digest(collection, period: str, **fields) -> Digest:
+    try:
+        digest, _ = Digest.objects.update_or_create(
+            collection=collection,
+            period=period,
+            defaults=fields,
+        )
+    except IntegrityError:
+        # Mise à jour concurrente (worker et analyse globale) : l'autre a gagné.
+        digest = Digest.objects.get(collection=collection, period=period)
+    return digest
+
+
+def refresh_digests(collection) -> list[Digest] | None:
+    """Met à jour les synthèses de `collection` dont les documents ont changé.
+
+    Seuls les mois dont l'empreinte a changé sont recalculés (en parallèle,
+    IA_MAP_MAX_WORKERS appels), puis la synthèse de la collection si l'un
+    d'eux a changé ; celles des mois sans document sont supprimées. Retourne
+    les synthèses à jour (mois puis collection), ou None si certaines n'ont
+    pas pu être calculées : elles seront retentées à la prochaine mise à jour.
+    """
+    periods = _documents_by_period(collection)
+    if not periods:
+        Digest.objects.filter(collection=collection).delete()
+        return []
+    Digest.objects.filter(collection=collection).exclude(
+        period__in=[*periods, Digest.WHOLE],
+    ).delete()
+
+    existing = {digest.period: digest for digest in Digest.objects.filter(collection=collection)}
+    fingerprints = {period: _period_fingerprint(docs) for period, docs in periods.items()}
+    stale = [
+        period for period in sorted(periods)
+        if period not in existing or existing[period].fingerprint != fingerprints[period]
+    ]
+    metrics.record_cache("digest", hits=len(periods) - len(stale), misses=len(stale))
+
+    # Extraction (BDD + OCR) dans ce thread ; seuls les appels au modèle vont au pool.
+    messages = {period: _month_digest_messages(collection, period, periods[period]) for period in stale}
+    unread = [period for period in stale if messages[period] is None]
+    if unread:
+        logger.info("Synthèses %s de la collection %s reportées : textes indisponibles", unread, collection.pk)
+    complete = not unread
+    with ThreadPoolExecutor(
+        max_workers=settings.IA_MAP_MAX_WORKERS,
+        thread_name_prefix=metrics.POOL_THREAD_PREFIX,
+    ) as executor:
+        futures = {
+            executor.submit(_call_chat, messages[period], task=routing.SUMMARY): period
+            for period in stale
+            if messages[period] is not None
+        }
+        for future in as_completed(futures):
+            period = futures[future]
+            try:
+                content = future.result()
+            except Exception:
+                logger.warning("Échec de la synthèse %s de la collection %s", period, collection.pk)
+                complete = False
+                continue
+            existing[period] = _save_digest(
+                collection,
+                period,
+                content=content,
+                fingerprint=fingerprints[period],
+                document_count=len(periods[period]),
+            )
+    metrics.flush()
+
+    months = [existing[period] for period in sorted(periods) if period in existing]
+    if not months:
+        return None
+    whole = existing.get(Digest.WHOLE)
+    fingerprint = _whole_fingerprint(months)
+    if whole is None or whole.fingerprint != fingerprint:
+        try:
+            content = _call_chat(_collection_digest_messages(collection, months), task=routing.SUMMARY)
+        except Exception:
+            logger.warning("Échec de la synthèse de la collection %s", collection.pk)
+            return None
+        whole = _save_digest(
+            collection,
+            Digest.WHOLE,
+            content=content,
+            fingerprint=fingerprint,
+            document_count=sum(len(docs) for docs in periods.values()),
+        )
+    return [*months, whole] if complete else None
+
+
+def _scope_periods(scope: dict) -> tuple[str, str] | None:
+    """Bornes « AAAA-MM » d'un périmètre daté, si elles tombent sur des mois entiers.
+
+    Renvoie ("", "") sans bornes, None si une borne coupe un mois (les
+    synthèses mensuelles ne correspondraient pas exactement au périmètre).
+    """
+    first = last = ""
+    if date_from := scope.get("date_from"):
+        start = date.fromisoformat(date_from)
+        if start.day != 1:
+            return None
+        first = f"{start:%Y-%m}"
+    if date_to := scope.get("date_to"):
+        end = date.fromisoformat(date_to)
+        if (end + timedelta(days=1)).day != 1:
+            return None
+        last = f"{end:%Y-%m}"
+    return first, last
+
+
+def _scope_digests(documents, scope: dict | None, pages: list[int] | None) -> list[Digest] | None:
+    """Synthèses couvrant exactement `documents`, ou None pour lire le texte brut.
+
+    `documents` est le jeu de documents_to_analyze(scope) ; sans `scope`,
+    les documents sont lus tels quels. Sans bornes de dates, une synthèse par collection ; avec des bornes sur
+    des mois entiers, les synthèses mensuelles de la période. Une plage de
+    pages ou un filtre sur le titre demandent le texte brut, de même qu'un
+    petit ensemble (moins de IA_DIGEST_MIN_DOCUMENTS documents).
+    """
+    if scope is None or not settings.IA_DIGESTS or pages or scope.get("title"):
+        return None
+    bounds = _scope_periods(scope)
+    if bounds is None or documents.count() < settings.IA_DIGEST_MIN_DOCUMENTS:
+        return None
+
+    first, last = bounds
+    dated = bool(scope.get("date_from") or scope.get("date_to"))
+    selected = []
+    collection_ids = documents.order_by().values_list("collection_id", flat=True).distinct()
+    for collection in Collection.objects.filter(pk__in=collection_ids).order_by("path"):
+        digests = refresh_digests(collection)
+        if digests is None:
+            return None
+        for digest in digests:
+            if not dated:
+                keep = digest.period == Digest.WHOLE
+            else:
+                keep = digest.period not in (Digest.WHOLE, Digest.UNDATED) and (
+                    (not first or digest.period >= first) and (not last or digest.period <= last)
+                )
+            if keep:
+                selected.append(digest)
+    return selected or None
+
+
+def _digest_messages(digests: list[Digest], query: str, figures: str = "") -> list[dict] | None:
+    """Messages de l'analyse globale à partir des synthèses (None si elles dépassent le budget)."""
+    context = "\n\n".join(
+        f"[S{index}] Collection « {digest.collection.name} » — {digest.period_label} "
+        f"({digest.document_count} documents)\n{digest.content}"
+        for index, digest in enumerate(digests, start=1)
+    )
+    if estimate_tokens(context) > settings.IA_CONTEXT_TOKEN_BUDGET:
+        logger.info("Synthèses trop volumineuses (%s), lecture du texte des documents", len(digests))
+        return None
+    return [
+        {"role": "system", "content": GLOBAL_SYSTEM_PROMPT},
         {
             "role": "user",
             "content": (
-                "Voici le contenu de tous les documents disponibles :\n\n"
-                f"{full_context}\n\n"
+                (f"{figures}\n\n" if figures else "")
+                + "Voici des synthèses des documents, par collection et par période :\n\n"
+                f"{context}\n\n"
+                f"{DIGEST_ANSWER_PROMPT}\n\n"
                 f"Question : {query}"
             ),
         },
     ]
-    return _call_chat(messages)
+
+
+def _asks_detail(answer: str) -> bool:
+    return normalize_query(answer).startswith(normalize_query(DETAIL_MARKER))
+
+
+def _detail_documents(documents, digests: list[Digest], answer: str):
+    """Documents des synthèses à approfondir citées dans `answer` (toutes à défaut)."""
+    numbers = {int(number) for number in re.findall(r"S(\d+)", answer)}
+    requested = [digest for index, digest in enumerate(digests, start=1) if index in numbers]
+    condition = Q()
+    for digest in requested or digests:
+        part = Q(collection_id=digest.collection_id)
+        if digest.period == Digest.UNDATED:
+            part &= Q(document_date__isnull=True)
+        elif digest.period != Digest.WHOLE:
+            year, month = map(int, digest.period.split("-"))
+            part &= Q(document_date__year=year, document_date__month=month)
+        condition |= part
+    return documents.filter(condition)
+
+
+def _digest_context(documents, query: str, pages, scope) -> tuple[list[Digest], list[dict]] | None:
+    digests = _scope_digests(documents, scope, pages)
+    if not digests:
+        return None
+    messages = _digest_messages(digests, query, invoice_figures(documents))
+    return (digests, messages) if messages else None
+
+
+def analyze_all_documents(
+    documents,
+    query: str,
+    pages: list[int] | None = None,
+    scope: dict | None = None,
+) -> str:
+    """Analyse un ensemble de documents en répondant à la question posée.
+
+    Quand le périmètre s'y prête (voir _scope_digests), la question est
+    d'abord posée sur les synthèses précalculées : le texte des documents
+    n'est lu que si le modèle demande le détail, et seulement pour les
+    synthèses citées. Sinon, le contexte de tous les documents est envoyé en
+    un seul appel Chat.
+    """
+    if digest_context := _digest_context(documents, query, pages, scope):
+        digests, messages = digest_context
+        answer = _call_chat(messages, task=routing.GLOBAL)
+        if not _asks_detail(answer):
+            return answer
+        documents = _detail_documents(documents, digests, answer)
+    return _call_chat(_global_messages(documents, query, pages), task=routing.GLOBAL)
+
+
+def stream_all_documents(
+    documents,
+    query: str,
+    pages: list[int] | None = None,
+    scope: dict | None = None,
+) -> Iterator[str]:
+    """Variante en streaming d'analyze_all_documents : produit la réponse par fragments.
+
+    La réponse tirée des synthèses est retenue le temps de savoir si elle
+    commence par DETAIL_MARKER, puis diffusée normalement.
+    """
+    if digest_context := _digest_context(documents, query, pages, scope):
+        digests, messages = digest_context
+        fragments = iter(_stream_chat(messages, task=routing.GLOBAL))
+        head = ""
+        for fragment in fragments:
+            head += fragment
+            if len(normalize_query(head)) > len(normalize_query(DETAIL_MARKER)):
+                break
+        if not _asks_detail(head):
+            yield head
+            yield from fragments
+            return
+        answer = head + "".join(fragments)
+        documents = _detail_documents(documents, digests, answer)
+    yield from _stream_chat(_global_messages(documents, query, pages), task=routing.GLOBAL)
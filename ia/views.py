@@ -1,22 +1,95 @@
+import hmac
+import json
+import logging
+
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 from wagtail.documents import get_document_model
 
 from core.utils import is_moderator
+from ia import limiter, metrics, routing, tasks
 from ia import utils as ai_utils
+from ia.forms import GlobalAnalysisForm
 from ia.models import Summary
 
+logger = logging.getLogger(__name__)
+
+# Endpoints Mistral nécessaires à une analyse (texte puis modèle).
+IA_ENDPOINTS = ("ocr", "chat")
+
+
+def _pages_param(request) -> str:
+    """Plage de pages postée, sous forme canonique (« » = tout le document)."""
+    return ai_utils.canonical_pages(request.POST.get("pages", ""))
+
+
+def _summary_template(summary: Summary) -> str:
+    if summary.document_id:
+        return "ia/partials/document_summary.html"
+    return "ia/partials/global_analysis.html"
+
 
 @require_POST
 @user_passes_test(is_moderator)
 def summarize_document(request, doc_id: int):
-    """Résume un document individuel et stocke le résultat en BDD."""
+    """Met en file le résumé d'un document ; le partial interroge ensuite son statut.
+
+    Un résumé existant pour le même fichier, les mêmes pages et les mêmes
+    consignes est renvoyé tel quel, sauf si « force » est demandé ; un
+    résumé en cours l'est toujours.
+    """
     Document = get_document_model()
     doc = get_object_or_404(Document, pk=doc_id)
 
-    content = ai_utils.summarize_document(doc)
-    summary = Summary.objects.create(document=doc, content=content)
+    try:
+        pages = _pages_param(request)
+    except ai_utils.PageRangeTooLong as exc:
+        return render(
+            request,
+            "ia/partials/document_summary.html",
+            {"error": exc.message},
+        )
+    except ValueError:
+        return render(
+            request,
+            "ia/partials/document_summary.html",
+            {"error": "Plage de pages invalide (ex. 1-3,5)."},
+        )
+
+    try:
+        file_hash = doc.get_file_hash()
+    except FileNotFoundError:
+        return render(
+            request,
+            "ia/partials/document_summary.html",
+            {"error": "Fichier introuvable."},
+        )
+
+    if request.POST.get("force") != "1":
+        existing = ai_utils.current_summary(doc, file_hash, pages)
+        metrics.record_cache("summary", hits=existing is not None, misses=existing is None)
+        if existing is not None:
+            return render(
+                request,
+                "ia/partials/document_summary.html",
+                {"summary": existing},
+            )
+
+    if limiter.is_open(*IA_ENDPOINTS):
+        return render(
+            request,
+            "ia/partials/document_summary.html",
+            {"error": limiter.CircuitOpen.message},
+        )
+
+    # Une seule tâche par résumé : les demandes simultanées (double clic,
+    # autre modérateur) reçoivent le Summary déjà en cours.
+    summary, claimed = ai_utils.claim_summary(doc, file_hash, pages)
+    if claimed:
+        tasks.summarize_document_task.enqueue(summary.pk)
 
     return render(
         request,
@@ -28,27 +101,211 @@ def summarize_document(request, doc_id: int):
 @require_POST
 @user_passes_test(is_moderator)
 def global_analyze(request):
-    """Analyse l'ensemble des documents en répondant à la question posée."""
-    query = request.POST.get("query", "").strip()
-    if not query:
+    """Met en file l'analyse des documents du périmètre choisi pour la question posée.
+
+    Une réponse déjà obtenue pour la même question (normalisée) sur le même
+    ensemble de documents est renvoyée immédiatement.
+    """
+    form = GlobalAnalysisForm(request.POST)
+    if not form.is_valid():
         return render(
             request,
             "ia/partials/global_analysis.html",
-            {"error": "Merci de saisir une question."},
+            {"error": form.error_message},
         )
+    query, pages, scope = form.cleaned_data["query"], form.cleaned_data["pages"], form.scope
 
-    Document = get_document_model()
-    documents = Document.objects.order_by(
-        "-document_date",
-        "-created_at",
-    )
+    documents = ai_utils.documents_to_analyze(scope)
+    if not documents.exists():
+        return render(
+            request,
+            "ia/partials/global_analysis.html",
+            {"error": "Aucun document ne correspond à ces critères."},
+        )
+
+    key = ai_utils.query_key(query)
+    fingerprint = ai_utils.corpus_fingerprint(documents)
+    cached = Summary.objects.filter(
+        document=None,
+        query_key=key,
+        corpus_fingerprint=fingerprint,
+        prompt_version=ai_utils.GLOBAL_PROMPT_VERSION,
+        pages=pages,
+        status=Summary.Status.DONE,
+        complete=True,
+    ).first()
+    metrics.record_cache("answer", hits=cached is not None, misses=cached is None)
+    if cached is not None:
+        return render(
+            request,
+            "ia/partials/global_analysis.html",
+            {"summary": cached, "cached": True},
+        )
 
-    content = ai_utils.analyze_all_documents(documents, query)
-    summary = Summary.objects.create(document=None, query=query, content=content)
+    if limiter.is_open(*IA_ENDPOINTS):
+        return render(
+            request,
+            "ia/partials/global_analysis.html",
+            {"error": limiter.CircuitOpen.message},
+        )
+
+    summary = Summary.objects.create(
+        document=None,
+        query=query,
+        query_key=key,
+        corpus_fingerprint=fingerprint,
+        prompt_version=ai_utils.GLOBAL_PROMPT_VERSION,
+        pages=pages,
+        scope=scope,
+        status=Summary.Status.PENDING,
+    )
+    # En mode streaming, c'est la connexion SSE ouverte par le partial
+    # qui lance l'analyse.
+    stream = settings.IA_STREAM_GLOBAL_ANALYSIS
+    if not stream:
+        tasks.global_analyze_task.enqueue(summary.pk)
 
     return render(
         request,
         "ia/partials/global_analysis.html",
-        {"summary": summary},
+        {"summary": summary, "stream": stream},
+    )
+
+
+def _sse(data, event: str | None = None) -> str:
+    """Formate un événement server-sent events (données encodées en JSON)."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _save_streamed(
+    summary: Summary,
+    chunks: list[str],
+    models: list[str],
+    unreadable: list,
+    remaining=(),
+    failed=False,
+    message=tasks.FAILURE_MSG,
+) -> None:
+    """Enregistre la réponse diffusée (en consommant la fin du flux si besoin)."""
+    try:
+        chunks.extend(remaining)
+    except limiter.ServiceUnavailable as exc:
+        failed, message = True, str(exc)
+    except Exception:
+        logger.exception("Échec de l'analyse IA (Summary #%s)", summary.pk)
+        failed = True
+    if failed:
+        summary.content = message
+        summary.status = Summary.Status.FAILED
+    else:
+        summary.content = "".join(chunks).strip()
+        summary.status = Summary.Status.DONE
+    summary.model = models[-1] if models else ""
+    # Une réponse bâtie sur des documents illisibles n'est pas mise en cache.
+    summary.complete = not unreadable
+    summary.save(update_fields=["content", "status", "complete", "model"])
+
+
+def _stream_global_analysis(summary: Summary):
+    chunks: list[str] = []
+    documents = ai_utils.documents_to_analyze(summary.scope)
+    stream = ai_utils.stream_all_documents(
+        documents,
+        summary.query,
+        ai_utils.parse_pages(summary.pages),
+        summary.scope,
     )
+    with routing.recording() as models, ai_utils.unreadable_documents() as unreadable:
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield _sse(chunk)
+        except GeneratorExit:
+            # Navigateur déconnecté : on va au bout du flux pour enregistrer la réponse.
+            _save_streamed(summary, chunks, models, unreadable, remaining=stream)
+            raise
+        except limiter.ServiceUnavailable as exc:
+            _save_streamed(summary, chunks, models, unreadable, failed=True, message=str(exc))
+        except Exception:
+            logger.exception("Échec de l'analyse IA (Summary #%s)", summary.pk)
+            _save_streamed(summary, chunks, models, unreadable, failed=True)
+        else:
+            _save_streamed(summary, chunks, models, unreadable)
+    yield _sse(summary.status, event="done")
 
+
+@require_GET
+@user_passes_test(is_moderator)
+def global_analyze_stream(request, pk: int):
+    """Diffuse la réponse d'une analyse globale en server-sent events.
+
+    La réponse complète est enregistrée sur le Summary à la fin du flux.
+    """
+    summary = get_object_or_404(Summary, pk=pk, document=None)
+
+    # Une seule connexion peut lancer l'analyse : une reconnexion du
+    # navigateur reçoit seulement l'événement de fin.
+    claimed = Summary.objects.filter(
+        pk=summary.pk,
+        status=Summary.Status.PENDING,
+        lock_key=None,
+    ).update(status=Summary.Status.STREAMING)
+    if claimed:
+        events = _stream_global_analysis(summary)
+    else:
+        events = iter([_sse(summary.status, event="done")])
+
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@require_GET
+@user_passes_test(is_moderator)
+def summary_status(request, pk: int):
+    """Partial interrogé par HTMX tant que l'analyse est en cours.
+
+    Avec `?relance=1` (flux SSE terminé ou en échec), une analyse globale
+    que le flux n'a jamais lancée est confiée à la tâche de fond.
+    """
+    summary = get_object_or_404(Summary, pk=pk)
+    if request.GET.get("relance") and summary.document_id is None:
+        _enqueue_unstreamed(summary)
+    return render(request, _summary_template(summary), {"summary": summary})
+
+
+def _enqueue_unstreamed(summary: Summary) -> None:
+    """Met en file l'analyse si aucune connexion SSE ne l'a prise en charge.
+
+    Le verrou (lock_key) empêche à la fois un second envoi en tâche et un
+    démarrage tardif du flux ; _run le lève une fois l'analyse terminée.
+    """
+    claimed = Summary.objects.filter(
+        pk=summary.pk,
+        status=Summary.Status.PENDING,
+        lock_key=None,
+    ).update(lock_key=f"global-{summary.pk}")
+    if claimed:
+        tasks.global_analyze_task.enqueue(summary.pk)
+        summary.refresh_from_db()
+
+
+@require_GET
+def metrics_text(request):
+    """Compteurs IA au format texte (Prometheus).
+
+    Accessible aux modérateurs connectés, et aux collecteurs qui présentent
+    IA_METRICS_TOKEN (« Authorization: Bearer … »). L'adresse du client
+    n'est pas un critère : derrière le proxy, tout arrive de 127.0.0.1.
+    """
+    token = settings.IA_METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    allowed = bool(token) and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    if not allowed and not is_moderator(request.user):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metrics.render_text(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,7 +1,22 @@
+import django_filters
+from django.db.models import IntegerField
+from django.db.models.functions import Cast
+from django.template.defaultfilters import filesizeformat
+from django.urls import path, reverse
+from wagtail import hooks
+from wagtail.admin.filters import DateRangePickerWidget, WagtailFilterSet
+from wagtail.admin.menu import AdminOnlyMenuItem
+from wagtail.admin.ui.tables import Column
+from wagtail.admin.views.reports import ReportView
+from wagtail.permission_policies import ModelPermissionPolicy
+from wagtail.snippets.bulk_actions.snippet_bulk_action import SnippetBulkAction
 from wagtail.snippets.models import register_snippet
+from wagtail.snippets.permissions import get_permission_name
 from wagtail.snippets.views.snippets import SnippetViewSet
 
-from .models import Summary
+from . import metrics
+from . import utils as ai_utils
+from .models import ApiCall, CacheStat, Digest, ExtractionFailure, InvoiceFields, Summary
 
 
 class SummaryViewSet(SnippetViewSet):
@@ -11,10 +26,181 @@ class SummaryViewSet(SnippetViewSet):
     menu_name = "ia_summaries"
     menu_order = 500
     add_to_admin_menu = True
-    list_display = ["__str__", "query", "created_at"]
-    list_filter = ["created_at"]
+    list_display = ["__str__", "query", "status", "model", "created_at"]
+    list_filter = ["status", "model", "created_at"]
     search_fields = ["content", "query", "document__title"]
     ordering = ["-created_at"]
 
 
 register_snippet(SummaryViewSet)
+
+
+class InvoiceFieldsViewSet(SnippetViewSet):
+    model = InvoiceFields
+    icon = "table"
+    menu_label = "Factures IA"
+    menu_name = "ia_invoice_fields"
+    menu_order = 505
+    add_to_admin_menu = True
+    list_display = ["document", "is_invoice", "issuer", "total", "currency", "invoice_date", "category", "status"]
+    list_filter = ["is_invoice", "category", "status", "invoice_date"]
+    search_fields = ["issuer", "document__title"]
+    ordering = ["-invoice_date"]
+
+
+register_snippet(InvoiceFieldsViewSet)
+
+
+class ExtractionFailureViewSet(SnippetViewSet):
+    model = ExtractionFailure
+    icon = "warning"
+    menu_label = "Fichiers illisibles"
+    menu_name = "ia_extraction_failures"
+    menu_order = 506
+    add_to_admin_menu = True
+    list_display = ["document", "reason", "detail", "attempts", "retry_after", "updated_at"]
+    list_filter = ["reason"]
+    search_fields = ["document__title", "detail"]
+    ordering = ["-updated_at"]
+
+
+register_snippet(ExtractionFailureViewSet)
+
+
+class DigestViewSet(SnippetViewSet):
+    model = Digest
+    icon = "list-ul"
+    menu_label = "Synthèses IA"
+    menu_name = "ia_digests"
+    menu_order = 507
+    add_to_admin_menu = True
+    list_display = ["collection", "period_label", "document_count", "updated_at"]
+    list_filter = ["collection"]
+    search_fields = ["content", "collection__name"]
+    ordering = ["collection", "-period"]
+
+
+register_snippet(DigestViewSet)
+
+
+@hooks.register("register_bulk_action")
+class RetryExtractionBulkAction(SnippetBulkAction):
+    """Lève le cache négatif des fichiers sélectionnés (ex. après dépôt d'un meilleur scan)."""
+
+    display_name = "Réessayer l'extraction"
+    action_type = "retry_extraction"
+    aria_label = "Réessayer l'extraction des fichiers sélectionnés"
+    template_name = "ia/admin/confirm_retry_extraction.html"
+    action_priority = 20
+    models = [ExtractionFailure]
+
+    def check_perm(self, obj):
+        return self.request.user.has_perm(get_permission_name("delete", ExtractionFailure))
+
+    @classmethod
+    def execute_action(cls, objects, **kwargs):
+        return ai_utils.clear_extraction_failures(objects), 0
+
+    def get_success_message(self, num_parent_objects, num_child_objects):
+        return f"{num_parent_objects} fichier(s) seront ré-extraits à la prochaine analyse."
+
+
+class ApiCallReportFilterSet(WagtailFilterSet):
+    started_at = django_filters.DateFromToRangeFilter(
+        label="Période",
+        widget=DateRangePickerWidget,
+    )
+    endpoint = django_filters.ChoiceFilter(
+        label="Endpoint",
+        choices=[("ocr", "OCR"), ("chat", "Chat"), ("chat_stream", "Chat (streaming)")],
+    )
+    model = django_filters.CharFilter(label="Modèle")
+
+    class Meta:
+        model = ApiCall
+        fields = ["endpoint", "model", "started_at"]
+
+
+class ApiUsageReportView(ReportView):
+    """Appels à l'API Mistral agrégés par jour, endpoint et modèle, et taux de succès des caches."""
+
+    page_title = "Statistiques IA"
+    header_icon = "table"
+    index_url_name = "ia_usage_report"
+    index_results_url_name = "ia_usage_report_results"
+    results_template_name = "ia/admin/usage_report_results.html"
+    permission_policy = ModelPermissionPolicy(ApiCall)
+    permission_required = "view"
+    filterset_class = ApiCallReportFilterSet
+    paginate_by = 60
+    columns = [
+        Column("day", label="Jour", accessor=lambda row: row["day"].strftime("%d/%m/%Y")),
+        Column("endpoint", label="Endpoint"),
+        Column("model", label="Modèle"),
+        Column("calls", label="Appels"),
+        Column("errors", label="Échecs"),
+        Column("avg_ms", label="Durée moy. (ms)"),
+        Column("max_ms", label="Durée max. (ms)"),
+        Column("request_bytes", label="Envoyé", accessor=lambda row: filesizeformat(row["request_bytes"])),
+        Column("response_bytes", label="Reçu", accessor=lambda row: filesizeformat(row["response_bytes"])),
+        Column("prompt_tokens", label="Jetons entrée"),
+        Column("completion_tokens", label="Jetons sortie"),
+    ]
+    list_export = [
+        "day",
+        "endpoint",
+        "model",
+        "calls",
+        "errors",
+        "avg_ms",
+        "max_ms",
+        "request_bytes",
+        "response_bytes",
+        "prompt_tokens",
+        "completion_tokens",
+    ]
+
+    def get_queryset(self):
+        return metrics.call_rollup().annotate(
+            avg_ms=Cast("avg_ms", IntegerField()),
+        )
+
+    def get_filename(self):
+        return "statistiques-ia"
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        context["cache_stats"] = [
+            {
+                "day": stat.day,
+                "cache": stat.cache,
+                "hits": stat.hits,
+                "misses": stat.misses,
+                "hit_rate": stat.hits / (stat.hits + stat.misses) if stat.hits + stat.misses else 0,
+            }
+            for stat in CacheStat.objects.all()[:60]
+        ]
+        return context
+
+
+@hooks.register("register_admin_urls")
+def register_usage_report_urls():
+    return [
+        path("ia/statistiques/", ApiUsageReportView.as_view(), name="ia_usage_report"),
+        path(
+            "ia/statistiques/results/",
+            ApiUsageReportView.as_view(results_only=True),
+            name="ia_usage_report_results",
+        ),
+    ]
+
+
+@hooks.register("register_admin_menu_item")
+def register_usage_report_menu_item():
+    return AdminOnlyMenuItem(
+        "Statistiques IA",
+        reverse("ia_usage_report"),
+        name="ia_usage_report",
+        icon_name="table",
+        order=510,
+    )
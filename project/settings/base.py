@@ -48,6 +48,8 @@ INSTALLED_APPS = [
     "modelcluster",
     "taggit",
     "django_filters",
+    "django_tasks",
+    "django_tasks.backends.database",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -180,11 +182,151 @@ WAGTAILADMIN_BASE_URL = env("WAGTAILADMIN_BASE_URL") # e.g. "https://www.example
 # This can be omitted to allow all files, but note that this may present a security risk
 # if untrusted users are allowed to upload files -
 # see https://docs.wagtail.org/en/stable/advanced_topics/deploying.html#user-uploaded-files
-WAGTAILDOCS_EXTENSIONS = ['csv', 'docx', 'key', 'odt', 'pdf', 'pptx', 'rtf', 'txt', 'xlsx', 'zip']
+WAGTAILDOCS_EXTENSIONS = [
+    'csv', 'docx', 'heic', 'jpeg', 'jpg', 'key', 'odt', 'pdf', 'png', 'pptx', 'rtf',
+    'tif', 'tiff', 'txt', 'webp', 'xlsx', 'zip',
+]
 
 # Custom document model
 WAGTAILDOCS_DOCUMENT_MODEL = 'core.CustomDocument'
 WAGTAILDOCS_DOCUMENT_FORM_BASE = 'core.forms.CustomDocumentForm'
 
+# Background tasks
+# Wagtail's own tasks keep running immediately; AI analyses are queued in the
+# database and processed by `python manage.py db_worker --backend ia`.
+TASKS = {
+    "default": {
+        "BACKEND": "django_tasks.backends.immediate.ImmediateBackend",
+    },
+    "ia": {
+        "BACKEND": "django_tasks.backends.database.DatabaseBackend",
+    },
+}
+
 # Mistral AI
 MISTRAL_API_KEY = env("MISTRAL_API_KEY")
+# Endpoints can point at the local stand-in (`manage.py ia_standin`)
+# for offline benchmarks and load tests.
+MISTRAL_OCR_URL = env("MISTRAL_OCR_URL", default="https://api.mistral.ai/v1/ocr")
+MISTRAL_CHAT_URL = env("MISTRAL_CHAT_URL", default="https://api.mistral.ai/v1/chat/completions")
+
+# Extract document text in the background as soon as a document is uploaded
+# or its file replaced, and optionally generate its summary too.
+IA_EXTRACT_ON_UPLOAD = True
+IA_SUMMARIZE_ON_UPLOAD = False
+
+# Concurrent summarize requests for the same file share one in-flight run;
+# a run still pending after this many seconds is considered dead.
+IA_SUMMARY_LOCK_TIMEOUT = 15 * 60
+
+# Structured invoice fields (issuer, total, currency, date, category) are
+# extracted by one chat call per file after its text, from at most
+# IA_FIELDS_MAX_CHARS characters. Global analysis sums them up in SQL.
+IA_EXTRACT_FIELDS_ON_UPLOAD = True
+IA_FIELDS_MAX_CHARS = 6000
+
+# Outbound HTTP to Mistral: one pooled keep-alive session per process.
+# 429 and 5xx responses are retried with jittered exponential backoff,
+# honouring Retry-After up to IA_HTTP_RETRY_AFTER_MAX seconds. Each retry
+# takes its own IA_RATE_LIMITS token.
+# Timeouts are (connect, read) in seconds, per endpoint.
+IA_HTTP_POOL_SIZE = 10
+IA_HTTP_RETRIES = 4
+IA_HTTP_BACKOFF = 1
+IA_HTTP_RETRY_AFTER_MAX = 60
+IA_HTTP_TIMEOUTS = {
+    "ocr": (5, 60),
+    "chat": (5, 120),
+}
+
+# Chat model per kind of call: document summaries and digests ("summary"),
+# global analyses ("global") and invoice field extraction ("extraction").
+# When the primary model answers 429 / 5xx, fails or takes longer than
+# `timeout` seconds, the call goes straight to `fallback` (client retries
+# only apply to the fallback); after IA_CIRCUIT_FAILURES such failures the
+# primary is skipped for IA_CIRCUIT_RESET_AFTER seconds. The model that
+# answered is recorded on each Summary and ApiCall.
+IA_CHAT_MODELS = {
+    "summary": {"model": "mistral-small-latest", "fallback": "ministral-8b-latest", "timeout": 30},
+    "global": {"model": "mistral-medium-latest", "fallback": "mistral-small-latest", "timeout": 90},
+    "extraction": {"model": "mistral-small-latest", "fallback": "ministral-8b-latest", "timeout": 30},
+}
+
+# Files are streamed to the OCR endpoint (base64 encoded on the fly); larger
+# files are rejected with an explicit error. Mistral's own limit is 50 MB.
+IA_OCR_MAX_FILE_SIZE = 50 * 1024 * 1024
+
+# Images sent to OCR (image files, and images on the PDF pages to OCR) are
+# converted to grayscale, downscaled so their longest side is at most
+# IA_OCR_MAX_DIMENSION pixels and recompressed as JPEG with at most
+# IA_OCR_JPEG_QUALITY. The original is sent when that is not smaller.
+IA_OCR_PREPROCESS = True
+IA_OCR_MAX_DIMENSION = 2400
+IA_OCR_JPEG_QUALITY = 75
+
+# Shared (cross-process) token buckets for outbound Mistral calls, per
+# endpoint: `rate` calls per second on average, bursts of up to `burst`.
+# A call waits at most IA_RATE_LIMIT_MAX_WAIT seconds for a token.
+IA_RATE_LIMITS = {
+    "ocr": {"rate": 1.0, "burst": 5},
+    "chat": {"rate": 2.0, "burst": 10},
+}
+IA_RATE_LIMIT_MAX_WAIT = 30
+
+# Circuit breaker: after IA_CIRCUIT_FAILURES consecutive failures (network
+# errors, 429 or 5xx once retries are exhausted) an endpoint is considered
+# down for IA_CIRCUIT_RESET_AFTER seconds; views then fail fast.
+IA_CIRCUIT_FAILURES = 5
+IA_CIRCUIT_RESET_AFTER = 60
+
+# OCR fan-out used by the global analysis: number of parallel OCR calls and
+# overall deadline in seconds (each call is bounded by IA_HTTP_TIMEOUTS).
+IA_OCR_MAX_WORKERS = 4
+IA_GLOBAL_OCR_TIMEOUT = 240
+
+# Negative cache for files that could not be read (missing, too large, OCR
+# errors, unreadable scans): global analysis skips them until the retry
+# delay has passed. The delay doubles after each failure, up to the maximum,
+# except for OCR errors, always retried after IA_FAILURE_RETRY_AFTER.
+# Timeouts, 429/5xx responses and network errors are never cached.
+IA_FAILURE_RETRY_AFTER = 60 * 60
+IA_FAILURE_RETRY_MAX = 7 * 24 * 60 * 60
+
+# Local retrieval index: document text is split into chunks of about
+# IA_CHUNK_SIZE characters and global analysis only sends the IA_RETRIEVAL_TOP_K
+# best BM25 matches for the question. Set IA_RETRIEVAL_TOP_K to 0 to always
+# send the full text.
+IA_CHUNK_SIZE = 1200
+IA_RETRIEVAL_TOP_K = 20
+
+# Map-reduce for oversized global analyses: above IA_CONTEXT_TOKEN_BUDGET
+# (estimated) tokens, the context is packed into batches of at most that size
+# and IA_BATCH_MAX_DOCUMENTS documents, analysed IA_MAP_MAX_WORKERS at a time,
+# then merged in a final call.
+IA_CONTEXT_TOKEN_BUDGET = 24_000
+IA_BATCH_MAX_DOCUMENTS = 40
+IA_MAP_MAX_WORKERS = 4
+
+# Precomputed digests per Wagtail collection and per month of document_date.
+# Global analyses over at least IA_DIGEST_MIN_DOCUMENTS documents (whole
+# collections, or whole months) are first answered from the digests; raw
+# document text is only read when the model asks for detail. Each document
+# contributes its summary, or at most IA_DIGEST_DOCUMENT_CHARS characters of
+# text. Digests are refreshed IA_DIGEST_REFRESH_DELAY seconds after a document
+# change, and otherwise on demand; only the changed months are recomputed.
+IA_DIGESTS = True
+IA_DIGEST_MIN_DOCUMENTS = 30
+IA_DIGEST_DOCUMENT_CHARS = 1500
+IA_DIGEST_REFRESH_DELAY = 5 * 60
+
+# Stream global analysis answers to the browser (server-sent events) instead
+# of queuing them as a background task. The whole analysis (OCR fan-out,
+# digests, map-reduce) then runs inside the web request: keep it off unless
+# the web workers can afford long-lived requests.
+IA_STREAM_GLOBAL_ANALYSIS = False
+
+# Bearer token that lets a scraper (Prometheus or similar) read
+# /ia/metriques/ without logging in; empty = moderators only. The client
+# address is not trusted: behind the reverse proxy, every request comes
+# from localhost.
+IA_METRICS_TOKEN = env("IA_METRICS_TOKEN", default="")
@@ -15,5 +15,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock up front: concurrent rate-limiter transactions
+        # (parallel OCR threads) then wait for it instead of failing with
+        # "database is locked".
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
     }
 }